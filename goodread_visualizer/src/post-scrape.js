@@ -42,7 +42,7 @@ class PostScrapeDiv extends React.Component {
         });
         
         if (errorStatus === undefined) {
-            let info = `Scraping done successfully!`;
+            let info = `Scraping started in the background, job ${JSON.parse(responseData).id}.`;
             renderOKReport(info);
         } else {
             renderErrorReport(errorStatus, responseData);
@@ -0,0 +1,347 @@
+"""
+Asyncio variant of server.py, with the same routes and responses.
+Handlers await mongo through motor instead of blocking a thread on pymongo,
+so one process serves many slow clients at once. Query compilation,
+pagination and upload batching are shared with server.py.
+Requires `pip install quart motor`, run it with
+`python async_server.py` in development, `hypercorn async_server:app` in production.
+"""
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+from quart import Quart, Response, request, jsonify, abort
+import interpreter
+import cache
+import update as updater
+import bfs_scrape as scraper
+from bulk_writer import UPSERT_BATCH_SIZE, upsert_requests, record_batch, describe_upsert
+from index_manager import ensure_indexes
+from main_backend import PROGRESS_DIR
+from mongo_manipulator import MAX_POOL_SIZE, MIN_POOL_SIZE
+from scrape_jobs import JobManager
+from checkpoint_log import ProgressLock, ProgressLocked
+
+app = Quart(__name__)
+app.config["DEBUG"] = os.getenv("FLASK_DEBUG", "0") == "1"  # never in production
+NDJSON = "application/x-ndjson"
+scrape_jobs = JobManager(scraper.scrape_start,  # crawls run in the background
+                         lock_progress=lambda: ProgressLock(PROGRESS_DIR))
+_client = None  # motor client, bound to the event loop of the server
+
+
+@app.before_serving
+async def startup():
+    """Connect to mongo on the server's event loop, and create the missing indexes."""
+    global _client
+    _client = AsyncIOMotorClient(os.getenv("MONGO_KEY"), maxPoolSize=MAX_POOL_SIZE,
+                                 minPoolSize=MIN_POOL_SIZE)
+    await asyncio.get_running_loop().run_in_executor(None, ensure_indexes)
+
+
+@app.after_serving
+async def shutdown():
+    scrape_jobs.shutdown()
+    _client.close()
+
+
+@app.after_request
+async def allow_cross_origin(response):
+    """Same CORS policy as server.py: any origin, and the cursor header is readable."""
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type"
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE"
+    response.headers["Access-Control-Expose-Headers"] = "X-Next-Cursor"
+    return response
+
+
+def connect_to_mongo():
+    """
+    :return: book_db, author_db motor book collection and author collection
+    """
+    goodread_db = _client["GoodRead"]
+    return goodread_db["books"], goodread_db["authors"]
+
+
+async def json_in_body():
+    """
+    Check a json format file is properly included in request body,
+    raise status code 415 if not.
+    :return: the json of the body
+    """
+    if request.headers.get("Content-Type") != "application/json":
+        abort(415, "Unsupported Media Type"
+                   " - content should be JSON file")
+    body = await request.get_json(silent=True)
+    if body == [] or body is None or body == {}:
+        abort(400, "Please include a"
+                   " non-empty JSON file in the request body!")
+    return body
+
+
+async def iterate(documents):
+    """Async iterator over the documents of a list."""
+    for document in documents:
+        yield document
+
+
+def wants_ndjson():
+    """Whether the client prefers one json document per line to a json list."""
+    return request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON
+
+
+async def respond_documents(documents, empty_message):
+    """
+    Async version of server.respond_documents.
+    :param documents: async iterable of documents, e.g. a motor cursor
+    :param empty_message: message of the 400 error
+    :return: the response
+    """
+    documents = documents.__aiter__()
+    try:
+        first = await documents.__anext__()
+    except StopAsyncIteration:
+        abort(400, empty_message)
+    if not wants_ndjson():
+        return jsonify([first] + [document async for document in documents])
+
+    async def generate():
+        yield app.json.dumps(first) + "\n"
+        async for document in documents:
+            yield app.json.dumps(document) + "\n"
+    return Response(generate(), mimetype=NDJSON)
+
+
+async def bulk_upsert(collection, documents, batch_size=UPSERT_BATCH_SIZE):
+    """Async version of bulk_writer.bulk_upsert."""
+    summary = {"inserted": 0, "updated": 0, "errors": []}
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        try:
+            result = await collection.bulk_write(upsert_requests(batch), ordered=False)
+        except BulkWriteError as err:
+            record_batch(summary, start // batch_size + 1, batch, error=err)
+        else:
+            record_batch(summary, start // batch_size + 1, batch, result=result)
+        finally:
+            cache.invalidate(collection.name, [document["_id"] for document in batch])
+    return summary
+
+
+async def find_by_id(collection, query_id):
+    """Async version of server.find_by_id."""
+    result = cache.lookups.get(collection.name, query_id)
+    if result is None:
+        version = cache.lookups.version(collection.name)  # before reading, see LookupCache
+        result = await collection.find({"_id": query_id}).to_list(length=None)
+        if result:  # ids are looked up after being found, misses are not kept
+            cache.lookups.put(collection.name, query_id, result, version)
+    return result
+
+
+async def upload_dict_list(dict_list, collection):
+    """Async version of server.upload_dict_list."""
+    if isinstance(dict_list, dict):
+        dict_list = [dict_list]
+    if any(not isinstance(dic, dict) or "_id" not in dic for dic in dict_list):
+        abort(400, "Every uploaded object should have an _id.")
+    summary = await bulk_upsert(collection, dict_list)
+    if summary["errors"]:
+        abort(400, describe_upsert(summary))
+    return describe_upsert(summary)
+
+
+async def handle_instance(collection, db_name, db_attrs):
+    """
+    GET/POST/PUT/DELETE of a single instance, see server.api_book and server.api_author.
+    :param collection: the book or author collection
+    :param db_name: "book" or "author"
+    :param db_attrs: the attributes an update may set
+    """
+    if request.method == "GET":
+        query_id = request.args.get("_id")
+        if query_id is None:
+            abort(400, "ID not provided.")
+        return await respond_documents(iterate(await find_by_id(collection, query_id)),
+                                       f"No matching results in {db_name} database.")
+
+    elif request.method == "POST":
+        dict_list = await json_in_body()
+        if len(dict_list) > 1:
+            abort(400, "Please send POST request"
+                       f" to /api/{db_name}s to upload many {db_name}s.")
+        return await upload_dict_list(dict_list, collection)
+
+    elif request.method == "PUT":
+        body = await json_in_body()
+        try:
+            update_key = {"_id": body["_id"]}
+        except:
+            abort(400, "_id not provided.")
+        if await collection.find_one(update_key) is None:
+            abort(400, "Input instance ID not found in DB.")
+        update_val = {k: v for k, v in body.items() if k != "_id"}
+        for key in update_val.keys():  # check to-be-updated attribute exists
+            if key not in db_attrs:
+                abort(400, "Bad attempt to update non-existing attribute.")
+        if update_val == {}:
+            abort(400, "Empty update value.")
+        await collection.update_one(update_key, {"$set": update_val})
+        cache.invalidate(collection.name, [update_key["_id"]])
+        return """Status code [200] : Update succeeded."""
+
+    elif request.method == "DELETE":
+        query_id = request.args.get("_id")
+        if query_id is None:
+            abort(400, "ID not provided.")
+        deleted = (await collection.delete_one({"_id": query_id})).deleted_count
+        cache.invalidate(collection.name, [query_id])
+        if deleted == 0:
+            abort(400, f"Target ID not in {db_name}_DB.")
+        return """Status code [200] : Delete succeeded."""
+
+    else:
+        abort(404, "Related resource not found")
+
+
+@app.route("/api/book", methods=["GET", "POST", "PUT", "DELETE"])
+async def api_book():
+    """See server.api_book."""
+    book_db, _ = connect_to_mongo()
+    return await handle_instance(book_db, "book", updater.BOOK_ATTRS)
+
+
+@app.route("/api/author", methods=["GET", "POST", "PUT", "DELETE"])
+async def api_author():
+    """See server.api_author."""
+    _, author_db = connect_to_mongo()
+    return await handle_instance(author_db, "author", updater.AUTHOR_ATTRS)
+
+
+async def upload_many(collection, db_name):
+    """POST of many instances, see server.api_books and server.api_authors."""
+    dict_list = await json_in_body()
+    if len(dict_list) == 1:
+        abort(400, "Please send POST request"
+                   f" to /api/{db_name} to upload a single {db_name}.")
+    return await upload_dict_list(dict_list, collection)
+
+
+@app.route('/api/books', methods=["POST"])
+async def api_books():
+    """See server.api_books."""
+    book_db, _ = connect_to_mongo()
+    return await upload_many(book_db, "book")
+
+
+@app.route('/api/authors', methods=["POST"])
+async def api_authors():
+    """See server.api_authors."""
+    _, author_db = connect_to_mongo()
+    return await upload_many(author_db, "author")
+
+
+@app.route('/api/search', methods=["GET"])
+async def api_search():
+    """See server.api_search, the query plans are not explained here."""
+    query_str = request.args.get("q")
+    if query_str is None:
+        abort(400, 'Query string "q" is not'
+                   ' included in request parameters')
+    limit = request.args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            abort(400, "limit should be an integer.")
+    try:
+        plan = interpreter.compile_query(query_str)
+    except:
+        abort(400, "Input query string is not interpretable.")
+    try:
+        page_query = interpreter.prepare_page(
+            plan, sort=request.args.get("sort"), fields=request.args.get("fields"),
+            limit=limit, cursor=request.args.get("cursor"))
+    except AssertionError as err:
+        abort(400, str(err))
+
+    book_db, author_db = connect_to_mongo()
+    db = book_db if plan.db_type == "book" else author_db
+    key = cache.search_key(page_query)
+    cached = cache.searches.get(db.name, key)
+    if cached is not None:
+        return await respond_search(*cached)
+
+    results = db.find(page_query.filter, page_query.projection)
+    if page_query.sort is not None:
+        results = results.sort(page_query.sort)
+    if limit is None and wants_ndjson():  # unbounded, stream it without keeping it
+        return await respond_search((interpreter.strip_hidden_fields(page_query, document)
+                                     async for document in results), None)
+    version = cache.searches.version(db.name)
+    if limit is not None:
+        results = results.limit(limit + 1)  # one more tells if there is a next page
+    documents, next_cursor = interpreter.finish_page(page_query,
+                                                     await results.to_list(length=None))
+    if len(documents) <= cache.SEARCH_CACHE_MAX_RESULTS:
+        cache.searches.put(db.name, key, (documents, next_cursor), version)
+    return await respond_search(documents, next_cursor)
+
+
+async def respond_search(results, next_cursor):
+    """
+    :param results: list or async iterable of the documents of the page
+    :param next_cursor: continuation token of the page, None on the last page
+    :return: the response of api_search
+    """
+    if isinstance(results, list):
+        results = iterate(results)
+    response = await respond_documents(results, 'No matching results. Try new query!')
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+@app.route('/api/cache', methods=["GET"])
+async def api_cache():
+    """See server.api_cache."""
+    return jsonify(cache.stats())
+
+
+@app.route('/api/scrape', methods=["POST"])
+async def api_scrape():
+    """See server.api_scrape."""
+    params = await json_in_body()
+    try:
+        max_book, max_author = params["max_book"], params["max_author"]
+        start_url = params["start_url"]
+    except:
+        abort(400, "max_book, max_author, start_url"
+                   " should all be provided in the request body (JSON).")
+    try:
+        job = scrape_jobs.submit({"is_new": False, "max_author": max_author,
+                                  "max_book": max_book, "start_url": start_url,
+                                  "progress_dir": PROGRESS_DIR})
+    except ProgressLocked:
+        abort(409, "Another crawl is running (other server process or main.py),"
+                   " try again once it is done.")
+    response = jsonify({"id": job.id, "status": job.status})
+    response.status_code = 202
+    response.headers["Location"] = f"/api/scrape/{job.id}"
+    return response
+
+
+@app.route('/api/scrape/<job_id>', methods=["GET", "DELETE"])
+async def api_scrape_job(job_id):
+    """See server.api_scrape_job."""
+    if request.method == "GET":
+        job = scrape_jobs.get(job_id)
+    else:
+        job = scrape_jobs.cancel(job_id)
+    if job is None:
+        abort(404, "Scrape job not found.")
+    return jsonify(job.to_dict())
+
+
+if __name__ == "__main__":
+    app.run()
@@ -0,0 +1,229 @@
+"""
+Test the responses of async_server with Quart's test client, mongo being faked.
+Skipped if quart or motor is not installed.
+"""
+import html
+import json
+import unittest
+from unittest import mock
+import cache
+from scrape_jobs import JobManager, CANCELLED
+
+try:
+    import async_server
+except ImportError:  # quart and motor are optional
+    async_server = None
+
+NDJSON = "application/x-ndjson"
+
+
+class FakeResult:
+    """Minimal stand-in of the results of pymongo writes."""
+
+    def __init__(self, upserted_count=0, matched_count=0, deleted_count=0):
+        self.upserted_count = upserted_count
+        self.matched_count = matched_count
+        self.deleted_count = deleted_count
+
+
+class FakeCursor:
+    """Minimal stand-in of a motor cursor over a list of documents."""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):  # stable sorts, last key first
+            self.documents.sort(key=lambda document, f=field: document.get(f),
+                                reverse=direction == -1)
+        return self
+
+    def limit(self, limit):
+        self.documents = self.documents[:limit]
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.documents)
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+    def __aiter__(self):
+        return self._iterate()
+
+
+class FakeCollection:
+    """
+    Minimal stand-in of a motor collection.
+    find only applies the equalities of the filter, operators match everything.
+    """
+
+    def __init__(self, name, documents=()):
+        self.name = name
+        self.documents = {document["_id"]: dict(document) for document in documents}
+
+    def find(self, query=None, projection=None):
+        query = query or {}
+        return FakeCursor([dict(document) for document in self.documents.values()
+                           if all(document.get(key) == value for key, value in query.items()
+                                  if not key.startswith("$") and not isinstance(value, dict))])
+
+    async def find_one(self, query):
+        documents = self.find(query).documents
+        return documents[0] if documents else None
+
+    async def update_one(self, query, update):
+        self.documents[query["_id"]].update(update["$set"])
+        return FakeResult(matched_count=1)
+
+    async def delete_one(self, query):
+        return FakeResult(deleted_count=int(self.documents.pop(query["_id"], None) is not None))
+
+    async def bulk_write(self, requests, ordered=True):
+        inserted, updated = 0, 0
+        for request in requests:
+            document = request._doc["$set"]
+            if document["_id"] in self.documents:
+                updated += 1
+            else:
+                inserted += 1
+            self.documents.setdefault(document["_id"], {}).update(document)
+        return FakeResult(upserted_count=inserted, matched_count=updated)
+
+
+def block_until_cancelled(cancel_event, on_start, **params):
+    """Scrape function of the tests, crawling nothing until cancelled."""
+    cancel_event.wait(10)
+
+
+@unittest.skipIf(async_server is None, "quart and motor are not installed")
+class TestAsyncServer(unittest.IsolatedAsyncioTestCase):
+    """
+    Unit test class wrapper for async server tests.
+    """
+
+    def setUp(self):
+        books = [{"_id": str(number), "book_title": f"Book {number}", "author_name": "A"}
+                 for number in range(3)]
+        self.book_db = FakeCollection("books", books)
+        self.author_db = FakeCollection("authors", [{"_id": "1", "author_name": "A"}])
+        self.scrape_jobs = JobManager(block_until_cancelled)
+        for patch in (mock.patch.object(async_server, "connect_to_mongo",
+                                        lambda: (self.book_db, self.author_db)),
+                      mock.patch.object(async_server, "scrape_jobs", self.scrape_jobs)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        for collection_name in ("books", "authors"):  # nothing cached by other tests
+            cache.invalidate(collection_name)
+        self.client = async_server.app.test_client()
+
+    def tearDown(self):
+        self.scrape_jobs.shutdown()
+
+    async def assert_error(self, response, status_code, message):
+        """Check the status code, and the message in the html error page."""
+        self.assertEqual(response.status_code, status_code)
+        self.assertIn(message, html.unescape(await response.get_data(as_text=True)))
+
+    async def test_get_by_id(self):
+        """
+        Test a lookup answers a json list, or one json document per line for ndjson.
+        """
+        response1 = await self.client.get("/api/book", query_string={"_id": "1"})
+        self.assertEqual(response1.status_code, 200)
+        self.assertEqual(await response1.get_json(), [self.book_db.documents["1"]])
+
+        response2 = await self.client.get("/api/book", query_string={"_id": "1"},
+                                          headers={"Accept": NDJSON})
+        self.assertEqual(response2.mimetype, NDJSON)
+        lines = (await response2.get_data(as_text=True)).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [self.book_db.documents["1"]])
+
+        await self.assert_error(await self.client.get("/api/book"), 400, "ID not provided.")
+        await self.assert_error(await self.client.get("/api/author", query_string={"_id": "9"}),
+                                400, "No matching results in author database.")
+
+    async def test_get_after_update(self):
+        """
+        Test a GET right after a PUT returns the updated document, not a cached one.
+        """
+        await self.client.get("/api/book", query_string={"_id": "1"})  # now cached
+        response1 = await self.client.put("/api/book",
+                                          json={"_id": "1", "book_title": "New title"})
+        self.assertEqual(response1.status_code, 200)
+        response2 = await self.client.get("/api/book", query_string={"_id": "1"})
+        self.assertEqual((await response2.get_json())[0]["book_title"], "New title")
+
+    async def test_bad_bodies(self):
+        """
+        Test missing or non json bodies are refused with 415 and 400.
+        """
+        await self.assert_error(await self.client.put("/api/book", form={"a": "b"}),
+                                415, "Unsupported Media Type - content should be JSON file")
+        await self.assert_error(await self.client.post("/api/author", json=[]),
+                                400, "Please include a non-empty JSON file in the request body!")
+        await self.assert_error(await self.client.post("/api/books", json=[{"_id": "4"}]),
+                                400, "Please send POST request to /api/book")
+
+    async def test_upload_many(self):
+        """
+        Test many books are upserted, and the counts reported.
+        """
+        response = await self.client.post("/api/books", json=[{"_id": "1"}, {"_id": "4"}])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("1 inserted, 1 updated.", await response.get_data(as_text=True))
+        self.assertIn("4", self.book_db.documents)
+
+    async def test_search_pages(self):
+        """
+        Test a limited search sets X-Next-Cursor while there are more results,
+        and streams ndjson when asked.
+        """
+        query = {"q": 'book.author_name : "A"', "limit": "2"}
+        response1 = await self.client.get("/api/search", query_string=query)
+        self.assertEqual([document["_id"] for document in await response1.get_json()],
+                         ["0", "1"])
+        self.assertIn("X-Next-Cursor", response1.headers)
+
+        response2 = await self.client.get("/api/search", query_string={"q": query["q"]},
+                                          headers={"Accept": NDJSON})
+        self.assertEqual(response2.mimetype, NDJSON)
+        self.assertEqual(len((await response2.get_data(as_text=True)).splitlines()), 3)
+        self.assertNotIn("X-Next-Cursor", response2.headers)
+
+        await self.assert_error(await self.client.get("/api/search"), 400,
+                                'Query string "q" is not included in request parameters')
+        await self.assert_error(await self.client.get("/api/search",
+                                                      query_string={"q": query["q"],
+                                                                    "limit": "two"}),
+                                400, "limit should be an integer.")
+
+    async def test_scrape_jobs(self):
+        """
+        Test a scrape is accepted with 202 and a Location to follow and cancel the job.
+        """
+        body = {"max_book": 1, "max_author": 1,
+                "start_url": "https://www.goodreads.com/book/show/3735293-clean-code"}
+        response1 = await self.client.post("/api/scrape", json=body)
+        self.assertEqual(response1.status_code, 202)
+        job = await response1.get_json()
+        self.assertEqual(response1.headers["Location"], f"/api/scrape/{job['id']}")
+
+        response2 = await self.client.get(response1.headers["Location"])
+        self.assertEqual(response2.status_code, 200)
+        self.assertEqual((await response2.get_json())["params"]["max_book"], 1)
+
+        response3 = await self.client.delete(response1.headers["Location"])
+        self.assertEqual(response3.status_code, 200)
+        self.scrape_jobs.get(job["id"]).future.result(10)
+        self.assertEqual(self.scrape_jobs.get(job["id"]).status, CANCELLED)
+
+        await self.assert_error(await self.client.get("/api/scrape/unknown"),
+                                404, "Scrape job not found.")
+        await self.assert_error(await self.client.post("/api/scrape", json={"max_book": 1}),
+                                400, "max_book, max_author, start_url should all be provided")
+
+
+if __name__ == "__main__":
+    unittest.main()
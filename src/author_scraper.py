@@ -1,7 +1,8 @@
 """Author Scraper"""
 import re
 from bs4 import BeautifulSoup
-import requests
+from page_fetcher import PageFetcher, get_default_fetcher
+import xpath_parser
 
 BASE_URL = "https://www.goodreads.com"
 
@@ -11,11 +12,31 @@ class AuthorScraper():
     Interface wrapper class for scraping author information, one at a time.
     """
 
-    def parse_author_info(self, author_url, soup_html):
+    def __init__(self, fetcher=None, session=None, page_cache=None, parser="soup"):
+        """
+        :param fetcher: PageFetcher used for downloading pages,
+         defaults to the one shared by all scrapers
+        :param session: requests.Session to download with, if no fetcher is given
+        :param page_cache: PageCache to serve pages from, if no fetcher is given
+        :param parser: extraction engine, "soup" (BeautifulSoup + CSS selectors)
+         or "xpath" (precompiled lxml XPaths, faster, same results)
+        """
+        assert parser in ("soup", "xpath"), "parser should be soup or xpath"
+        self.parser = parser
+        if fetcher is None:
+            if session is None and page_cache is None:
+                fetcher = get_default_fetcher()
+            else:
+                fetcher = PageFetcher(session=session, page_cache=page_cache)
+        self.fetcher = fetcher
+
+    def parse_author_info(self, author_url, soup_html, sub_pages=None):
         """
         Extract the author information (name, url) from a given book page html.
         :param soup_html: the result of injecting src_html into bs4
         :param author_url: the url of author to extract
+        :param sub_pages: already downloaded html of the "book_list" and "similar"
+         pages of the author as a dict, or None to download them here
         :return: a dictionary of author attributes as required in the rubric
         """
         author_attrs = ["author_name", "author_id", "author_url", "rating_count", "review_count",
@@ -39,8 +60,9 @@ class AuthorScraper():
             author_dict["review_count"] = int(review_count.replace(",", ""))
             # author_dict["review_count"] = soup_html.select(review_count_selector)[0].text.strip()
 
-            author_dict["author_books"] = self.extract_author_book_urls(author_url)
-            author_dict["related_authors"] = self.extract_similar_author_urls(author_url)
+            author_dict["author_books"] = self.extract_author_book_urls(author_url, sub_pages)
+            author_dict["related_authors"] = self.extract_similar_author_urls(author_url,
+                                                                              sub_pages)
             image_url_selector = f"img[alt=\"{author_dict['author_name']}\"]"
             author_dict["image_url"] = soup_html.select(image_url_selector)[0]["src"]
 
@@ -63,58 +85,112 @@ class AuthorScraper():
                                    author_url)[0]
         return BASE_URL + "/author/list/" + author_suffix
 
-    def extract_from_external_url(self, author_url, ex_url, selector, prefix=BASE_URL):
+    def fetch_html(self, url):
+        """
+        Download the raw html of a page.
+        Notice this function DO NOT HANDLE error!
+        :param url: url of the page to download
+        :return: the html source as a string
+        """
+        return self.fetcher.fetch(url)
+
+    def construct_sub_page_urls(self, author_url):
+        """Urls of the sub-pages parse_author_info needs, keyed as in sub_pages"""
+        return {"book_list": self.construct_author_book_list_url(author_url),
+                "similar": self.construct_similar_author_url(author_url)}
+
+    def extract_from_external_url(self, author_url, ex_url, href_prefix, prefix=BASE_URL,
+                                  ex_html=None):
         """
         Extract the href info from external url (similar_author or book_list).
         Notice this function DO NOT HANDLE error!
         Error can occur!
         :param author_url: the url of the author
         :param ex_url: either similar_author or book_list url
-        :param selector: the selector for the a.href element
+        :param href_prefix: the href of the links to collect starts with this
         :param prefix: the prefix for constructing url
+        :param ex_html: html of ex_url if it is already downloaded
         :return: a list of similar_author or authored_book urls
         """
-        ex_html = requests.get(ex_url).text
+        if ex_html is None:
+            ex_html = self.fetch_html(ex_url)
+        if self.parser == "xpath":
+            return xpath_parser.parse_external_urls(author_url, ex_html, href_prefix, prefix)
         soup_ex = BeautifulSoup(ex_html, "lxml")
         scraped_urls = set()
-        for a_elem in soup_ex.select(selector):
+        for a_elem in soup_ex.select(f'a[href^="{href_prefix}"]'):
             href = a_elem["href"]
             if href == author_url:
                 continue
             scraped_urls.add(prefix + href)
         return list(scraped_urls)
 
-    def extract_similar_author_urls(self, author_url):
+    def extract_similar_author_urls(self, author_url, sub_pages=None):
         """Given the url of an author's similar authors
         (e.g. https://www.goodreads.com/author/similar/45372.Robert_C_Martin),
         extract all the authors listed in the page.
+        @param sub_pages: prefetched sub-pages, see parse_author_info
         @return list of similar authors
         """
         try:
             similar_author_page_url = self.construct_similar_author_url(author_url)
-            selector = 'a[href^="https://www.goodreads.com/author/show"]'
+            href_prefix = "https://www.goodreads.com/author/show"
+            ex_html = None
+            if sub_pages is not None:
+                ex_html = sub_pages["similar"]
+                assert ex_html is not None, "similar author page was not downloaded"
             return self.extract_from_external_url(author_url, similar_author_page_url,
-                                                  selector, "")  # error could occur!
+                                                  href_prefix, "", ex_html)  # error could occur!
         except:
             print("Extraction of similar author urls failed ...")
             return None
 
-    def extract_author_book_urls(self, author_url):
+    def extract_author_book_urls(self, author_url, sub_pages=None):
         """Given the url of author's list of book
         (e.g. https://www.goodreads.com/author/list/45372.Robert_C_Martin),
         extract all the urls of books in the pagQe.
         :param: author_url as described above.
+        :param sub_pages: prefetched sub-pages, see parse_author_info
         :return: list of book urls listed in the given page
         """
         try:
             author_book_page_url = self.construct_author_book_list_url(author_url)
-            selector = 'a[href^="/book/show"]'
+            href_prefix = "/book/show"
+            ex_html = None
+            if sub_pages is not None:
+                ex_html = sub_pages["book_list"]
+                assert ex_html is not None, "author book list page was not downloaded"
             return self.extract_from_external_url(author_url, author_book_page_url,
-                                                  selector)  # error could occur!
+                                                  href_prefix, BASE_URL,
+                                                  ex_html)  # error could occur!
         except:
             print("Extraction of author book list failed ...")
             return None
 
+    def is_legal_author_url(self, author_url):
+        """Check the url points to a goodread author page."""
+        return len(re.findall(r'^(https://www.goodreads.com/author/show/.*)$', author_url)) != 0
+
+    def scrape_author_from_html(self, author_url, html_src, sub_pages=None):
+        """
+        Parse an already downloaded author page.
+        :param author_url: the url html_src was downloaded from
+        :param html_src: the raw html of the author page, None if download failed
+        :param sub_pages: prefetched sub-pages, see parse_author_info
+        :return: a dictionary of required author attributes
+        """
+        try:
+            if self.parser == "xpath":
+                return xpath_parser.parse_author_info(self, author_url, html_src, sub_pages)
+            soup_html = None
+            if html_src is not None:
+                soup_html = BeautifulSoup(html_src, "lxml")
+            author_dict = self.parse_author_info(author_url, soup_html, sub_pages)
+            return author_dict
+        except:
+            print("Scraping failed due to parsing error.")
+            return None
+
     def scrape_author(self, author_url):
         """
         The enter interface that tunes the collaboration of all other methods.
@@ -122,24 +198,15 @@ class AuthorScraper():
         (e.g. "https://www.goodreads.com/author/show/45372.Robert_C_Martin")
         :return: a dictionary of required author attributes
         """
-        soup_html = None
-        try:
-            assert len(re.findall(r'^(https://www.goodreads.com/author/show/.*)$', author_url)) != 0
-        except:
+        if not self.is_legal_author_url(author_url):
             print("Input author url is illegal")
             return None
+        html_src = None
         try:
-            html_src = requests.get(author_url).text
-            soup_html = BeautifulSoup(html_src, "lxml")
+            html_src = self.fetch_html(author_url)
         except:
             print(f"Connection to {author_url} failed...")
-        try:
-            author_dict = self.parse_author_info(author_url, soup_html)
-            return author_dict
-        except:
-            print("Scraping failed due to parsing error.")
-            return None
-
+        return self.scrape_author_from_html(author_url, html_src)
 
 if __name__ == "__main__":
     AUTHOR_URL = "https://www.goodreads.com/author/show/17330820.Misha_Yurchenko"
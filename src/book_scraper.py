@@ -2,8 +2,9 @@
 Scraper for book information.
 """
 import re
-import requests
 from bs4 import BeautifulSoup
+from page_fetcher import PageFetcher, get_default_fetcher
+import xpath_parser
 
 BASE_URL = "https://www.goodreads.com"
 
@@ -14,6 +15,24 @@ class BookScraper:
     Notice it's designed for collecting one book at a time.
     """
 
+    def __init__(self, fetcher=None, session=None, page_cache=None, parser="soup"):
+        """
+        :param fetcher: PageFetcher used for downloading pages,
+         defaults to the one shared by all scrapers
+        :param session: requests.Session to download with, if no fetcher is given
+        :param page_cache: PageCache to serve pages from, if no fetcher is given
+        :param parser: extraction engine, "soup" (BeautifulSoup + CSS selectors)
+         or "xpath" (precompiled lxml XPaths, faster, same results)
+        """
+        assert parser in ("soup", "xpath"), "parser should be soup or xpath"
+        self.parser = parser
+        if fetcher is None:
+            if session is None and page_cache is None:
+                fetcher = get_default_fetcher()
+            else:
+                fetcher = PageFetcher(session=session, page_cache=page_cache)
+        self.fetcher = fetcher
+
     def parse_book_info(self, book_url, html_soup):
         """
         Extract the book info (name, url) from a given book page html.
@@ -133,6 +152,37 @@ class BookScraper:
                     isbn13 = iter_isbn
         return isbn, isbn13
 
+    def is_legal_book_url(self, book_url):
+        """Check the url points to a goodread book page."""
+        return len(re.findall(r'^(https://www.goodreads.com/book/show/.*)$', book_url)) != 0
+
+    def fetch_html(self, url):
+        """
+        Download the raw html of a page.
+        Notice this function DO NOT HANDLE error!
+        :param url: url of the page to download
+        :return: the html source as a string
+        """
+        return self.fetcher.fetch(url)
+
+    def scrape_book_from_html(self, book_url, html_src):
+        """
+        Parse an already downloaded book page.
+        :param book_url: the url html_src was downloaded from
+        :param html_src: the raw html of the book page
+        :return: a dictionary containing all required book attribute information
+        """
+        try:
+            if self.parser == "xpath":
+                assert html_src is not None
+                return xpath_parser.parse_book_info(self, book_url, html_src)
+            html_soup = BeautifulSoup(html_src, "lxml")
+            book_dict = self.parse_book_info(book_url, html_soup)
+            return book_dict
+        except:
+            print("Error encountered in scraping due to parsing errors.")
+            return None
+
     def scrape_book(self, book_url):
         """
         The enter interface of this whole class. It will organize the interaction of all methods
@@ -140,26 +190,17 @@ class BookScraper:
          (e.g. "https://www.goodreads.com/book/show/108986.Introduction_to_Algorithms")
         :return: a dictionary containing all required book attribute information
         """
-        try:
-            assert len(re.findall(r'^(https://www.goodreads.com/book/show/.*)$', book_url)) != 0
-        except:
+        if not self.is_legal_book_url(book_url):
             print("Input URL is illegal")
             return None
 
         try:
-            html_src = requests.get(book_url).text
-            html_soup = BeautifulSoup(html_src, "lxml")
+            html_src = self.fetch_html(book_url)
         except:
             print(f"connection to {book_url}failed")
             return None
 
-        try:
-            book_dict = self.parse_book_info(book_url, html_soup)
-            return book_dict
-        except:
-            print("Error encountered in scraping due to parsing errors.")
-            return None
-
+        return self.scrape_book_from_html(book_url, html_src)
 
 if __name__ == "__main__":
     BOOK_URL = "https://www.goodreads.com/book/show/3735293-clean-code"  # (OK)
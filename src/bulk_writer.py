@@ -0,0 +1,185 @@
+"""
+Batched writes to mongoDB.
+Documents are written with unordered bulk_writes of upserts,
+instead of a find and an insert_one / update_one round trip per document:
+BufferedWriter for documents coming one at a time (crawling),
+bulk_upsert for documents coming as a list (uploads).
+"""
+import threading
+import time
+import cache
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+BATCH_SIZE = 100  # documents per bulk_write
+UPSERT_BATCH_SIZE = 1000  # documents per bulk_write of an upload
+FLUSH_INTERVAL = 5  # seconds a document may wait in the buffer
+
+
+class BufferedWriter:
+    """
+    Insert-if-absent buffer in front of a collection, keeping the stored count locally.
+    """
+
+    def __init__(self, collection, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 stored=None):
+        """
+        :param collection: the target collection
+        :param batch_size: flush once this many documents are buffered
+        :param flush_interval: flush once the oldest buffered document is this old
+        :param stored: number of documents already in collection, counted if None
+        """
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stored = collection.count_documents({}) if stored is None else stored
+        self._lock = threading.Lock()
+        self._buffer = {}  # _id -> document, a later duplicate replaces the former
+        self._flushing = {}  # _id -> document, being written by flush
+        self._oldest = None  # time the oldest buffered document was added
+
+    def __len__(self):
+        """Number of documents waiting to be written."""
+        with self._lock:
+            return len(self._buffer)
+
+    def __contains__(self, _id):
+        """Whether the document of _id is buffered or being written."""
+        with self._lock:
+            return _id in self._buffer or _id in self._flushing
+
+    def count(self):
+        """
+        Number of documents of the collection, counting the buffered ones as new.
+        :return: stored documents + documents waiting to be written
+        """
+        with self._lock:
+            return self.stored + len(self._flushing) + len(self._buffer)
+
+    def add(self, document):
+        """
+        Buffer document, it is inserted at the next flush unless its _id exists.
+        :param document: a dict with an _id
+        :return: True if the buffer should now be flushed
+        """
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer[document["_id"]] = document
+        return self.is_due()
+
+    def is_due(self):
+        """Whether the size or time threshold of the buffer is reached."""
+        with self._lock:
+            if not self._buffer:
+                return False
+            return len(self._buffer) >= self.batch_size or\
+                time.monotonic() - self._oldest >= self.flush_interval
+
+    def write(self, document):
+        """Buffer document, and flush if a threshold is reached."""
+        if self.add(document):
+            self.flush()
+
+    def flush(self):
+        """
+        Write every buffered document with one unordered bulk_write.
+        Documents whose write failed are reported and dropped,
+        the batch is buffered again if the whole request failed.
+        :return: list of the _ids of the documents now in the collection
+        """
+        with self._lock:
+            batch, self._buffer = self._buffer, {}
+            self._flushing.update(batch)
+        if not batch:
+            return []
+        ids = list(batch)
+        requests = [UpdateOne({"_id": _id}, {"$setOnInsert": document}, upsert=True)
+                    for _id, document in batch.items()]
+        failed = set()
+        try:
+            inserted = self.collection.bulk_write(requests, ordered=False).upserted_count
+        except BulkWriteError as err:
+            inserted = err.details.get("nUpserted", 0)
+            for error in err.details.get("writeErrors", []):
+                failed.add(error["index"])
+                print(f"Writing {ids[error['index']]} failed: {error.get('errmsg')}")
+        except:
+            with self._lock:
+                for _id, document in batch.items():
+                    del self._flushing[_id]
+                    self._buffer.setdefault(_id, document)
+                self._oldest = time.monotonic()
+            raise
+        with self._lock:
+            for _id in ids:
+                del self._flushing[_id]
+            self.stored += inserted
+        cache.invalidate(self.collection.name, ids)
+        return [_id for index, _id in enumerate(ids) if index not in failed]
+
+
+def upsert_requests(documents):
+    """:return: the bulk requests inserting or updating documents, by _id"""
+    return [UpdateOne({"_id": document["_id"]}, {"$set": document}, upsert=True)
+            for document in documents]
+
+
+def record_batch(summary, number, batch, result=None, error=None):
+    """
+    Report the bulk_write of the upsert_requests of a batch, and add it to summary.
+    :param summary: the summary of bulk_upsert, updated in place
+    :param number: number of the batch, from 1
+    :param batch: the documents of the batch
+    :param result: the BulkWriteResult, if every write succeeded
+    :param error: the BulkWriteError, otherwise
+    """
+    errors = []
+    if error is None:
+        inserted, updated = result.upserted_count, result.matched_count
+    else:
+        inserted = error.details.get("nUpserted", 0)
+        updated = error.details.get("nMatched", 0)
+        errors = [{"_id": batch[write_error["index"]]["_id"], "errmsg": write_error.get("errmsg")}
+                  for write_error in error.details.get("writeErrors", [])]
+    print(f"Batch {number}: {inserted} inserted,"
+          f" {updated} updated, {len(errors)} failed.")
+    for write_error in errors:
+        print(f"Object with id: {write_error['_id']} failed: {write_error['errmsg']}")
+    summary["inserted"] += inserted
+    summary["updated"] += updated
+    summary["errors"] += errors
+
+
+def bulk_upsert(collection, documents, batch_size=UPSERT_BATCH_SIZE):
+    """
+    Insert new documents and update existing ones, by _id, batch_size at a time.
+    :param collection: the target collection
+    :param documents: a list of dicts with an _id
+    :param batch_size: documents per bulk_write
+    :return: summary {"inserted": int, "updated": int, "errors": [{"_id", "errmsg"}]}
+    """
+    summary = {"inserted": 0, "updated": 0, "errors": []}
+    for start in range(0, len(documents), batch_size):
+        batch = documents[start:start + batch_size]
+        try:
+            result = collection.bulk_write(upsert_requests(batch), ordered=False)
+        except BulkWriteError as err:
+            record_batch(summary, start // batch_size + 1, batch, error=err)
+        else:
+            record_batch(summary, start // batch_size + 1, batch, result=result)
+        finally:
+            cache.invalidate(collection.name, [document["_id"] for document in batch])
+    return summary
+
+
+def describe_upsert(summary):
+    """
+    :param summary: the summary of bulk_upsert
+    :return: the message of an upload, the ids that failed, if any
+    """
+    counts = f"{summary['inserted']} inserted, {summary['updated']} updated."
+    if summary["errors"]:
+        failed = ", ".join(f"{error['_id']} ({error['errmsg']})" for error in summary["errors"])
+        return f"Upload failed for: {failed}. Others succeeded: {counts}"
+    return f"Status Code [200] : Upload succeeded. {counts}"
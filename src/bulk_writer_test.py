@@ -0,0 +1,124 @@
+"""
+Test documents are buffered and written in batches of upserts.
+"""
+import time
+import unittest
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, AutoReconnect
+from bulk_writer import BufferedWriter, bulk_upsert
+
+
+class FakeResult:
+    """Minimal stand-in of pymongo BulkWriteResult."""
+
+    def __init__(self, upserted_count, matched_count=0):
+        self.upserted_count = upserted_count
+        self.matched_count = matched_count
+
+
+class FakeCollection:
+    """Remember the bulk requests, and answer with canned results or errors."""
+
+    name = "books"
+
+    def __init__(self, count=0, results=None):
+        self.count = count
+        self.results = results or []
+        self.requests = []
+
+    def count_documents(self, query):
+        return self.count
+
+    def bulk_write(self, requests, ordered=True):
+        assert not ordered
+        self.requests.append(requests)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class TestBufferedWriter(unittest.TestCase):
+    """
+    Test the flush thresholds and the local count of the buffered writer.
+    """
+
+    def test_flush_on_batch_size(self):
+        """
+        Documents should be written once batch_size of them are buffered.
+        """
+        collection = FakeCollection(count=3, results=[FakeResult(2)])
+        writer = BufferedWriter(collection, batch_size=2, flush_interval=3600)
+        writer.write({"_id": "1"})
+        self.assertEqual(collection.requests, [])
+        writer.write({"_id": "2"})
+        self.assertEqual(collection.requests, [[
+            UpdateOne({"_id": "1"}, {"$setOnInsert": {"_id": "1"}}, upsert=True),
+            UpdateOne({"_id": "2"}, {"$setOnInsert": {"_id": "2"}}, upsert=True)]])
+        self.assertEqual(len(writer), 0)
+        self.assertEqual(writer.count(), 5)
+
+    def test_flush_on_interval(self):
+        """
+        A document should not wait in the buffer longer than flush_interval.
+        """
+        writer = BufferedWriter(FakeCollection(), batch_size=100, flush_interval=0.05)
+        self.assertFalse(writer.add({"_id": "1"}))
+        time.sleep(0.06)
+        self.assertTrue(writer.is_due())
+
+    def test_count_existing_documents(self):
+        """
+        Buffered documents count as new until the flush tells they already existed.
+        """
+        writer = BufferedWriter(FakeCollection(results=[FakeResult(1)]), stored=10)
+        writer.add({"_id": "1"})
+        writer.add({"_id": "2"})
+        writer.add({"_id": "2"})  # deduplicated in the buffer
+        self.assertEqual(writer.count(), 12)
+        self.assertEqual(writer.flush(), ["1", "2"])
+        self.assertEqual(writer.count(), 11)
+
+    def test_failed_flush(self):
+        """
+        Failed documents should be dropped and not reported as written,
+        a failed request should keep the batch.
+        """
+        error = BulkWriteError({"nUpserted": 1, "writeErrors": [
+            {"index": 1, "errmsg": "bad document", "op": {"q": {"_id": "2"}}}]})
+        collection = FakeCollection(results=[AutoReconnect(), error])
+        writer = BufferedWriter(collection)
+        writer.add({"_id": "1"})
+        writer.add({"_id": "2"})
+        self.assertRaises(AutoReconnect, writer.flush)
+        self.assertEqual(len(writer), 2)
+        self.assertIn("2", writer)
+        self.assertEqual(writer.flush(), ["1"])
+        self.assertEqual(len(writer), 0)
+        self.assertNotIn("2", writer)
+        self.assertEqual(writer.count(), 1)
+
+
+class TestBulkUpsert(unittest.TestCase):
+    """
+    Test uploads are chunked into bulk upserts and their results reported.
+    """
+
+    def test_batches_and_errors(self):
+        """
+        Every batch should be one bulk_write, and failed documents reported by _id.
+        """
+        error = BulkWriteError({"nUpserted": 0, "nMatched": 1, "writeErrors": [
+            {"index": 0, "errmsg": "bad document"}]})
+        collection = FakeCollection(results=[FakeResult(1, 1), error])
+        documents = [{"_id": str(i), "rating_value": i} for i in range(3)]
+        summary = bulk_upsert(collection, documents, batch_size=2)
+        self.assertEqual(len(collection.requests), 2)
+        self.assertEqual(collection.requests[1], [
+            UpdateOne({"_id": "2"}, {"$set": documents[2]}, upsert=True)])
+        self.assertEqual(summary, {"inserted": 1, "updated": 2, "errors": [
+            {"_id": "2", "errmsg": "bad document"}]})
+
+
+if __name__ == "__main__":
+    unittest.main()
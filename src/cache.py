@@ -0,0 +1,150 @@
+"""
+In-memory caches of the API server.
+lookups keeps the documents of GET /api/book?_id= and /api/author?_id=,
+least recently used first out, each for at most LOOKUP_CACHE_TTL seconds.
+searches keeps the results of /api/search, keyed by the mongo query they ran.
+Every write path of the server and of bulk_writer calls invalidate.
+Writes made by other processes (e.g. `python main.py update` while the server runs)
+are not seen before the entries expire.
+"""
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+LOOKUP_CACHE_SIZE = int(os.getenv("LOOKUP_CACHE_SIZE", "1024"))  # entries, 0 disables
+LOOKUP_CACHE_TTL = float(os.getenv("LOOKUP_CACHE_TTL", "60"))  # seconds
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))  # entries, 0 disables
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "60"))  # seconds
+SEARCH_CACHE_MAX_RESULTS = 10000  # larger results are not kept
+
+
+class LookupCache:
+    """
+    Thread-safe LRU cache with a time to live, keyed by (collection name, _id).
+    Every invalidation of a collection bumps its version, and values are only
+    cached if the version did not change while they were read from the database,
+    so a value read before a write never overwrites the invalidation of that write.
+    """
+
+    def __init__(self, max_size=LOOKUP_CACHE_SIZE, ttl=LOOKUP_CACHE_TTL):
+        """
+        :param max_size: max number of entries, 0 to cache nothing
+        :param ttl: seconds an entry is served for
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()  # key -> (expiry time, value), least recent first
+        self._versions = {}  # collection name -> number of invalidations
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def version(self, collection_name):
+        """:return: the version of collection_name, to read before querying the database"""
+        with self._lock:
+            return self._versions.get(collection_name, 0)
+
+    def get(self, collection_name, _id):
+        """:return: the cached value, None on a miss"""
+        key = (collection_name, _id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]  # expired
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, collection_name, _id, value, version=None):
+        """
+        Cache value, evicting the least recently used entry if full,
+        unless collection_name was written since version was read.
+        :param version: the version read before reading value
+        """
+        if self.max_size <= 0:
+            return
+        key = (collection_name, _id)
+        with self._lock:
+            if version is not None and version != self.version(collection_name):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection_name, ids=None):
+        """
+        Drop the entries of ids in collection_name.
+        :param ids: the _ids written, None for every entry of the collection
+        """
+        with self._lock:
+            self._versions[collection_name] = self.version(collection_name) + 1
+            if ids is None:
+                ids = [key[1] for key in self._entries if key[0] == collection_name]
+            for _id in ids:
+                try:
+                    self._entries.pop((collection_name, _id), None)
+                except TypeError:  # unhashable _id, never looked up
+                    pass
+
+    def stats(self):
+        """:return: size, hits, misses, hit rate and versions of the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries), "max_size": self.max_size, "ttl": self.ttl,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                    "versions": dict(self._versions)}
+
+
+class SearchCache(LookupCache):
+    """
+    LookupCache of search results, keyed by (collection name, search_key).
+    Any write to a collection drops all its entries, it can change the results of any search.
+    """
+
+    def __init__(self, max_size=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        super().__init__(max_size, ttl)
+
+    def invalidate(self, collection_name, ids=None):
+        """Drop every entry of collection_name, whatever the ids written."""
+        super().invalidate(collection_name)
+
+
+def search_key(page_query):
+    """
+    :param page_query: the interpreter.PageQuery of a search
+    :return: canonical form of the search, whatever the spacing or spelling of the query string
+    """
+    return json.dumps([page_query.filter, page_query.projection, page_query.sort,
+                       page_query.limit], sort_keys=True, default=str)
+
+
+lookups = LookupCache()  # shared by the handlers of the process
+searches = SearchCache()
+
+
+def invalidate(collection_name, ids=None):
+    """
+    To be called after writing to a collection.
+    :param collection_name: name of the written collection, "books" or "authors"
+    :param ids: the _ids written, None if unknown
+    """
+    lookups.invalidate(collection_name, ids)
+    searches.invalidate(collection_name)
+
+
+def stats():
+    """:return: the stats of every cache"""
+    return {"lookups": lookups.stats(), "searches": searches.stats()}
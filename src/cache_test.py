@@ -0,0 +1,136 @@
+"""
+Test the in-memory caches of the API server.
+"""
+import time
+import unittest
+import cache
+from cache import LookupCache, SearchCache, search_key
+from interpreter import compile_query, prepare_page
+
+
+class TestLookupCache(unittest.TestCase):
+    """
+    Unit test class wrapper for lookup cache tests.
+    """
+
+    def test_hits_and_misses(self):
+        """
+        Test cached values are served and counted as hits, unknown keys as misses.
+        """
+        lookups = LookupCache(max_size=4, ttl=60)
+        self.assertIsNone(lookups.get("books", "1"))
+        lookups.put("books", "1", [{"_id": "1"}])
+        self.assertEqual(lookups.get("books", "1"), [{"_id": "1"}])
+        self.assertIsNone(lookups.get("authors", "1"))
+        stats = lookups.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 2, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 1 / 3, places=3)
+
+    def test_least_recently_used_is_evicted(self):
+        """
+        Test the least recently used entry is dropped when the cache is full.
+        """
+        lookups = LookupCache(max_size=2, ttl=60)
+        lookups.put("books", "1", 1)
+        lookups.put("books", "2", 2)
+        lookups.get("books", "1")  # 2 is now the least recently used
+        lookups.put("books", "3", 3)
+        self.assertEqual(lookups.get("books", "1"), 1)
+        self.assertIsNone(lookups.get("books", "2"))
+        self.assertEqual(lookups.get("books", "3"), 3)
+        self.assertEqual(len(LookupCache(max_size=0)), 0)
+
+    def test_expiry(self):
+        """
+        Test entries are not served after their time to live.
+        """
+        lookups = LookupCache(max_size=2, ttl=0.01)
+        lookups.put("books", "1", 1)
+        time.sleep(0.02)
+        self.assertIsNone(lookups.get("books", "1"))
+        self.assertEqual(len(lookups), 0)
+
+    def test_invalidate(self):
+        """
+        Test writes drop the entries of the written ids, or of the whole collection.
+        """
+        lookups = LookupCache(max_size=8, ttl=60)
+        for _id in ("1", "2", "3"):
+            lookups.put("books", _id, _id)
+        lookups.put("authors", "1", "1")
+        lookups.invalidate("books", ["1", {"not": "hashable"}])
+        self.assertIsNone(lookups.get("books", "1"))
+        self.assertEqual(lookups.get("books", "2"), "2")
+        lookups.invalidate("books")
+        self.assertIsNone(lookups.get("books", "3"))
+        self.assertEqual(lookups.get("authors", "1"), "1")
+
+    def test_lookup_read_across_a_write(self):
+        """
+        Test a document read before a write is not cached after the write invalidated it.
+        """
+        lookups = LookupCache(max_size=8, ttl=60)
+        version = lookups.version("books")
+        lookups.invalidate("books", ["1"])  # the write lands while the old document is read
+        lookups.put("books", "1", "old", version)
+        self.assertIsNone(lookups.get("books", "1"))
+        lookups.put("books", "1", "new", lookups.version("books"))
+        self.assertEqual(lookups.get("books", "1"), "new")
+
+    def test_module_invalidate(self):
+        """
+        Test cache.invalidate reaches the shared lookup cache.
+        """
+        cache.lookups.put("books", "test_module_invalidate", 1)
+        cache.invalidate("books", ["test_module_invalidate"])
+        self.assertIsNone(cache.lookups.get("books", "test_module_invalidate"))
+        self.assertIn("lookups", cache.stats())
+
+
+class TestSearchCache(unittest.TestCase):
+    """
+    Unit test class wrapper for search cache tests.
+    """
+
+    def test_search_key_is_canonical(self):
+        """
+        Test differently written queries of the same search share a key, other searches do not.
+        """
+        plan1 = compile_query('book.rating_value : > 4 AND book.author_name : "A"')
+        plan2 = compile_query('book.rating_value:>4.0   AND  book.author_name:"A"')
+        self.assertEqual(search_key(prepare_page(plan1, limit=10)),
+                         search_key(prepare_page(plan2, limit=10)))
+        self.assertNotEqual(search_key(prepare_page(plan1, limit=10)),
+                            search_key(prepare_page(plan1, limit=20)))
+        self.assertNotEqual(search_key(prepare_page(plan1)),
+                            search_key(prepare_page(plan1, sort="-rating_value")))
+
+    def test_writes_invalidate_searches(self):
+        """
+        Test a write drops the searches of its collection only,
+        and results computed across a write are not cached.
+        """
+        searches = SearchCache(max_size=8, ttl=60)
+        searches.put("books", "q1", [1], searches.version("books"))
+        searches.put("authors", "q1", [2], searches.version("authors"))
+        version = searches.version("books")
+        searches.invalidate("books", ["1"])
+        self.assertIsNone(searches.get("books", "q1"))
+        self.assertEqual(searches.get("authors", "q1"), [2])
+        searches.put("books", "q2", [3], version)  # computed before the write
+        self.assertIsNone(searches.get("books", "q2"))
+        searches.put("books", "q2", [3], searches.version("books"))
+        self.assertEqual(searches.get("books", "q2"), [3])
+        self.assertEqual(searches.stats()["versions"], {"books": 1})
+
+    def test_module_invalidate_bumps_version(self):
+        """
+        Test cache.invalidate also reaches the shared search cache.
+        """
+        version = cache.searches.version("books")
+        cache.invalidate("books", ["1"])
+        self.assertEqual(cache.searches.version("books"), version + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
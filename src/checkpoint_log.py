@@ -0,0 +1,253 @@
+"""
+Write-ahead log of the scraping progress.
+Instead of re-pickling the whole bfs queue and visited sets after every author,
+the scraper appends one small record per change (url popped, urls pushed,
+book visited, author visited) to progress_dir/checkpoint.log.
+Every COMPACT_EVERY records the log is folded into the pickled snapshot
+(bfs_queue.pkl, visited_books.pkl, visited_authors.pkl), and the log restarts
+from the records appended meanwhile. The owner of the log compacts it once is_due: the crawl engine copies the
+progress on its event loop and pickles the copy in a thread, see compact.
+
+Replaying is idempotent, so a crash in the middle of a compaction is harmless:
+every url enters the bfs queue at most once, so a "pop" whose url is not at
+the head of the queue anymore was already applied by the snapshot.
+
+A url is popped when its page is fetched but only visited once its book is
+stored, so a crash would lose the urls in between. Compaction writes them at
+the head of the snapshot, and replay puts every url popped and not visited
+back at the head of the queue, so they are scraped again by the next run.
+
+Only one crawl may use a progress directory at a time, in any process:
+a second one would compact over the log of the first. ProgressLock holds
+an exclusive lock of progress_dir/progress.lock for the whole crawl.
+"""
+import json
+import os
+import pickle as pk
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOG_FILE = "checkpoint.log"
+LOCK_FILE = "progress.lock"
+COMPACT_EVERY = 500  # records appended between two compactions
+
+POP, PUSH, PUSH_FRONT, BOOK, AUTHOR = "pop", "push", "push_front", "book", "author"
+
+
+class ProgressLocked(Exception):
+    """The progress directory is locked by another crawl."""
+
+
+class ProgressLock:
+    """
+    Exclusive lock of a progress directory, across processes, until released.
+    The lock is released by the OS if the process dies.
+    """
+
+    def __init__(self, progress_dir):
+        """
+        Take the lock without waiting.
+        :param progress_dir: the progress directory to be used
+        :raise ProgressLocked: if another crawl holds it
+        """
+        if not os.path.isdir(progress_dir):
+            os.mkdir(progress_dir)
+        self._file = open(progress_dir + LOCK_FILE, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self._file.close()
+            self._file = None
+            raise ProgressLocked(f"{progress_dir} is used by another crawl.")
+
+    def release(self):
+        """Release the lock, once."""
+        if self._file is None:
+            return
+        if fcntl is None:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()  # releases the flock
+        self._file = None
+
+
+def write_snapshot(progress_dir, bfs_queue, visited_books, visited_authors):
+    """
+    Atomically (per file) pickle the full progress into progress_dir.
+    The queue is written last, so visited sets are never older than it.
+    """
+    if not os.path.isdir(progress_dir):
+        os.mkdir(progress_dir)
+    for name, obj in [("visited_books.pkl", visited_books),
+                      ("visited_authors.pkl", visited_authors),
+                      ("bfs_queue.pkl", list(bfs_queue))]:
+        tmp_path = progress_dir + name + ".tmp"
+        with open(tmp_path, "wb") as file:
+            pk.dump(obj, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, progress_dir + name)
+
+
+def read_records(progress_dir):
+    """
+    Read the records of the checkpoint log.
+    A torn last line (crash while appending) is ignored.
+    :return: list of (op, value) tuples
+    """
+    path = progress_dir + LOG_FILE
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # torn write, nothing valid can follow
+            records.append((record["op"], record["value"]))
+    return records
+
+
+def replay(progress_dir, bfs_queue, visited_books, visited_authors):
+    """
+    Apply the checkpoint log on top of the loaded snapshot, in place.
+    :param progress_dir: the progress directory to be used
+    :param bfs_queue: Frontier loaded from bfs_queue.pkl
+    :param visited_books: set loaded from visited_books.pkl
+    :param visited_authors: set loaded from visited_authors.pkl
+    :return: number of replayed records
+    """
+    records = read_records(progress_dir)
+    unfinished = {}  # urls popped but not visited, in order (dict as ordered set)
+    for op, value in records:
+        if op == POP:
+            if len(bfs_queue) != 0 and bfs_queue.peek() == value:
+                bfs_queue.pop()
+            else:  # applied by the snapshot, or popped before the PUSH of its book
+                bfs_queue.mark_seen(value)
+            unfinished[value] = None
+        elif op == PUSH:
+            bfs_queue.extend(value)
+        elif op == PUSH_FRONT:
+            if value not in visited_books and \
+                    (len(bfs_queue) == 0 or bfs_queue.peek() != value):
+                bfs_queue.push_front(value)
+        elif op == BOOK:
+            visited_books.add(value)
+            bfs_queue.mark_seen(value)
+            unfinished.pop(value, None)
+        elif op == AUTHOR:
+            visited_authors.add(value)
+    for url in reversed(list(unfinished)):  # in flight when the log was cut
+        if url not in visited_books:
+            bfs_queue.push_front(url)
+    return len(records)
+
+
+class CheckpointLog:
+    """
+    Appender of the checkpoint log, owning the compaction of the snapshot.
+    """
+
+    def __init__(self, progress_dir, bfs_queue, visited_books, visited_authors,
+                 compact_every=COMPACT_EVERY):
+        """
+        Start logging on top of the given state, which is compacted right away.
+        :param progress_dir: the progress directory to be used
+        :param bfs_queue: the Frontier being crawled
+        :param visited_books: set of visited book urls
+        :param visited_authors: set of visited author urls
+        :param compact_every: records appended between two compactions
+        """
+        self.progress_dir = progress_dir
+        self.bfs_queue = bfs_queue
+        self.visited_books = visited_books
+        self.visited_authors = visited_authors
+        self.compact_every = compact_every
+        self._file = None
+        self._appended = 0
+        self._in_flight = {}  # urls popped but not visited yet (dict as ordered set)
+        self.compact()
+
+    def record(self, op, value):
+        """
+        Append one change of the progress.
+        :param op: one of POP, PUSH, PUSH_FRONT, BOOK, AUTHOR
+        :param value: the url (or list of urls for PUSH)
+        """
+        if op == POP:
+            self._in_flight[value] = None
+        elif op == BOOK:
+            self._in_flight.pop(value, None)
+        self._file.write(json.dumps({"op": op, "value": value}) + "\n")
+        self._file.flush()
+        self._appended += 1
+
+    def is_due(self):
+        """:return: True once compact_every records were appended since the last compaction"""
+        return self._appended >= self.compact_every
+
+    def compact(self):
+        """
+        Fold the log into the pickled snapshot and start a new log.
+        Urls in flight are written at the head of the queue, so they are not lost.
+        """
+        state = self.begin_compaction()
+        self.write_compaction(state)
+        self.end_compaction(state)
+
+    def begin_compaction(self):
+        """
+        First step of compact, in the thread recording: copy the progress in memory.
+        Records appended until end_compaction are kept in the new log.
+        :return: the state to pass to write_compaction and end_compaction
+        """
+        offset = 0
+        if self._file is not None:
+            self._file.flush()
+            offset = self._file.tell()
+        self._in_flight = {url: None for url in self._in_flight
+                           if url not in self.visited_books}
+        in_flight = list(self._in_flight)
+        return {"offset": offset, "in_flight": in_flight,
+                "bfs_queue": in_flight + list(self.bfs_queue),
+                "visited_books": set(self.visited_books),
+                "visited_authors": set(self.visited_authors)}
+
+    def write_compaction(self, state):
+        """Second step of compact, in any thread: pickle the copied progress (the slow part)."""
+        write_snapshot(self.progress_dir, state["bfs_queue"],
+                       state["visited_books"], state["visited_authors"])
+
+    def end_compaction(self, state):
+        """
+        Last step of compact, in the thread recording: replace the log with the
+        urls in flight at begin_compaction, then the records appended since.
+        """
+        path = self.progress_dir + LOG_FILE
+        tail = ""
+        if self._file is not None:
+            self._file.close()
+            with open(path, "r") as file:
+                file.seek(state["offset"])
+                tail = file.read()
+        with open(path + ".tmp", "w") as file:
+            for url in state["in_flight"]:  # popped again from the head of the snapshot on replay
+                file.write(json.dumps({"op": POP, "value": url}) + "\n")
+            file.write(tail)
+        os.replace(path + ".tmp", path)
+        self._file = open(path, "a")
+        self._appended = tail.count("\n")
+
+    def close(self):
+        """Compact one last time, so the next run starts from a clean snapshot."""
+        self.compact()
+        self._file.close()
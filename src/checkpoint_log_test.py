@@ -0,0 +1,159 @@
+"""
+Test the scraping progress can be rebuilt from the checkpoint log.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from frontier import Frontier
+from checkpoint_log import CheckpointLog, ProgressLock, ProgressLocked, replay, write_snapshot,\
+    LOG_FILE, POP, PUSH, PUSH_FRONT, BOOK, AUTHOR
+from bfs_scrape import load_progress
+
+
+def load_and_replay(progress_dir):
+    """Load the snapshot and replay the log like construct_bfs_info does."""
+    bfs_queue, visited_books, visited_authors = load_progress(progress_dir)
+    bfs_queue = Frontier(bfs_queue, seen=visited_books)
+    replay(progress_dir, bfs_queue, visited_books, visited_authors)
+    return list(bfs_queue), visited_books, visited_authors
+
+
+def record(log, op, value):
+    """Append a record, compacting when due like the crawl engine."""
+    log.record(op, value)
+    if log.is_due():
+        log.compact()
+
+
+class TestCheckpointLog(unittest.TestCase):
+    """
+    Test the checkpoint log records deltas and replays them correctly.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.progress_dir = self.tmp_dir.name + os.sep
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def crawl_a_bit(self, compact_every=100):
+        """Mimic the crawl engine on a small queue, without closing the log."""
+        bfs_queue, visited_books, visited_authors = Frontier(["a", "b"]), set(), set()
+        log = CheckpointLog(self.progress_dir, bfs_queue, visited_books, visited_authors,
+                            compact_every)
+        url = bfs_queue.pop()
+        record(log, POP, url)
+        visited_books.add(url)
+        record(log, BOOK, url)
+        record(log, PUSH, bfs_queue.extend(["b", "c", "d"]))
+        visited_authors.add("author_a")
+        record(log, AUTHOR, "author_a")
+        bfs_queue.push_front("start")
+        record(log, PUSH_FRONT, "start")
+        return list(bfs_queue), visited_books, visited_authors
+
+    def test_replay_after_crash(self):
+        """
+        Progress recorded only in the log (no close) should be fully recovered.
+        """
+        expected = self.crawl_a_bit()
+        self.assertEqual(load_and_replay(self.progress_dir), expected)
+
+    def test_replay_after_compaction(self):
+        """
+        Compacting in the middle of the crawl should not change the recovered progress.
+        """
+        expected = self.crawl_a_bit(compact_every=2)
+        self.assertEqual(load_and_replay(self.progress_dir), expected)
+
+    def test_replay_is_idempotent(self):
+        """
+        A crash after writing the snapshot but before truncating the log
+        replays records already in the snapshot, which must change nothing.
+        """
+        expected = self.crawl_a_bit()
+        write_snapshot(self.progress_dir, Frontier(expected[0]), expected[1], expected[2])
+        self.assertEqual(load_and_replay(self.progress_dir), expected)
+
+    def crash_mid_crawl(self, compact_every=100):
+        """Pop two urls, store only the first one, and stop without closing the log."""
+        bfs_queue, visited_books = Frontier(["a", "b", "c"]), set()
+        log = CheckpointLog(self.progress_dir, bfs_queue, visited_books, set(), compact_every)
+        for _ in range(2):
+            record(log, POP, bfs_queue.pop())
+        visited_books.add("a")
+        record(log, BOOK, "a")
+        record(log, PUSH, bfs_queue.extend(["d"]))
+        record(log, PUSH_FRONT, "a")  # visited since, not to be queued again
+        with open(self.progress_dir + LOG_FILE, "a") as file:
+            file.write('{"op": "book", "val')  # crash while storing "b"
+
+    def test_replay_keeps_urls_in_flight(self):
+        """
+        A url popped but not stored when the log was cut should be scraped again.
+        """
+        self.crash_mid_crawl()
+        self.assertEqual(load_and_replay(self.progress_dir), (["b", "c", "d"], {"a"}, set()))
+
+    def test_compaction_keeps_urls_in_flight(self):
+        """
+        Compacting while a url is in flight should not lose it either.
+        """
+        for compact_every in (1, 2, 3):
+            self.crash_mid_crawl(compact_every)
+            self.assertEqual(load_and_replay(self.progress_dir),
+                             (["b", "c", "d"], {"a"}, set()))
+
+    def test_records_during_compaction(self):
+        """
+        Records appended while the snapshot is pickled should be kept,
+        whether the compaction ends or the crawl crashes before.
+        """
+        for ends in (True, False):
+            bfs_queue, visited_books = Frontier(["a", "b", "c"]), set()
+            log = CheckpointLog(self.progress_dir, bfs_queue, visited_books, set())
+            record(log, POP, bfs_queue.pop())
+            state = log.begin_compaction()
+            record(log, POP, bfs_queue.pop())
+            visited_books.add("a")
+            record(log, BOOK, "a")
+            record(log, PUSH, bfs_queue.extend(["d"]))
+            log.write_compaction(state)
+            if ends:
+                log.end_compaction(state)
+                record(log, POP, bfs_queue.pop())
+            self.assertEqual(load_and_replay(self.progress_dir),
+                             (["b", "c", "d"], {"a"}, set()))
+
+    def test_torn_last_record_is_ignored(self):
+        """
+        A partially written last line should not prevent resuming.
+        """
+        expected = self.crawl_a_bit()
+        with open(self.progress_dir + LOG_FILE, "a") as file:
+            file.write('{"op": "pop", "val')
+        self.assertEqual(load_and_replay(self.progress_dir), expected)
+
+    def test_progress_lock(self):
+        """
+        Test a progress directory is locked by one crawl at a time, across processes.
+        """
+        try_lock = ("import sys; from checkpoint_log import ProgressLock, ProgressLocked\n"
+                    "try:\n    ProgressLock(sys.argv[1])\n"
+                    "except ProgressLocked:\n    sys.exit(3)")
+        lock = ProgressLock(self.progress_dir)
+        self.assertRaises(ProgressLocked, ProgressLock, self.progress_dir)
+        other_process = subprocess.run([sys.executable, "-c", try_lock, self.progress_dir])
+        self.assertEqual(other_process.returncode, 3)
+        lock.release()
+        lock.release()  # harmless
+        other_process = subprocess.run([sys.executable, "-c", try_lock, self.progress_dir])
+        self.assertEqual(other_process.returncode, 0)
+        ProgressLock(self.progress_dir).release()
+
+
+if __name__ == "__main__":
+    unittest.main()
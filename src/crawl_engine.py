@@ -0,0 +1,371 @@
+"""
+Concurrent crawl engine behind the scrape sub command.
+Crawling is a pipeline of three stages connected by bounded queues:
+- fetchers download book pages, author pages and author sub-pages in parallel,
+  every request still going through the rate limiter the scrapers share,
+- parsers ship the raw pages to a process pool (see parse_pool.py),
+  so that parsing scales with the number of cores instead of holding the GIL,
+- a single storer buffers the parsed dicts into batched db writes
+  and updates the bfs progress. A book or author is only marked visited,
+  and checkpointed, once the flush of its buffer wrote it. The checkpoint log
+  is compacted in the background, pickling in a thread like the flushes.
+A full queue blocks the stage before it, so fast fetchers never pile up pages.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import parse_pool
+from bulk_writer import BufferedWriter
+from checkpoint_log import POP, PUSH, BOOK, AUTHOR
+
+SEP = "=" * 120  # log separator
+CRAWL_WORKERS = 4  # number of pages being fetched at the same time
+PARSE_PROCESSES = None  # number of parsing processes, None for one per core
+PAGES_PER_PARSER = 2  # bound of the queues between stages, per parsing process
+MAX_CONTINUOUS_FAILURE = 5  # out IP are likely to be blocked after this
+BOOK_RETRIES = 1  # times a failed book url goes back to the tail of the queue
+
+
+class CrawlEngine:
+    """
+    BFS crawler over similar books, fetching, parsing and storing concurrently.
+    The scraper objects only parse here, all downloading is done by the engine.
+    """
+
+    def __init__(self, book_scraper, author_scraper, book_db, author_db,
+                 bfs_queue, visited_books, visited_authors, checkpoint=None,
+                 max_book=200, max_author=50, workers=CRAWL_WORKERS,
+                 parse_processes=PARSE_PROCESSES, cancel_event=None):
+        """
+        :param book_scraper: BookScraper used to fetch and parse book pages
+        :param author_scraper: AuthorScraper used to fetch and parse author pages
+        :param book_db: book collection
+        :param author_db: author collection
+        :param bfs_queue: Frontier of book urls to visit
+        :param visited_books: set of visited book urls
+        :param visited_authors: set of visited author urls
+        :param checkpoint: CheckpointLog recording every change of the progress
+        :param max_book: max number of books to scrape
+        :param max_author: max number of author to scrape
+        :param workers: number of concurrent fetchers
+        :param parse_processes: number of parsing processes, None for one per core,
+                                0 to parse in threads of this process
+        :param cancel_event: threading.Event, once set no new page is fetched
+                             and the crawl ends after storing the pages in flight
+        """
+        self.book_scraper = book_scraper
+        self.author_scraper = author_scraper
+        self.book_db = book_db
+        self.author_db = author_db
+        self.bfs_queue = bfs_queue
+        self.visited_books = visited_books
+        self.visited_authors = visited_authors
+        self.checkpoint = checkpoint
+        self.max_book = max_book
+        self.max_author = max_author
+        self.workers = workers
+        self.parse_processes = parse_processes
+        self.cancel_event = cancel_event
+        self._executor = None
+        self._parse_pool = None
+        self._compaction = None  # task compacting the checkpoint log
+        self._raw_pages = None
+        self._parsed_pages = None
+        self._book_writer = None
+        self._author_writer = None
+        self._author_jobs = deque()  # authors of stored books, fetched before new books
+        self._authors_queued = set()
+        self._retries = {}  # failed book url -> times it was queued again
+        self._held = {BOOK: {}, AUTHOR: {}}  # buffered _id -> progress records of its flush
+        self._pending = 0  # jobs between being fetched and being stored
+        self._continuous_failure = 0
+        self._books_done = False  # max criterions reached, only finish pending authors
+        self._stopped = False  # we got blocked, stop everything
+        self._pages_fetched = 0
+        self._started = None
+
+    def run(self):
+        """Crawl until the queue is drained, max criterions are met or we got blocked."""
+        asyncio.run(self.crawl())
+
+    def progress(self):
+        """
+        Progress of the crawl, safe to call from other threads while it runs.
+        :return: dict of books and authors recorded, queue depth, pages fetched and per second
+        """
+        book_recorded, author_recorded = 0, 0
+        if self._author_writer is not None:  # writers are created when the crawl starts
+            book_recorded, author_recorded = self._count_recorded()
+        elapsed = 0 if self._started is None else time.monotonic() - self._started
+        return {"books": book_recorded, "authors": author_recorded,
+                "queue": len(self.bfs_queue), "pages": self._pages_fetched,
+                "pages_per_second": round(self._pages_fetched / elapsed, 2) if elapsed else 0.0}
+
+    def _cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    async def crawl(self):
+        """Coroutine version of run."""
+        self._started = time.monotonic()
+        # every fetcher downloads at most 3 pages at a time (author + 2 sub-pages)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers * 3)
+        self._book_writer = await self._call(BufferedWriter, self.book_db)
+        self._author_writer = await self._call(BufferedWriter, self.author_db)
+        parsers = self.workers
+        if self.parse_processes != 0:
+            parsers = self.parse_processes or os.cpu_count()
+            self._parse_pool = parse_pool.make_parse_pool(parsers)
+        self._raw_pages = asyncio.Queue(maxsize=parsers * PAGES_PER_PARSER)
+        self._parsed_pages = asyncio.Queue(maxsize=parsers * PAGES_PER_PARSER)
+        stages = [asyncio.ensure_future(self._parser()) for _ in range(parsers)]
+        stages.append(asyncio.ensure_future(self._storer()))
+        try:
+            await asyncio.gather(*(self._fetcher() for _ in range(self.workers)))
+            await self._raw_pages.join()  # let fetched pages go through the pipeline
+            await self._parsed_pages.join()
+        finally:
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            try:
+                await self._flush(force=True)
+                if self._compaction is not None:
+                    await self._compaction
+            finally:
+                self._executor.shutdown(wait=True)
+                if self._parse_pool is not None:
+                    self._parse_pool.shutdown(wait=True)
+
+    async def _call(self, func, *args):
+        """Run blocking func in the engine thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _fetch(self, scraper, url):
+        """Download url with scraper, throttled by the scraper's rate limiter."""
+        return await self._call(scraper.fetch_html, url)
+
+    def _record(self, op, value):
+        if self.checkpoint is not None:
+            self.checkpoint.record(op, value)
+
+    def _compact_if_due(self):
+        """Start compacting the checkpoint log in the background, unless it is already."""
+        if self.checkpoint is None or not self.checkpoint.is_due():
+            return
+        if self._compaction is None or self._compaction.done():
+            self._compaction = asyncio.ensure_future(self._compact())
+
+    async def _compact(self):
+        """Copy the progress here, pickle it in the thread pool, then start the new log."""
+        try:
+            state = self.checkpoint.begin_compaction()
+            await self._call(self.checkpoint.write_compaction, state)
+            self.checkpoint.end_compaction(state)
+        except Exception:
+            print("Compacting the checkpoint log failed, retrying later ...")
+
+    def _count_recorded(self):
+        return self._book_writer.count(), self._author_writer.count()
+
+    async def _flush(self, force=False):
+        """Write the buffered documents if a threshold of their writer is reached."""
+        for kind, writer in ((BOOK, self._book_writer), (AUTHOR, self._author_writer)):
+            if force or writer.is_due():
+                written = await self._call(writer.flush)
+                self._release(kind, writer, written)
+
+    def _hold(self, kind, _id, *records):
+        """Keep the progress records of a buffered document until it is written."""
+        self._held[kind].setdefault(_id, []).extend(records)
+
+    def _release(self, kind, writer, written):
+        """
+        Mark visited and checkpoint the documents written by a flush.
+        :param kind: BOOK or AUTHOR
+        :param writer: the BufferedWriter just flushed
+        :param written: _ids returned by its flush
+        """
+        held = self._held[kind]
+        for _id in written:
+            for op, value in held.pop(_id, ()):
+                if op == BOOK:
+                    self.visited_books.add(value)
+                elif op == AUTHOR:
+                    self.visited_authors.add(value)
+                    self._authors_queued.discard(value)
+                self._record(op, value)
+        for _id in [_id for _id in held if _id not in writer]:
+            for op, value in held.pop(_id):  # write failed, the url stays in flight
+                if op == AUTHOR:
+                    self._authors_queued.discard(value)
+
+    def _failed(self, kind, url):
+        """A job failed at any stage, stop if it happens too often in a row."""
+        self._pending -= 1
+        if kind == AUTHOR:
+            self._authors_queued.discard(url)
+        elif self._retries.get(url, 0) < BOOK_RETRIES:
+            self._retries[url] = self._retries.get(url, 0) + 1
+            self.bfs_queue.retry(url)  # popped urls are seen, push would drop it
+        self._continuous_failure += 1
+        if self._continuous_failure >= MAX_CONTINUOUS_FAILURE:
+            self._stopped = True  # out IP are likely to be blocked
+        print("Scraping failed ...")
+
+    async def _next_book(self):
+        """
+        :return: the next unvisited book url of the queue,
+                 None if the queue is empty or the max criterions are reached
+        """
+        if self._books_done or len(self.bfs_queue) == 0:
+            return None
+        book_recorded, author_recorded = self._count_recorded()
+        if book_recorded >= self.max_book and author_recorded >= self.max_author:
+            if not self._books_done:
+                print(f"currently there are {book_recorded} books,"
+                      f" and {author_recorded} authors recorded."
+                      f" Both max criterions are reached.\n"
+                      f" Set larger max_author or max_book"
+                      f" to continue scraping")
+            self._books_done = True
+            return None
+        while len(self.bfs_queue) != 0:
+            book_url = self.bfs_queue.pop()
+            self._record(POP, book_url)
+            if book_url not in self.visited_books:
+                return book_url
+        return None  # drained by other fetchers while counting
+
+    async def _fetcher(self):
+        """Fetch pending authors first, then new books, until there is nothing left to do."""
+        while not self._stopped and not self._cancelled():
+            if self._author_jobs:
+                kind, url = AUTHOR, self._author_jobs.popleft()
+            else:
+                kind, url = BOOK, await self._next_book()
+                if url is None:
+                    if self._pending == 0 and not self._author_jobs:
+                        break  # nothing in the pipeline can add new urls any more
+                    await asyncio.sleep(0.1)  # wait for stored books to extend the queue
+                    continue
+
+            self._pending += 1
+            try:
+                if kind == BOOK:
+                    page = await self._fetch_book(url)
+                else:
+                    page = await self._fetch_author(url)
+            except Exception:
+                self._failed(kind, url)
+                continue
+            self._pages_fetched += 1
+            await self._raw_pages.put((kind, url, page))
+
+    async def _fetch_book(self, book_url):
+        print(f"\n\n\n\n Working on {self._book_writer.count() + 1} / {self.max_book} -"
+              f" Scraping {book_url}\n" + SEP)
+        assert self.book_scraper.is_legal_book_url(book_url), "Input URL is illegal"
+        return await self._fetch(self.book_scraper, book_url)
+
+    async def _fetch_author(self, author_url):
+        """Download the author page and its sub-pages in parallel."""
+        sub_page_urls = self.author_scraper.construct_sub_page_urls(author_url)
+        names = list(sub_page_urls.keys())
+        pages = await asyncio.gather(self._fetch(self.author_scraper, author_url),
+                                     *(self._fetch(self.author_scraper, sub_page_urls[name])
+                                       for name in names),
+                                     return_exceptions=True)
+        pages = [None if isinstance(page, Exception) else page for page in pages]
+        return pages[0], dict(zip(names, pages[1:]))
+
+    async def _parse(self, kind, url, page):
+        """Parse a fetched page into a plain dict, in the process pool if any."""
+        loop = asyncio.get_running_loop()
+        if kind == BOOK:
+            if self._parse_pool is None:
+                return await self._call(self.book_scraper.scrape_book_from_html, url, page)
+            return await loop.run_in_executor(self._parse_pool, parse_pool.parse_book_page,
+                                              self.book_scraper.parser, url, page)
+        html_src, sub_pages = page
+        if self._parse_pool is None:
+            return await self._call(self.author_scraper.scrape_author_from_html,
+                                    url, html_src, sub_pages)
+        return await loop.run_in_executor(self._parse_pool, parse_pool.parse_author_pages,
+                                          self.author_scraper.parser, url, html_src, sub_pages)
+
+    async def _parser(self):
+        """Turn raw pages into dicts for the storer."""
+        while True:
+            kind, url, page = await self._raw_pages.get()
+            try:
+                parsed = await self._parse(kind, url, page)
+            except Exception:
+                self._failed(kind, url)
+            else:
+                await self._parsed_pages.put((kind, url, parsed))
+            finally:
+                self._raw_pages.task_done()
+
+    async def _storer(self):
+        """Store parsed dicts one at a time, the only stage touching the bfs progress."""
+        while True:
+            try:
+                kind, url, parsed = await asyncio.wait_for(self._parsed_pages.get(),
+                                                           timeout=1)
+            except asyncio.TimeoutError:
+                await self._flush()  # nothing to store, do not let documents wait
+                self._compact_if_due()
+                continue
+            try:
+                if kind == BOOK:
+                    await self._store_book(url, parsed)
+                else:
+                    await self._store_author(url, parsed)
+            except Exception:
+                self._failed(kind, url)
+            else:
+                self._pending -= 1
+                self._continuous_failure = 0  # reset failure count
+            finally:
+                self._parsed_pages.task_done()
+            try:
+                await self._flush()
+            except Exception:
+                print("Writing to the database failed, retrying at next flush ...")
+            self._compact_if_due()
+
+    async def _store_book(self, book_url, book_dict):
+        """Store one book, extend the queue and schedule its author if the author is new."""
+        assert book_dict is not None
+        book_id = book_dict.get("book_id")
+        assert book_id is not None  # use book_id as storage key
+        assert book_dict.get("book_title") is not None
+        author_url = book_dict.get("author_url")
+        assert author_url is not None  # make sure author is found
+
+        book_dict["_id"] = book_id
+        self._book_writer.add(book_dict)  # make sure no duplicate
+        pushed = self.bfs_queue.extend(book_dict["similar_book_urls"])
+        self._hold(BOOK, book_id, (BOOK, book_url), *([(PUSH, pushed)] if pushed else []))
+
+        # scrape the information of author of the book
+        if author_url in self.visited_authors or author_url in self._authors_queued:
+            print("Author already recorded.")
+            return
+        self._authors_queued.add(author_url)
+        self._author_jobs.append(author_url)
+
+    async def _store_author(self, author_url, author_dict):
+        """Store one author."""
+        assert author_dict is not None, "author_dict is None"
+        assert author_dict.get("author_name") is not None,\
+            "author_name is None"  # indicates scraping failed
+        author_dict["_id"] = author_dict.get("author_id")
+        self._author_writer.add(author_dict)
+        self._hold(AUTHOR, author_dict["_id"], (AUTHOR, author_url))  # still queued until then
+        book_recorded, author_recorded = self._count_recorded()
+        print(f"Currently recorded {book_recorded} books, "
+              f"and {author_recorded} authors.")
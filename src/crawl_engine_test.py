@@ -0,0 +1,336 @@
+"""
+Test the crawl engine with fake scrapers and collections, parsing in threads,
+and with the real scrapers on the saved pages, parsing in a process pool.
+"""
+import contextlib
+import functools
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from pymongo.errors import BulkWriteError
+import crawl_engine
+from bulk_writer import BufferedWriter
+from checkpoint_log import CheckpointLog, replay, POP, BOOK, AUTHOR
+from bfs_scrape import load_progress
+from crawl_engine import CrawlEngine, MAX_CONTINUOUS_FAILURE
+from frontier import Frontier
+from book_scraper import BookScraper
+from author_scraper import AuthorScraper
+from parse_benchmark import load_pages
+
+HTML_PATH = "../HTML/"
+
+
+def book_url(number):
+    return f"https://www.goodreads.com/book/show/{number}"
+
+
+def author_url(number):
+    return f"https://www.goodreads.com/author/show/{number}"
+
+
+class FakeResult:
+    """Minimal stand-in of pymongo BulkWriteResult."""
+
+    def __init__(self, upserted_count):
+        self.upserted_count = upserted_count
+
+
+class FakeCollection:
+    """Keep the upserted documents by _id, failing the writes of failing_ids."""
+
+    def __init__(self, name, failing_ids=()):
+        self.name = name
+        self.failing_ids = set(failing_ids)
+        self.documents = {}
+
+    def count_documents(self, query):
+        return len(self.documents)
+
+    def bulk_write(self, requests, ordered=True):
+        inserted, errors = 0, []
+        for index, request in enumerate(requests):
+            _id = request._filter["_id"]
+            if _id in self.failing_ids:
+                errors.append({"index": index, "errmsg": "bad document"})
+            elif _id not in self.documents:
+                self.documents[_id] = request._doc["$setOnInsert"]
+                inserted += 1
+        if errors:
+            raise BulkWriteError({"nUpserted": inserted, "writeErrors": errors})
+        return FakeResult(inserted)
+
+
+class FakeBookScraper:
+    """
+    Book i links to the books similar[i] and is written by author i % authors.
+    The pages are the urls themselves, parsing never touches html.
+    """
+
+    def __init__(self, similar, authors=3, failing=(), on_fetch=None):
+        self.similar = similar
+        self.authors = authors
+        self.failing = set(failing)
+        self.on_fetch = on_fetch
+        self.fetched = []
+
+    def is_legal_book_url(self, url):
+        return True
+
+    def fetch_html(self, url):
+        self.fetched.append(url)
+        if self.on_fetch is not None:
+            self.on_fetch(url)
+        if url in self.failing:
+            raise IOError("blocked")
+        return url
+
+    def scrape_book_from_html(self, url, html_src):
+        number = int(url.rsplit("/", 1)[1])
+        return {"book_id": url, "book_title": f"Book {number}",
+                "author_url": author_url(number % self.authors),
+                "similar_book_urls": [book_url(other) for other in self.similar[number]]}
+
+
+class FakeAuthorScraper:
+    """Author pages without sub-pages, parsed from their url."""
+
+    def __init__(self, on_fetch=None):
+        self.on_fetch = on_fetch
+        self.fetched = []
+
+    def construct_sub_page_urls(self, url):
+        return {}
+
+    def fetch_html(self, url):
+        self.fetched.append(url)
+        if self.on_fetch is not None:
+            self.on_fetch(url)
+        return url
+
+    def scrape_author_from_html(self, url, html_src, sub_pages=None):
+        return {"author_id": url, "author_name": url}
+
+
+class FakeCheckpoint:
+    """Record the progress records, checking stored documents are written first."""
+
+    def __init__(self, book_db, author_db):
+        self.book_db = book_db
+        self.author_db = author_db
+        self.records = []
+
+    def record(self, op, value):
+        if op == BOOK:
+            assert value in written_urls(self.book_db, "book_url"),\
+                f"{value} checkpointed before written"
+        elif op == AUTHOR:
+            assert value in written_urls(self.author_db, "author_url"),\
+                f"{value} checkpointed before written"
+        self.records.append((op, value))
+
+    def is_due(self):
+        return False
+
+
+def written_urls(collection, url_field):
+    """:return: the urls of the documents written, the fakes use them as ids"""
+    return set(collection.documents) | {document.get(url_field)
+                                        for document in collection.documents.values()}
+
+
+class SavedPages:
+    """Fetcher of the scrapers serving the saved pages, failing on any other url."""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def fetch(self, url):
+        if url not in self.pages:
+            raise IOError(f"{url} is not saved")
+        return self.pages[url]
+
+
+def chain(length):
+    """:return: similar books of a chain of length books, each linking to the next one"""
+    return {number: [number + 1] if number + 1 < length else [] for number in range(length)}
+
+
+class TestCrawlEngine(unittest.TestCase):
+    """
+    Unit test class wrapper for crawl engine tests.
+    """
+
+    def crawl(self, book_scraper, author_scraper=None, start=(0,), book_db=None,
+              start_urls=None, parse_processes=0, **kwargs):
+        """Run a crawl silently from the start books (or start_urls), return the engine."""
+        self.book_db = book_db or FakeCollection("books")
+        self.author_db = FakeCollection("authors")
+        self.checkpoint = FakeCheckpoint(self.book_db, self.author_db)
+        start_urls = start_urls or [book_url(number) for number in start]
+        engine = CrawlEngine(book_scraper, author_scraper or FakeAuthorScraper(),
+                             self.book_db, self.author_db, Frontier(start_urls), set(), set(),
+                             checkpoint=self.checkpoint, parse_processes=parse_processes,
+                             **kwargs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine.run()
+        return engine
+
+    def test_drains_the_queue(self):
+        """
+        Test every book reachable from the start is stored once, with its author.
+        """
+        similar = {0: [1, 2], 1: [2, 3], 2: [0], 3: [1]}
+        engine = self.crawl(FakeBookScraper(similar), max_book=100, max_author=100)
+        self.assertEqual(set(self.book_db.documents), {book_url(number) for number in similar})
+        self.assertEqual(set(self.author_db.documents), {author_url(0), author_url(1),
+                                                         author_url(2)})
+        self.assertEqual(engine.visited_books, set(self.book_db.documents))
+        self.assertEqual(engine.visited_authors, set(self.author_db.documents))
+
+    def test_max_book_and_max_author(self):
+        """
+        Test the crawl stops once both max criterions are reached.
+        """
+        self.crawl(FakeBookScraper(chain(50)), max_book=5, max_author=2, workers=1)
+        self.assertGreaterEqual(len(self.book_db.documents), 5)
+        self.assertLess(len(self.book_db.documents), 50)
+        self.assertGreaterEqual(len(self.author_db.documents), 2)
+
+    def test_continuous_failures(self):
+        """
+        Test the crawl stops after MAX_CONTINUOUS_FAILURE failures in a row.
+        """
+        book_scraper = FakeBookScraper(chain(20), failing=[book_url(n) for n in range(20)])
+        self.crawl(book_scraper, start=range(20), workers=1)
+        self.assertEqual(len(book_scraper.fetched), MAX_CONTINUOUS_FAILURE)
+        self.assertEqual(self.book_db.documents, {})
+        self.assertEqual(self.checkpoint.records[-1][0], POP)
+
+    def test_failed_book_is_retried(self):
+        """
+        Test a book failing once is queued again and stored on its second try.
+        """
+        failures = []
+
+        def fail_once(url):
+            if url == book_url(1) and not failures:
+                failures.append(url)
+                raise IOError("blocked")
+        self.crawl(FakeBookScraper(chain(3), on_fetch=fail_once), workers=1)
+        self.assertEqual(set(self.book_db.documents), {book_url(0), book_url(1), book_url(2)})
+
+    def test_authors_are_scheduled_once(self):
+        """
+        Test an author shared by many books is fetched and stored once.
+        """
+        author_scraper = FakeAuthorScraper()
+        self.crawl(FakeBookScraper(chain(6), authors=1), author_scraper)
+        self.assertEqual(author_scraper.fetched, [author_url(0)])
+        self.assertEqual(set(self.author_db.documents), {author_url(0)})
+
+    def test_flush_on_idle(self):
+        """
+        Test buffered books are written while the crawl waits on a slow page,
+        and checkpointed only once written.
+        """
+        written_while_busy = []
+
+        def wait_for_book(url):
+            deadline = time.monotonic() + 5
+            while not self.book_db.documents and time.monotonic() < deadline:
+                time.sleep(0.05)
+            written_while_busy.append(bool(self.book_db.documents))
+        quick_writer = functools.partial(BufferedWriter, flush_interval=0.1)
+        with mock.patch.object(crawl_engine, "BufferedWriter", quick_writer):
+            self.crawl(FakeBookScraper(chain(1)), FakeAuthorScraper(on_fetch=wait_for_book))
+        self.assertEqual(written_while_busy, [True])
+        self.assertIn((BOOK, book_url(0)), self.checkpoint.records)
+
+    def test_failed_write_is_not_checkpointed(self):
+        """
+        Test a book whose write failed is neither visited nor checkpointed.
+        """
+        book_db = FakeCollection("books", failing_ids=[book_url(1)])
+        engine = self.crawl(FakeBookScraper(chain(3)), book_db=book_db)
+        self.assertEqual(set(book_db.documents), {book_url(0), book_url(2)})
+        self.assertNotIn(book_url(1), engine.visited_books)
+        self.assertNotIn((BOOK, book_url(1)), self.checkpoint.records)
+        self.assertIn((BOOK, book_url(2)), self.checkpoint.records)
+
+    def test_parse_in_processes(self):
+        """
+        Test the real scrapers parse the saved pages in a process pool,
+        storing the same documents as when parsing in threads.
+        """
+        fetcher = SavedPages(load_pages(HTML_PATH))
+        start_urls = [url for url in fetcher.pages if BookScraper(fetcher).is_legal_book_url(url)]
+        stored = []
+        for parse_processes in (0, 1):
+            self.crawl(BookScraper(fetcher, parser="xpath"),
+                       AuthorScraper(fetcher, parser="xpath"), start_urls=start_urls, parse_processes=parse_processes,
+                       max_book=len(start_urls), max_author=1)
+            for author in self.author_db.documents.values():  # built from sets, any order
+                author["author_books"].sort()
+                author["related_authors"].sort()
+            stored.append((self.book_db.documents, self.author_db.documents))
+        self.assertEqual(stored[0], stored[1])
+        self.assertEqual(len(stored[1][0]), len(start_urls))
+        self.assertEqual(len(stored[1][1]), 1)
+
+    def test_compaction_in_thread(self):
+        """
+        Test the checkpoint log is compacted off the event loop while crawling,
+        and the progress replayed from it is the crawled one.
+        """
+        compacting_threads = []
+        write_compaction = CheckpointLog.write_compaction
+
+        def record_thread(log, state):
+            compacting_threads.append(threading.current_thread())
+            write_compaction(log, state)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            progress_dir = tmp_dir + os.sep
+            bfs_queue, visited_books, visited_authors = Frontier([book_url(0)]), set(), set()
+            checkpoint = CheckpointLog(progress_dir, bfs_queue, visited_books, visited_authors,
+                                       compact_every=3)
+            engine = CrawlEngine(FakeBookScraper(chain(12)), FakeAuthorScraper(),
+                                 FakeCollection("books"), FakeCollection("authors"),
+                                 bfs_queue, visited_books, visited_authors,
+                                 checkpoint=checkpoint, parse_processes=0,
+                                 max_book=12, max_author=3, workers=1)
+            with mock.patch.object(CheckpointLog, "write_compaction", record_thread), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                engine.run()
+            queued, books, authors = load_progress(progress_dir)  # as if it crashed here
+            replayed = Frontier(queued, seen=books)
+            replay(progress_dir, replayed, books, authors)
+            checkpoint.close()
+        self.assertTrue(compacting_threads)
+        self.assertNotIn(threading.main_thread(), compacting_threads)
+        self.assertEqual((list(replayed), books, authors),
+                         (list(bfs_queue), visited_books, visited_authors))
+        self.assertEqual(len(books), 12)
+
+    def test_cancellation(self):
+        """
+        Test no page is fetched once cancelled, and the pages in flight are still stored.
+        """
+        cancel_event = threading.Event()
+
+        def cancel_at_third_book(url):
+            if url == book_url(2):
+                cancel_event.set()
+        book_scraper = FakeBookScraper(chain(50), on_fetch=cancel_at_third_book)
+        self.crawl(book_scraper, max_book=50, max_author=50, workers=1,
+                   cancel_event=cancel_event)
+        self.assertEqual(book_scraper.fetched, [book_url(0), book_url(1), book_url(2)])
+        self.assertEqual(set(self.book_db.documents), set(book_scraper.fetched))
+
+
+if __name__ == "__main__":
+    unittest.main()
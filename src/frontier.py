@@ -0,0 +1,146 @@
+"""
+The BFS frontier (queue of book urls to visit) of the scraper.
+Pops in O(1), drops urls that were already queued or visited,
+and spills to a text file on disk once it grows past a memory threshold.
+Urls are deduplicated by an 8-byte digest instead of the url itself,
+so the seen set costs about 70 bytes per url (~70 MB per million urls) whatever
+the length of the urls. It still grows with every url ever queued. If two urls share a digest
+(less than 1 in 10^7 over a million urls), the second one is never queued.
+"""
+import hashlib
+import os
+from collections import deque
+
+MAX_IN_MEMORY = 10000  # urls kept in memory before spilling to disk
+
+
+def url_digest(url):
+    """:return: fixed-size digest of url, what the seen set of a Frontier keeps"""
+    return int.from_bytes(hashlib.blake2b(url.encode(), digest_size=8).digest(), "big")
+
+
+class Frontier:
+    """
+    FIFO queue of urls with dedup on enqueue.
+    The head of the queue lives in a deque, the tail is appended to
+    spill_path (one url per line) and read back in chunks when the head runs dry.
+    The spill file stays open for appending until it is read back, call close when done.
+    """
+
+    def __init__(self, urls=(), seen=(), spill_path=None, max_in_memory=MAX_IN_MEMORY):
+        """
+        :param urls: initial urls of the queue, in order
+        :param seen: urls that must never be enqueued again (e.g. visited books)
+        :param spill_path: file used for the spilled tail, None to keep everything in memory
+        :param max_in_memory: number of urls kept in memory
+        """
+        self._head = deque()
+        self._seen = {url_digest(url) for url in seen}
+        self._spill_path = spill_path
+        self._max_in_memory = max_in_memory
+        self._spilled = 0  # urls in the spill file not read back yet
+        self._spill_offset = 0  # where the next read of the spill file starts
+        self._spill_file = None  # append handle, open while spilling
+        if spill_path is not None and os.path.exists(spill_path):
+            os.remove(spill_path)  # left over from a previous run, urls passed again here
+        self.extend(urls)
+
+    def __len__(self):
+        return len(self._head) + self._spilled
+
+    def __iter__(self):
+        """Iterate all queued urls in order, without consuming them."""
+        yield from list(self._head)
+        if self._spilled:
+            if self._spill_file is not None:
+                self._spill_file.flush()
+            with open(self._spill_path, "r") as file:
+                file.seek(self._spill_offset)
+                for line in file:
+                    yield line.rstrip("\n")
+
+    def __contains__(self, url):
+        return url_digest(url) in self._seen
+
+    def push(self, url):
+        """
+        Enqueue url unless it was queued or visited before.
+        :return: True if url is enqueued
+        """
+        digest = url_digest(url)
+        if digest in self._seen:
+            return False
+        self._seen.add(digest)
+        self._append(url)
+        return True
+
+    def extend(self, urls):
+        """
+        Enqueue every url not seen before.
+        :return: list of the urls actually enqueued
+        """
+        return [url for url in urls if self.push(url)]
+
+    def push_front(self, url):
+        """Put url at the head of the queue, even if it was seen before."""
+        self._seen.add(url_digest(url))
+        self._head.appendleft(url)
+
+    def retry(self, url):
+        """Put url back at the tail of the queue, e.g. after its scraping failed."""
+        self._seen.add(url_digest(url))
+        self._append(url)
+
+    def mark_seen(self, url):
+        """Make sure url will never be enqueued, e.g. once it is visited."""
+        self._seen.add(url_digest(url))
+
+    def pop(self):
+        """
+        Dequeue the oldest url.
+        :return: url at the head of the queue, raise IndexError if empty
+        """
+        if not self._head and self._spilled:
+            self._load_spilled()
+        return self._head.popleft()
+
+    def peek(self):
+        """
+        :return: url at the head of the queue without dequeuing it, raise IndexError if empty
+        """
+        if not self._head and self._spilled:
+            self._load_spilled()
+        return self._head[0]
+
+    def _append(self, url):
+        if self._spilled or len(self._head) >= self._max_in_memory:
+            if self._spill_path is not None:
+                self._spill(url)
+                return
+        self._head.append(url)
+
+    def close(self):
+        """Close the spill file, the queued urls stay readable."""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def _spill(self, url):
+        if self._spill_file is None:
+            self._spill_file = open(self._spill_path, "a")
+        self._spill_file.write(url + "\n")
+        self._spilled += 1
+
+    def _load_spilled(self):
+        """Move the next chunk of spilled urls back into memory."""
+        self.close()  # flushed for reading, reopened by the next spill
+        chunk = max(1, self._max_in_memory // 2)
+        with open(self._spill_path, "r") as file:
+            file.seek(self._spill_offset)
+            while len(self._head) < chunk and self._spilled:
+                self._head.append(file.readline().rstrip("\n"))
+                self._spilled -= 1
+            self._spill_offset = file.tell()
+        if not self._spilled:  # fully read back, start a new file next time
+            os.remove(self._spill_path)
+            self._spill_offset = 0
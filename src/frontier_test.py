@@ -0,0 +1,95 @@
+"""
+Test the BFS frontier keeps FIFO order, dedups and spills to disk correctly.
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+from frontier import Frontier, url_digest
+
+
+class TestFrontier(unittest.TestCase):
+    """
+    Test behavior of the Frontier queue.
+    """
+
+    def test_fifo_and_dedup(self):
+        """
+        Urls should come out in order, and queued or seen urls are not enqueued twice.
+        """
+        frontier = Frontier(["a", "b", "a"], seen={"visited"})
+        self.assertEqual(frontier.extend(["b", "c", "visited", "c"]), ["c"])
+        self.assertEqual(len(frontier), 3)
+        self.assertEqual([frontier.pop() for _ in range(3)], ["a", "b", "c"])
+        self.assertRaises(IndexError, frontier.pop)
+        self.assertFalse(frontier.push("a"))  # popped urls are still seen
+
+    def test_push_front(self):
+        """
+        A new start url should be scraped first.
+        """
+        frontier = Frontier(["a", "b"])
+        frontier.push_front("start")
+        self.assertEqual(list(frontier), ["start", "a", "b"])
+
+    def test_retry(self):
+        """
+        A failed url goes back to the tail of the queue although it was seen.
+        """
+        frontier = Frontier(["a", "b"])
+        failed = frontier.pop()
+        self.assertFalse(frontier.push(failed))
+        frontier.retry(failed)
+        self.assertEqual(list(frontier), ["b", "a"])
+
+    def test_seen_keeps_digests(self):
+        """
+        The seen set should hold fixed-size digests, not the urls.
+        """
+        long_url = "https://www.goodreads.com/book/show/" + "x" * 500
+        frontier = Frontier([long_url], seen={"visited"})
+        self.assertIn(long_url, frontier)
+        self.assertIn("visited", frontier)
+        self.assertNotIn("other", frontier)
+        self.assertIn(url_digest(long_url), frontier._seen)
+        self.assertNotIn(long_url, frontier._seen)
+
+    def test_spill_to_disk(self):
+        """
+        Urls past max_in_memory go to the spill file and keep their order.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            spill_path = os.path.join(tmp_dir, "spill.txt")
+            urls = [f"url{i}" for i in range(25)]
+            frontier = Frontier(urls[:10], spill_path=spill_path, max_in_memory=4)
+            frontier.extend(urls[10:])
+            self.assertEqual(len(frontier._head), 4)
+            self.assertTrue(os.path.exists(spill_path))
+            self.assertEqual(list(frontier), urls)
+            self.assertEqual(len(frontier), 25)
+
+            popped = [frontier.pop() for _ in range(12)]
+            frontier.push("late")
+            popped += [frontier.pop() for _ in range(14)]
+            self.assertEqual(popped, urls + ["late"])
+            self.assertEqual(len(frontier), 0)
+            self.assertFalse(os.path.exists(spill_path))
+
+    def test_spill_file_opened_once(self):
+        """
+        Spilling many urls should open the spill file once, until it is read back.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            spill_path = os.path.join(tmp_dir, "spill.txt")
+            frontier = Frontier(spill_path=spill_path, max_in_memory=2)
+            with mock.patch("builtins.open", wraps=open) as opened:
+                frontier.extend(f"url{i}" for i in range(100))
+            self.assertEqual(opened.call_count, 1)
+            self.assertEqual(list(frontier)[-1], "url99")  # flushed before reading
+            frontier.pop()
+            frontier.close()
+            self.assertEqual(len(list(frontier)), 99)
+
+
+if __name__ == "__main__":
+    unittest.main()
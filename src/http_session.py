@@ -0,0 +1,67 @@
+"""
+HTTP session layer of the scrapers.
+A requests.Session keeps TCP/TLS connections to goodreads.com alive
+and pooled across requests, asks for compressed pages and retries
+transient server and connection errors.
+"""
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:  # urllib3 only decodes brotli when one of these is installed
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+POOL_CONNECTIONS = 4  # number of hosts with a connection pool
+POOL_MAXSIZE = 16  # connections kept alive per host, >= concurrent downloads
+MAX_RETRIES = 3  # retries of connection errors and 500 / 502 / 504
+BACKOFF_FACTOR = 0.5  # sleep 0.5s, 1s, 2s ... between those retries
+TIMEOUT = (5, 30)  # (connect, read) timeout in seconds
+
+
+def build_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                  max_retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """
+    Build a keep-alive session with connection pooling, compression and retries.
+    429 / 503 are left to the rate limiter, which has to slow down on them.
+    :param pool_connections: number of hosts with a connection pool
+    :param pool_maxsize: connections kept alive per host
+    :param max_retries: retries of connection errors and 500 / 502 / 504
+    :param backoff_factor: exponential backoff between retries
+    :return: a configured requests.Session
+    """
+    retry = Retry(total=max_retries, connect=max_retries, read=max_retries,
+                  status=max_retries, backoff_factor=backoff_factor,
+                  status_forcelist=(500, 502, 504), raise_on_status=False,
+                  respect_retry_after_header=False)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    session.headers["Connection"] = "keep-alive"
+    return session
+
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def get_shared_session():
+    """
+    The session shared by scrapers created without their own one.
+    Created once even when crawler threads ask for it at the same time.
+    """
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = build_session()
+        return _shared_session
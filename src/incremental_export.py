@@ -0,0 +1,193 @@
+"""
+Incremental export of the databases.
+A full export saves, next to the json snapshot, the resume token of the
+collection's change stream taken right before the dump. Later exports only
+write the documents inserted, updated or deleted since that token to a
+delta NDJSON file, which merge_deltas applies to the snapshot.
+If the token is missing or the changes are no longer available (oplog rolled
+over, collection dropped), a full export is done instead.
+"""
+import datetime
+import glob
+import json
+import os
+from pymongo.errors import OperationFailure
+import mongo_manipulator
+from mongo_manipulator import connect_to_mongo, dump, write_documents
+from update import iter_json_records
+
+UPSERT, DELETE = "upsert", "delete"  # ops of the delta records
+HISTORY_LOST = (280, 286)  # ChangeStreamFatalError, ChangeStreamHistoryLost
+END_OF_STREAM = ("drop", "rename", "dropDatabase", "invalidate")
+CHANGE_WAIT_MS = 1000  # how long to wait for more changes before the delta is complete
+
+
+def _path(name, suffix):
+    return mongo_manipulator.JSON_PATH + name + suffix
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def load_resume_token(name):
+    """
+    :param name: name of the export, e.g. "book_db"
+    :return: the resume token saved by the last export, or None
+    """
+    try:
+        with open(_path(name, ".resume_token.json"), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_resume_token(name, token):
+    """Atomically save the resume token of the export name."""
+    path = _path(name, ".resume_token.json")
+    with open(path + ".tmp", "w") as file:
+        json.dump(token, file)
+    os.replace(path + ".tmp", path)
+
+
+def delta_files(name):
+    """Pending delta files of the export name, oldest first."""
+    return sorted(glob.glob(_path(name, ".delta-*.ndjson")))
+
+
+def full_export(db_to_dump, name):
+    """
+    Dump db_to_dump to name.json, and save the resume token to export changes from.
+    The change stream is opened before the dump, so changes made while dumping
+    are exported again next time, which is harmless as they are applied by _id.
+    """
+    with db_to_dump.watch(full_document="updateLookup") as stream:
+        token = stream.resume_token
+    dump(db_to_dump, name + ".json")
+    for path in delta_files(name):
+        os.remove(path)  # older than the new snapshot
+    save_resume_token(name, token)
+
+
+def change_to_record(change):
+    """
+    :param change: a change stream event
+    :return: the delta record {"op", "_id", "doc"} of the change, None to skip it
+    """
+    if change["operationType"] == "delete":
+        return {"op": DELETE, "_id": change["documentKey"]["_id"]}
+    if change.get("fullDocument") is None:
+        return None  # deleted since, its delete event follows
+    return {"op": UPSERT, "_id": change["documentKey"]["_id"], "doc": change["fullDocument"]}
+
+
+def export_changes(db_to_dump, name):
+    """
+    Write the changes of db_to_dump since the last export to a new delta file.
+    :param db_to_dump: target db to dump
+    :param name: name of the export, e.g. "book_db"
+    :return: path of the delta file, None if there was no change or a full export was done
+    """
+    token = load_resume_token(name)
+    if token is None or not os.path.exists(_path(name, ".json")):
+        print(f"No previous export of {name}, doing a full export.")
+        full_export(db_to_dump, name)
+        return None
+
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    delta_path = _path(name, f".delta-{stamp}.ndjson")
+    tmp_path = delta_path + ".tmp"
+    count, history_lost = 0, False
+    try:
+        with db_to_dump.watch(full_document="updateLookup", resume_after=token,
+                              max_await_time_ms=CHANGE_WAIT_MS) as stream,\
+                open(tmp_path, "w") as file:
+            while True:
+                change = stream.try_next()
+                if change is None:
+                    break  # caught up
+                if change["operationType"] in END_OF_STREAM:
+                    history_lost = True
+                    break
+                record = change_to_record(change)
+                if record is None:
+                    continue
+                json.dump(record, file)
+                file.write("\n")
+                count += 1
+            token = stream.resume_token
+    except OperationFailure as err:
+        if err.code not in HISTORY_LOST:
+            _remove(tmp_path)
+            raise
+        history_lost = True
+
+    if history_lost or count == 0:
+        _remove(tmp_path)
+    if history_lost:
+        print(f"Changes of {name} since last export are not available, doing a full export.")
+        full_export(db_to_dump, name)
+        return None
+    save_resume_token(name, token)
+    if count == 0:
+        print(f"No change in {name} since last export.")
+        return None
+    os.replace(tmp_path, delta_path)
+    print(f"Successfully exported {count} changes of {name} to {delta_path}")
+    return delta_path
+
+
+def merge_deltas(name):
+    """
+    Apply the pending delta files of name to its json snapshot, then delete them.
+    Only the changes are held in memory, the snapshot is streamed.
+    :param name: name of the export, e.g. "book_db"
+    :return: number of documents in the merged snapshot, None if there was nothing to merge
+    """
+    paths = delta_files(name)
+    if not paths:
+        print(f"No delta of {name} to merge.")
+        return None
+    changes = {}  # _id -> last change of the document
+    for path in paths:
+        with open(path, "r") as file:
+            for record in iter_json_records(file):
+                changes[record["_id"]] = record
+
+    def merged(documents):
+        for document in documents:
+            change = changes.pop(document["_id"], None)
+            if change is None:
+                yield document
+            elif change["op"] == UPSERT:
+                yield change["doc"]
+        for change in changes.values():  # inserted documents
+            if change["op"] == UPSERT:
+                yield change["doc"]
+
+    snapshot_path = _path(name, ".json")
+    with open(snapshot_path, "r") as src, open(snapshot_path + ".tmp", "w") as dst:
+        count = write_documents(dst, merged(iter_json_records(src)))
+    os.replace(snapshot_path + ".tmp", snapshot_path)
+    for path in paths:
+        os.remove(path)
+    print(f"Successfully merged {len(paths)} deltas into {snapshot_path}")
+    return count
+
+
+def export_db_changes(db_choice, merge=False):
+    """
+    Incremental version of mongo_manipulator.dump_db.
+    :param db_choice: "book", "author", or "all"
+    :param merge: merge the deltas into the json snapshots right away
+    """
+    book_db, author_db = connect_to_mongo()
+    if db_choice in ("book", "all"):
+        export_changes(book_db, "book_db")
+        if merge:
+            merge_deltas("book_db")
+    if db_choice in ("author", "all"):
+        export_changes(author_db, "author_db")
+        if merge:
+            merge_deltas("author_db")
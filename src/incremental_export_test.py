@@ -0,0 +1,117 @@
+"""
+Test incremental exports write and merge the changes since the last export.
+"""
+import json
+import os
+import tempfile
+import unittest
+from pymongo.errors import OperationFailure
+import mongo_manipulator
+from incremental_export import export_changes, merge_deltas, load_resume_token
+
+
+class FakeChangeStream:
+    """Minimal stand-in of a pymongo ChangeStream over a list of events."""
+
+    def __init__(self, events):
+        self.events = list(events)
+        self.resume_token = {"_data": str(len(events))}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def try_next(self):
+        return self.events.pop(0) if self.events else None
+
+
+class FakeCollection:
+    """Documents of a collection, and the change events to watch."""
+
+    def __init__(self, documents, events=(), error=None):
+        self.documents = documents
+        self.events = events
+        self.error = error
+
+    def find(self, query, projection=None):
+        return FakeCursor(self.documents)
+
+    def watch(self, **kwargs):
+        if self.error is not None and "resume_after" in kwargs:
+            raise self.error
+        return FakeChangeStream(self.events if "resume_after" in kwargs else [])
+
+
+class FakeCursor(list):
+    """Minimal stand-in of a pymongo Cursor."""
+
+    def batch_size(self, size):
+        return self
+
+
+def change(op, _id, doc=None):
+    """A change event as sent by the server."""
+    return {"operationType": op, "documentKey": {"_id": _id}, "fullDocument": doc}
+
+
+class TestIncrementalExport(unittest.TestCase):
+    """
+    Test delta files, resume tokens and the full export fallback.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_path = mongo_manipulator.JSON_PATH
+        mongo_manipulator.JSON_PATH = self.tmp_dir.name + "/"
+
+    def tearDown(self):
+        mongo_manipulator.JSON_PATH = self.json_path
+        self.tmp_dir.cleanup()
+
+    def load_snapshot(self):
+        with open(mongo_manipulator.JSON_PATH + "book_db.json", "r") as file:
+            return json.load(file)
+
+    def test_first_export_is_full(self):
+        """
+        Without a resume token, the whole collection should be dumped.
+        """
+        documents = [{"_id": "1"}, {"_id": "2"}]
+        self.assertIsNone(export_changes(FakeCollection(documents), "book_db"))
+        self.assertEqual(self.load_snapshot(), documents)
+        self.assertEqual(load_resume_token("book_db"), {"_data": "0"})
+
+    def test_delta_merged_into_snapshot(self):
+        """
+        Inserted, updated and deleted documents should end up in the merged snapshot.
+        """
+        export_changes(FakeCollection([{"_id": "1"}, {"_id": "2"}]), "book_db")
+        events = [change("insert", "3", {"_id": "3"}),
+                  change("update", "1", {"_id": "1", "book_title": "new"}),
+                  change("delete", "2"),
+                  change("update", "4")]  # deleted after the update, skipped
+        delta_path = export_changes(FakeCollection([], events), "book_db")
+        with open(delta_path, "r") as file:
+            self.assertEqual(len(file.readlines()), 3)
+        self.assertEqual(load_resume_token("book_db"), {"_data": "4"})
+        self.assertEqual(merge_deltas("book_db"), 2)
+        self.assertEqual(self.load_snapshot(), [{"_id": "1", "book_title": "new"},
+                                                {"_id": "3"}])
+        self.assertIsNone(merge_deltas("book_db"))  # deltas removed once merged
+
+    def test_history_lost(self):
+        """
+        A full export should be done if the changes are no longer available.
+        """
+        export_changes(FakeCollection([{"_id": "1"}]), "book_db")
+        error = OperationFailure("resume point lost", code=286)
+        export_changes(FakeCollection([{"_id": "2"}], error=error), "book_db")
+        self.assertEqual(self.load_snapshot(), [{"_id": "2"}])
+        self.assertEqual(sorted(os.listdir(mongo_manipulator.JSON_PATH)),
+                         ["book_db.json", "book_db.resume_token.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
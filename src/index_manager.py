@@ -0,0 +1,115 @@
+"""
+Indexes of the books and authors collections.
+INDEX_SPECS declares them, ensure_indexes creates the missing ones at startup
+(creating an existing index is a no-op for mongo).
+With EXPLAIN_QUERIES=1 in .env, the winning plan of every new query plan
+of the interpreter is printed, with a warning for collection scans.
+Explaining runs every new query one more time, so it is off by default.
+The text indexes serve the HAS "words" queries of the interpreter: they are
+built without language (no stemming, no stop words), so a document holding a
+whole word in a TEXT_FIELDS attribute is always found by $text.
+"""
+import os
+import json
+import threading
+from dotenv import load_dotenv
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import PyMongoError
+from mongo_manipulator import connect_to_mongo
+
+load_dotenv()
+EXPLAIN_QUERIES = os.getenv("EXPLAIN_QUERIES", "0") == "1"
+EXPLAINED_MAX = 1024  # queries remembered as explained
+# attributes of the text index of each collection, one text index per collection
+TEXT_FIELDS = {"books": ("book_title", "author_name"), "authors": ("author_name",)}
+
+INDEX_SPECS = {
+    "books": [
+        IndexModel([("rating_value", DESCENDING)], name="rating_value"),
+        IndexModel([("rating_count", DESCENDING)], name="rating_count"),
+        IndexModel([("review_count", DESCENDING)], name="review_count"),
+        IndexModel([("book_title", ASCENDING)], name="book_title"),
+        IndexModel([("author_url", ASCENDING)], name="author_url"),
+        # books of an author by rating, also serves queries on author_name alone
+        IndexModel([("author_name", ASCENDING), ("rating_value", DESCENDING)],
+                   name="author_name_rating_value"),
+        IndexModel([("similar_book_urls", ASCENDING)], name="similar_book_urls"),  # multikey
+        IndexModel([(field, TEXT) for field in TEXT_FIELDS["books"]], name="text",
+                   default_language="none"),
+    ],
+    "authors": [
+        IndexModel([("rating_value", DESCENDING)], name="rating_value"),
+        IndexModel([("rating_count", DESCENDING)], name="rating_count"),
+        IndexModel([("review_count", DESCENDING)], name="review_count"),
+        IndexModel([("author_name", ASCENDING)], name="author_name"),
+        IndexModel([("author_url", ASCENDING)], name="author_url"),
+        IndexModel([("related_authors", ASCENDING)], name="related_authors"),  # multikey
+        IndexModel([("author_books", ASCENDING)], name="author_books"),  # multikey
+        IndexModel([(field, TEXT) for field in TEXT_FIELDS["authors"]], name="text",
+                   default_language="none"),
+    ],
+}
+
+_explained_lock = threading.Lock()
+_explained = set()  # (collection name, filter) already explained
+
+
+def ensure_indexes(collections=None):
+    """
+    Create the indexes of INDEX_SPECS, failures are printed and skipped.
+    :param collections: the collections to index, defaults to books and authors
+    :return: names of the indexes of every collection
+    """
+    collections = collections if collections is not None else connect_to_mongo()
+    created = {}
+    for collection in collections:
+        specs = INDEX_SPECS.get(collection.name, [])
+        try:
+            created[collection.name] = collection.create_indexes(specs) if specs else []
+        except PyMongoError as err:
+            # e.g. an index of the same name was created by hand with other options
+            print(f"Creating indexes of {collection.name} failed: {err}")
+    return created
+
+
+def summarize_plan(stage):
+    """
+    :param stage: the winningPlan of an explain output
+    :return: the stages of the plan from the leaves up, e.g. "IXSCAN rating_value -> FETCH"
+    """
+    stage = stage.get("queryPlan", stage)  # slot based engine nests the plan
+    inputs = stage.get("inputStages") or ([stage["inputStage"]] if "inputStage" in stage else [])
+    children = [summarize_plan(child) for child in inputs]
+    name = stage.get("stage", "?")
+    if "indexName" in stage:
+        name += " " + stage["indexName"]
+    if len(children) > 1:
+        return "(" + " | ".join(children) + ") -> " + name
+    return (children[0] + " -> " + name) if children else name
+
+
+def explain_query(collection, mongo_query):
+    """
+    Print how mongo runs mongo_query, once per collection and query.
+    :param collection: the queried collection
+    :param mongo_query: the mongo filter
+    :return: the summary of the winning plan, None if already explained or explain failed
+    """
+    key = (collection.name, json.dumps(mongo_query, sort_keys=True, default=str))
+    with _explained_lock:
+        if key in _explained:
+            return None
+        if len(_explained) >= EXPLAINED_MAX:
+            _explained.clear()
+        _explained.add(key)
+    try:
+        winning_plan = collection.find(mongo_query).explain()["queryPlanner"]["winningPlan"]
+    except (PyMongoError, KeyError) as err:
+        print(f"Explaining {key[1]} failed: {err}")
+        return None
+    summary = summarize_plan(winning_plan)
+    print(f"Query plan on {collection.name} for {key[1]}: {summary}")
+    if "COLLSCAN" in summary:
+        print(f"WARNING: {key[1]} scans the whole {collection.name} collection,"
+              f" consider adding an index to index_manager.INDEX_SPECS.")
+    return summary
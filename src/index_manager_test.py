@@ -0,0 +1,91 @@
+"""
+Test index creation and the summary of explained query plans.
+"""
+import unittest
+from pymongo.errors import OperationFailure
+from index_manager import ensure_indexes, summarize_plan, explain_query, INDEX_SPECS,\
+    TEXT_FIELDS
+
+IXSCAN_PLAN = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "rating_value"}}
+OR_PLAN = {"stage": "SUBPLAN", "inputStage": {"stage": "OR", "inputStages": [
+    {"stage": "IXSCAN", "indexName": "rating_count"}, {"stage": "COLLSCAN"}]}}
+
+
+class FakeCursor:
+    """Minimal stand-in of a pymongo Cursor."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def explain(self):
+        self.collection.explained += 1
+        return {"queryPlanner": {"winningPlan": self.collection.plan}}
+
+
+class FakeCollection:
+    """Remember created indexes and serve a canned winning plan."""
+
+    def __init__(self, name, plan=None, error=None):
+        self.name = name
+        self.plan = plan
+        self.error = error
+        self.explained = 0
+
+    def create_indexes(self, specs):
+        if self.error is not None:
+            raise self.error
+        return [spec.document["name"] for spec in specs]
+
+    def find(self, query):
+        return FakeCursor(self)
+
+
+class TestIndexManager(unittest.TestCase):
+    """
+    Test the index manager against fake collections.
+    """
+
+    def test_ensure_indexes(self):
+        """
+        Every declared index should be created, a failing collection should not stop the others.
+        """
+        failing = FakeCollection("books", error=OperationFailure("conflict"))
+        created = ensure_indexes([failing, FakeCollection("authors")])
+        self.assertEqual(created, {"authors": [spec.document["name"]
+                                               for spec in INDEX_SPECS["authors"]]})
+
+    def test_text_indexes(self):
+        """
+        Each collection should have one text index, on TEXT_FIELDS, without stemming.
+        """
+        for name, fields in TEXT_FIELDS.items():
+            text_indexes = [spec.document for spec in INDEX_SPECS[name]
+                            if "text" in spec.document["key"].values()]
+            self.assertEqual(len(text_indexes), 1)
+            self.assertEqual(tuple(text_indexes[0]["key"]), fields)
+            self.assertEqual(text_indexes[0]["default_language"], "none")
+
+    def test_summarize_plan(self):
+        """
+        Plans should be summarized from the leaves up, index names included.
+        """
+        self.assertEqual(summarize_plan(IXSCAN_PLAN), "IXSCAN rating_value -> FETCH")
+        self.assertEqual(summarize_plan({"queryPlan": IXSCAN_PLAN}),
+                         "IXSCAN rating_value -> FETCH")
+        self.assertEqual(summarize_plan(OR_PLAN),
+                         "(IXSCAN rating_count | COLLSCAN) -> OR -> SUBPLAN")
+
+    def test_explain_once(self):
+        """
+        A query should only be explained the first time it runs.
+        """
+        collection = FakeCollection("books", plan=OR_PLAN)
+        query = {"$or": [{"rating_count": 1}, {"isbn": "2"}]}
+        self.assertEqual(explain_query(collection, query),
+                         "(IXSCAN rating_count | COLLSCAN) -> OR -> SUBPLAN")
+        self.assertIsNone(explain_query(collection, query))
+        self.assertEqual(collection.explained, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
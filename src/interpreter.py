@@ -1,8 +1,21 @@
 """
 Interpreter for Elastic Search.
+Query strings are parsed by query_parser (boolean expressions of terms)
+and compiled once into a QueryPlan (the mongo filter plus metadata),
+and plans are kept in a bounded LRU cache, so repeated queries
+skip parsing altogether.
+parse_query_string is the former parser of at most two terms, kept for its users.
 """
 import re
+import json
+import base64
+import hashlib
+from collections import namedtuple
+from functools import lru_cache
 from mongo_manipulator import connect_to_mongo
+import query_parser
+import index_manager
+from query_parser import Term, Logic, Not
 
 # These are all trackable attributes for book and author db
 BOOK_ATTRS = ["_id", "book_url", "book_title", "cover_url", "rating_value",
@@ -11,6 +24,22 @@ BOOK_ATTRS = ["_id", "book_url", "book_title", "cover_url", "rating_value",
 AUTHOR_ATTRS = ["_id", "author_name", "author_id", "author_url",
                 "rating_count", "review_count", "rating_value", "image_url",
                 "related_authors", "author_books"]
+NUMERIC_ATTRS = ["rating_value", "rating_count", "review_count"]
+LIST_ATTRS = ["similar_book_urls", "related_authors", "author_books"]  # not sortable
+QUERY_CACHE_SIZE = 256  # compiled query plans kept in memory
+MAX_PAGE_SIZE = 1000  # max results per page
+BSON_SORT_ORDER = ["null", "number", "string", "object", "bool"]  # of the json types
+
+_UNIT_RE = re.compile(r"^(?:\s*)(book|author)\.(\S*)(?:\s*):(?:\s*)(>|<|NOT)?(?:\s*)(.*?)(?:\s*)$")
+_LOGIC_RE = re.compile(r"^(?:\s*)(.*?)(?:\s+)(AND|OR)(?:\s+)(.*?)(?:\s*)$")
+_NUMBER_RE = re.compile(r"^(\d*\.?\d*)$")
+_QUOTED_RE = re.compile(r'^"(.*)"$')
+
+# A compiled query: the mongo filter and what it was compiled from
+QueryPlan = namedtuple("QueryPlan", ["db_type", "filter", "ast"])
+# One page of a plan: what to send to mongo, and how to continue after it
+PageQuery = namedtuple("PageQuery", ["filter", "projection", "sort", "limit",
+                                     "sort_field", "hidden_fields", "fingerprint"])
 
 
 def parse_single_query_unit(pair):
@@ -22,8 +51,7 @@ def parse_single_query_unit(pair):
     :param pair: A single query pair
     :return:
     """
-    match_exp = r"^(?:\s*)(book|author)\.(\S*)(?:\s*):(?:\s*)(>|<|NOT)?(?:\s*)(.*?)(?:\s*)$"
-    matches = re.findall(match_exp, pair)
+    matches = _UNIT_RE.findall(pair)
     # print(matches)
     assert len(matches) == 1, "Sorry, the input query string is malformatted."
     assert len(matches[0]) != 0, "Sorry, the input query string is malformatted."
@@ -43,11 +71,11 @@ def parse_single_query_unit(pair):
 
     # Check for the case when ">" or "<" is given
     if operator == ">" or operator == "<":
-        assert len(re.findall(r"^(\d*\.?\d*)$", query_val)) != 0, \
+        assert len(_NUMBER_RE.findall(query_val)) != 0, \
             "A legal input for the Query value should be a positive number."
     # Check exact matches are be properly quoted
     elif operator == "" or operator == "NOT":
-        assert len(re.findall(r'^"(.*)"$', query_val)) != 0, \
+        assert len(_QUOTED_RE.findall(query_val)) != 0, \
             "Exact matches must be quoted."
 
     return db_type, attr_name, operator, query_val
@@ -73,7 +101,7 @@ def parse_query_string(query):
     :return:
     """
     query_units = []
-    matches = re.findall(r"^(?:\s*)(.*?)(?:\s+)(AND|OR)(?:\s+)(.*?)(?:\s*)$", query)
+    matches = _LOGIC_RE.findall(query)
     if len(matches) == 0:  # there's no logic connection operator
         parsed_unit = parse_single_query_unit(query)
         query_units.append(parsed_unit)
@@ -120,19 +148,56 @@ def convert_wildcard_query_attr_to_query_key(query_unit):
     assert "*" not in query_value, "Sorry, only ONE wildcard operator at a time."
     assert comp_op == "", "Sorry, we do not support combination of " \
                           "comparison operator and wildcard operator."
-    attr_regex = "^(" + attr.replace("*", ".*") + ")$"
-    candidate_attr = BOOK_ATTRS if db_type == "book" else AUTHOR_ATTRS
-    result_attrs = []
-    for a in candidate_attr:
-        if re.findall(attr_regex, a):  # matches with regex
-            result_attrs.append(a)
     return {"$or": [{a: correct_type_query_value_of_exact_match(a, query_value)}
-                    for a in result_attrs]}
+                    for a in expand_wildcard_attr(db_type, attr)]}
+
+
+@lru_cache(maxsize=None)  # bounded by the few attribute patterns users type
+def expand_wildcard_attr(db_type, attr):
+    """
+    :param db_type: "book" or "author"
+    :param attr: attribute name containing "*", e.g. "*_count"
+    :return: tuple of the tracked attributes matching attr
+    """
+    attr_regex = re.compile("^(" + attr.replace("*", ".*") + ")$")
+    candidate_attr = BOOK_ATTRS if db_type == "book" else AUTHOR_ATTRS
+    return tuple(a for a in candidate_attr if attr_regex.findall(a))  # matches with regex
+
+
+def python_str_expression(attr):
+    """
+    Aggregation expression of the string form of a numeric attribute, as str() gives it:
+    $toString writes the double 4.0 as "4" where str(4.0) is "4.0".
+    :param attr: the numeric attribute
+    :return: the expression, to be used in $expr
+    """
+    field = "$" + attr
+    is_whole_double = {"$and": [{"$eq": [{"$type": field}, "double"]},
+                                {"$eq": [field, {"$trunc": field}]}]}
+    return {"$cond": [is_whole_double, {"$concat": [{"$toString": field}, ".0"]},
+                      {"$toString": field}]}
+
+
+def prefix_upper_bound(prefix):
+    """
+    :param prefix: a non empty string
+    :return: the smallest string greater than every string starting with prefix,
+             None if there is none
+    """
+    last = ord(prefix[-1])
+    if last == 0x10FFFF:  # no greater code point
+        return None
+    if last == 0xD7FF:  # surrogates cannot be encoded, the next code point is U+E000
+        return prefix[:-1] + chr(0xE000)
+    return prefix[:-1] + chr(last + 1)
 
 
 def convert_wildcard_query_value_query_key(query_unit):
     """
-    Handle the case where we got a wildcard operator in query value
+    Handle the case where we got a wildcard operator in query value.
+    The match is done by the database: a prefix pattern such as "Clean*"
+    becomes a range on the attribute (which can use an index), other patterns
+    an anchored regex, and numeric attributes are matched on their str() form.
     :param query_unit:  A parsed query unit of quadra-tuple
     :return: key of query dict to be used in mongo query
     """
@@ -144,18 +209,17 @@ def convert_wildcard_query_value_query_key(query_unit):
     assert comp_op == "", "Sorry, combined usage of comparison and" \
                           " wildcard operators is not allowed."
     query_value = query_value[1:-1]
-    value_regex = "^" + query_value.replace("*", ".*") + "$"
-    book_db, author_db = connect_to_mongo()
-    target_db = book_db if db_type == "book" else author_db
-    match_ids = []
-    #  #### "$where" not supported in MongoDB Atlas free tier
-    # in {"$where": f"this.amount.toString().match({value_regex})"}
-    # so we will have to manually extract id of matching objects.
-    for dic in target_db.find():
-        instance_val = str(dic[attr])
-        if re.findall(value_regex, instance_val):
-            match_ids.append(dic["_id"])
-    return {"_id": {"$in": match_ids}}
+    value_regex = "^" + ".*".join(re.escape(part) for part in query_value.split("*")) + "$"
+    if attr in NUMERIC_ATTRS:
+        # "$where" is not supported in MongoDB Atlas free tier, "$expr" is
+        return {"$expr": {"$regexMatch": {"input": python_str_expression(attr),
+                                          "regex": value_regex}}}
+    prefix = query_value[:-1]
+    if query_value.endswith("*") and "*" not in prefix and prefix \
+            and prefix_upper_bound(prefix) is not None:
+        # strings starting with prefix are exactly the ones in [prefix, upper bound)
+        return {attr: {"$gte": prefix, "$lt": prefix_upper_bound(prefix)}}
+    return {attr: {"$regex": value_regex}}
 
 
 def convert_to_mongo_query_key(query_unit):
@@ -185,6 +249,353 @@ def convert_to_mongo_query_key(query_unit):
         return None  # Should not be reached
 
 
+def build_mongo_query(query_units, logic_op):
+    """
+    Combine the mongo query keys of the query units.
+    :param query_units: One or two unit(s) of parsed query.
+    :param logic_op: logic connection for query units
+    :return: the mongo filter
+    """
+    assert len(query_units) != 0
+    if len(query_units) == 1:
+        return convert_to_mongo_query_key(query_units[0])
+    assert logic_op != "NA"
+    mongo_query_keys = [convert_to_mongo_query_key(unit) for unit in query_units]
+    return {"$and": mongo_query_keys} if logic_op == "AND" else {"$or": mongo_query_keys}
+
+
+def convert_value_of_term(attr, value):
+    """
+    :param attr: the queried attribute
+    :param value: raw quoted string or number token
+    :return: value with the data type of attr
+    """
+    if value[0] == '"':
+        assert "*" not in value, "Sorry, wildcards are only supported in exact matches."
+        return correct_type_query_value_of_exact_match(attr, value)
+    return float(value)
+
+
+def words_of(query_value):
+    """
+    :param query_value: raw quoted string of a HAS term
+    :return: the words of the string
+    """
+    assert "*" not in query_value, "Sorry, wildcards are not supported in HAS."
+    words = re.findall(r"\w+", query_value[1:-1])
+    assert words, "HAS needs at least one word."
+    return words
+
+
+def convert_words_to_query_key(attr, query_value):
+    """
+    Match attr holding every word of query_value as a whole word, ignoring case.
+    (*UCP) makes \\b of mongo's regexes follow unicode letters, as python's do.
+    :param attr: the queried attribute
+    :param query_value: raw quoted string of a HAS term
+    :return: key of query dict to be used in mongo query
+    """
+    assert attr not in NUMERIC_ATTRS, "Sorry, HAS only searches text attributes."
+    query_keys = [{attr: {"$regex": "(*UCP)\\b" + word + "\\b", "$options": "i"}}
+                  for word in words_of(query_value)]
+    return query_keys[0] if len(query_keys) == 1 else {"$and": query_keys}
+
+
+def text_search_of(node, db_type):
+    """
+    The $text filter narrowing a query to the documents holding the words of
+    one of its HAS terms, found by the text index instead of a collection scan.
+    Mongo takes one $text per query, and not under $or or $nor, so only the
+    HAS terms the whole query is a conjunction of are searched. $text matches
+    any of the words in any attribute of the text index: the regexes of the
+    term still check every word is in the queried attribute.
+    :param node: root node of the query AST
+    :param db_type: "book" or "author"
+    :return: the $text filter, None if no HAS term can use the text index
+    """
+    terms = node.children if isinstance(node, Logic) and node.op == "AND" else (node,)
+    text_fields = index_manager.TEXT_FIELDS[db_type + "s"]
+    for term in terms:
+        if isinstance(term, Term) and term.op == "HAS":
+            attrs = expand_wildcard_attr(db_type, term.attr) if "*" in term.attr else (term.attr,)
+            if attrs and all(a in text_fields for a in attrs):
+                return {"$text": {"$search": " ".join(words_of(term.value))}}
+    return None
+
+
+def convert_term_to_query_key(term):
+    """
+    Convert a query_parser.Term to mongo query key.
+    An attribute with a wildcard matches if any of the expanded attributes does.
+    :param term: Term of the query AST
+    :return: key of query dict to be used in mongo query
+    """
+    db_type, attr, comp_op, query_value = term
+    db_attrs = BOOK_ATTRS if db_type == "book" else AUTHOR_ATTRS
+    attrs = expand_wildcard_attr(db_type, attr) if "*" in attr else (attr,)
+    assert attrs and all(a in db_attrs for a in attrs),\
+        "The query field is not tracked by the database."
+    query_keys = []
+    for a in attrs:
+        if comp_op in ("", "NOT", ">", "<"):
+            query_keys.append(convert_to_mongo_query_key((db_type, a, comp_op, query_value)))
+        elif comp_op == ">=":
+            query_keys.append({a: {"$gte": float(query_value)}})
+        elif comp_op == "<=":
+            query_keys.append({a: {"$lte": float(query_value)}})
+        elif comp_op == "..":
+            low, high = float(query_value[0]), float(query_value[1])
+            assert low <= high, "Range lower bound is larger than the upper bound."
+            query_keys.append({a: {"$gte": low, "$lte": high}})
+        elif comp_op == "HAS":
+            query_keys.append(convert_words_to_query_key(a, query_value))
+        else:  # IN
+            query_keys.append({a: {"$in": [convert_value_of_term(a, value)
+                                           for value in query_value]}})
+    return query_keys[0] if len(query_keys) == 1 else {"$or": query_keys}
+
+
+def build_ast_query(node):
+    """
+    Compile a query AST into one mongo filter.
+    :param node: Term, Logic or Not node of query_parser
+    :return: the mongo filter
+    """
+    if isinstance(node, Term):
+        return convert_term_to_query_key(node)
+    if isinstance(node, Not):
+        return {"$nor": [build_ast_query(node.child)]}
+    return {"$and" if node.op == "AND" else "$or":
+            [build_ast_query(child) for child in node.children]}
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _compile_query(query_str):
+    ast = query_parser.parse(query_str)
+    db_types = {term.db_type for term in query_parser.iter_terms(ast)}
+    assert len(db_types) == 1, "Sorry, logic operator is only" \
+                               " supported for the query of the same database."
+    db_type = db_types.pop()
+    mongo_query = build_ast_query(ast)
+    text_search = text_search_of(ast, db_type)
+    if text_search is not None:
+        mongo_query = {"$and": [text_search, mongo_query]}
+    return QueryPlan(db_type, mongo_query, ast)
+
+
+def compile_query(query_str):
+    """
+    Compile a query string into a reusable plan, cached by query string.
+    Plans are shared: never modify their filter.
+    This function will raise exceptions if input not parse-able.
+    :param query_str: The query string following grammar of ElasticSearch.
+    :return: a QueryPlan
+    """
+    return _compile_query(query_str.strip())
+
+
+def execute_plan(plan):
+    """
+    Search through the MongoDB with a compiled plan.
+    :param plan: a QueryPlan
+    :return: matching results as a list
+    """
+    book_db, author_db = connect_to_mongo()
+    db = book_db if plan.db_type == "book" else author_db
+    if index_manager.EXPLAIN_QUERIES:
+        index_manager.explain_query(db, plan.filter)
+    return list(db.find(plan.filter))
+
+
+def parse_sort(sort, db_type):
+    """
+    :param sort: attribute to sort by, prefixed with "-" for descending order, None for _id
+    :param db_type: "book" or "author"
+    :return: attribute, direction (1 or -1)
+    """
+    if not sort:
+        return "_id", 1
+    attr, direction = (sort[1:], -1) if sort.startswith("-") else (sort, 1)
+    db_attrs = BOOK_ATTRS if db_type == "book" else AUTHOR_ATTRS
+    assert attr in db_attrs and attr not in LIST_ATTRS, f"Cannot sort by {attr}."
+    return attr, direction
+
+
+def parse_fields(fields, db_type):
+    """
+    :param fields: comma separated attributes to return, None for all
+    :param db_type: "book" or "author"
+    :return: the mongo projection, None for all attributes
+    """
+    if not fields:
+        return None
+    db_attrs = BOOK_ATTRS if db_type == "book" else AUTHOR_ATTRS
+    projection = {}
+    for field in fields.split(","):
+        field = field.strip()
+        assert field in db_attrs, f"The field {field} is not tracked by the database."
+        projection[field] = 1
+    return projection
+
+
+def encode_cursor(state):
+    """Opaque continuation token of a page."""
+    return base64.urlsafe_b64encode(json.dumps(state).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        assert isinstance(state, dict) and {"v", "id", "k"} <= state.keys()
+        return state
+    except Exception:
+        raise AssertionError("The continuation cursor is malformed.")
+
+
+def bson_type(value):
+    """:return: the $type alias of a json value, as ordered by BSON_SORT_ORDER"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    return "string" if isinstance(value, str) else "object"
+
+
+def keyset_filter(sort_field, direction, last_value, last_id):
+    """
+    Filter of the documents sorted after (last_value, last_id)
+    in the order sort_field, _id (both in direction).
+    $gt / $lt only match values of the type of last_value, so the values of the
+    types sorted after it (see BSON_SORT_ORDER) are matched by $type:
+    fields holding mixed types, e.g. numbers stored as strings, page correctly.
+    Null and missing values come first in ascending order, last in descending order.
+    """
+    after = "$gt" if direction == 1 else "$lt"
+    if sort_field == "_id":
+        return {"_id": {after: last_id}}
+    same_value = {sort_field: last_value, "_id": {after: last_id}}  # None matches missing too
+    if last_value is None:
+        return {"$or": [{sort_field: {"$ne": None}}, same_value]} if direction == 1 else same_value
+    clauses = [{sort_field: {after: last_value}}, same_value]
+    rank = BSON_SORT_ORDER.index(bson_type(last_value))
+    later_types = BSON_SORT_ORDER[rank + 1:] if direction == 1 else BSON_SORT_ORDER[rank - 1::-1]
+    for later_type in later_types:
+        clauses.append({sort_field: None} if later_type == "null"
+                       else {sort_field: {"$type": later_type}})
+    return {"$or": clauses}
+
+
+def prepare_page(plan, sort=None, fields=None, limit=None, cursor=None):
+    """
+    Turn a plan and paging parameters into the mongo query of one page.
+    Pages are keyset based: a page continues after the sort value and _id
+    of the last document of the previous page, so deep pages are as cheap as the first.
+    :param plan: a QueryPlan
+    :param sort: attribute to sort by, "-attr" for descending order, None for _id
+    :param fields: comma separated attributes to return, None for all
+    :param limit: max number of results, None for all of them
+    :param cursor: continuation token returned with the previous page
+    :return: a PageQuery
+    """
+    sort_field, direction = parse_sort(sort, plan.db_type)
+    projection = parse_fields(fields, plan.db_type)
+    assert limit is None or 0 < limit <= MAX_PAGE_SIZE,\
+        f"limit should be between 1 and {MAX_PAGE_SIZE}."
+    fingerprint = hashlib.sha1(json.dumps([plan.db_type, plan.filter, sort_field, direction],
+                                          sort_keys=True, default=str).encode("utf-8"))
+    fingerprint = fingerprint.hexdigest()[:16]
+    mongo_query = plan.filter
+    if cursor:
+        state = decode_cursor(cursor)
+        assert state["k"] == fingerprint, "The cursor belongs to another query or sort."
+        keyset = keyset_filter(sort_field, direction, state["v"], state["id"])
+        mongo_query = {"$and": [mongo_query, keyset]}
+    hidden_fields = []
+    if projection is not None and sort_field not in projection:
+        projection[sort_field] = 1  # needed for the next cursor
+        hidden_fields.append(sort_field)
+    mongo_sort = None  # natural order, as before pagination
+    if sort or limit is not None or cursor:
+        mongo_sort = [(sort_field, direction)]
+        if sort_field != "_id":
+            mongo_sort.append(("_id", direction))  # ties broken by _id
+    return PageQuery(mongo_query, projection, mongo_sort, limit, sort_field, hidden_fields,
+                     fingerprint)
+
+
+def strip_hidden_fields(page_query, document):
+    """Drop the attributes fetched only for the cursor from document, in place."""
+    for field in page_query.hidden_fields:
+        document.pop(field, None)
+    return document
+
+
+def iter_documents(page_query, documents):
+    """Lazily strip_hidden_fields of documents."""
+    for document in documents:
+        yield strip_hidden_fields(page_query, document)
+
+
+def finish_page(page_query, documents):
+    """
+    :param page_query: the PageQuery
+    :param documents: the results of the page query, fetched with a limit of limit + 1
+    :return: the documents of the page, continuation token (None on the last page)
+    """
+    next_cursor = None
+    if page_query.limit is not None and len(documents) > page_query.limit:
+        documents = documents[:page_query.limit]
+        last = documents[-1]
+        next_cursor = encode_cursor({"v": last.get(page_query.sort_field), "id": last["_id"],
+                                     "k": page_query.fingerprint})
+    return list(iter_documents(page_query, documents)), next_cursor
+
+
+def collection_of(db_type):
+    """:return: the book or author collection"""
+    book_db, author_db = connect_to_mongo()
+    return book_db if db_type == "book" else author_db
+
+
+def open_page(db_type, page_query):
+    """
+    Send a page query to mongo.
+    :param db_type: "book" or "author"
+    :param page_query: the PageQuery
+    :return: the mongo cursor over its results (limit + 1 of them)
+    """
+    db = collection_of(db_type)
+    if index_manager.EXPLAIN_QUERIES:
+        index_manager.explain_query(db, page_query.filter)
+    results = db.find(page_query.filter, page_query.projection)
+    if page_query.sort is not None:
+        results = results.sort(page_query.sort)
+    if page_query.limit is not None:
+        results = results.limit(page_query.limit + 1)  # one more tells if there is a next page
+    return results
+
+
+def find_page(plan, sort=None, fields=None, limit=None, cursor=None):
+    """
+    Send the query of a page to mongo, see prepare_page for the parameters.
+    :return: the PageQuery, the mongo cursor over its results (limit + 1 of them)
+    """
+    page_query = prepare_page(plan, sort, fields, limit, cursor)
+    return page_query, open_page(plan.db_type, page_query)
+
+
+def execute_plan_page(plan, sort=None, fields=None, limit=None, cursor=None):
+    """
+    Paginated version of execute_plan, see prepare_page for the parameters.
+    :return: matching results of the page as a list, continuation token or None
+    """
+    page_query, results = find_page(plan, sort, fields, limit, cursor)
+    return finish_page(page_query, list(results))
+
+
 def execute_parsed_query(query_units, logic_op):
     """
     Given a set of parsed query units and logic connection,
@@ -194,20 +605,9 @@ def execute_parsed_query(query_units, logic_op):
     :return: matching results as a list
     """
     assert len(query_units) != 0
-    book_db, author_db = connect_to_mongo()
     db_type, _, _, _ = query_units[0]
-    db = book_db if db_type == "book" else author_db
-
-    if len(query_units) == 1:
-        mongo_query_key = convert_to_mongo_query_key(query_units[0])
-        return list(db.find(mongo_query_key))
-
-    assert logic_op != "NA"
-    mongo_query_key1 = convert_to_mongo_query_key(query_units[0])
-    mongo_query_key2 = convert_to_mongo_query_key(query_units[1])
-    result_mongo_query = {"$and": [mongo_query_key1, mongo_query_key2]} \
-        if logic_op == "AND" else {"$or": [mongo_query_key1, mongo_query_key2]}
-    return list(db.find(result_mongo_query))
+    mongo_query = build_mongo_query(query_units, logic_op)
+    return execute_plan(QueryPlan(db_type, mongo_query, None))
 
 
 def repl_query(query_str):
@@ -217,8 +617,15 @@ def repl_query(query_str):
     :query_str: The query string following grammar of ElasticSearch.
     :return: Matching result by the query_str as a list.
     """
-    query_units, logic_op = parse_query_string(query_str)
-    return execute_parsed_query(query_units, logic_op)
+    return execute_plan(compile_query(query_str))
+
+
+def repl_query_page(query_str, sort=None, fields=None, limit=None, cursor=None):
+    """
+    Paginated version of repl_query, see prepare_page for the parameters.
+    :return: matching results of the page as a list, continuation token or None
+    """
+    return execute_plan_page(compile_query(query_str), sort, fields, limit, cursor)
 
 
 if __name__ == "__main__":
@@ -203,6 +203,155 @@ class TestInterpreter(unittest.TestCase):
         expected4 = {"review_count": {"$lt": 1969}}
         self.assertEqual(convert_to_mongo_query_key(test4), expected4)
 
+    def test_compile_query(self):
+        """
+        Test query strings compile to a plan holding the mongo filter,
+        and that repeated queries reuse the cached plan.
+        """
+        plan = compile_query("book.rating_value : > 4.25 AND book.rating_value : < 4.50")
+        self.assertEqual(plan.db_type, "book")
+        self.assertEqual(plan.filter, {"$and": [{"rating_value": {"$gt": 4.25}},
+                                                {"rating_value": {"$lt": 4.50}}]})
+        self.assertIs(compile_query(" book.rating_value : > 4.25 AND book.rating_value : < 4.50"),
+                      plan)
+
+        plan = compile_query('author.*_count : "12"')
+        self.assertEqual(plan.filter, {"$or": [{"rating_count": 12}, {"review_count": 12}]})
+        self.assertRaises(Exception, compile_query, 'book.BOOK_url : "123"')
+
+    def test_compile_boolean_query(self):
+        """
+        Test nested boolean queries, ranges and IN lists compile to one mongo filter.
+        """
+        plan = compile_query('book.rating_value : 4..4.5 AND (book.author_name : IN ("A", "B")'
+                             ' OR NOT book.review_count : >= 100)')
+        expected = {"$and": [{"rating_value": {"$gte": 4, "$lte": 4.5}},
+                             {"$or": [{"author_name": {"$in": ["A", "B"]}},
+                                      {"$nor": [{"review_count": {"$gte": 100}}]}]}]}
+        self.assertEqual(plan.filter, expected)
+        # every term must query the same database
+        self.assertRaises(Exception, compile_query,
+                          'book.rating_value : > 4 OR (author.rating_value : > 4)')
+        self.assertRaises(Exception, compile_query, "book.rating_value : 5..4")
+
+    def test_compile_word_search(self):
+        """
+        Test HAS matches whole words with regexes, narrowed by the text index
+        only where mongo accepts $text: once, in a conjunction, on indexed attributes.
+        """
+        clean = {"book_title": {"$regex": r"(*UCP)\bClean\b", "$options": "i"}}
+        code = {"book_title": {"$regex": r"(*UCP)\bcode\b", "$options": "i"}}
+        rating = {"rating_value": {"$gt": 4}}
+        plan = compile_query('book.book_title : HAS "Clean, code" AND book.rating_value : > 4')
+        self.assertEqual(plan.filter, {"$and": [{"$text": {"$search": "Clean code"}},
+                                                {"$and": [{"$and": [clean, code]}, rating]}]})
+        plan = compile_query('book.book_title : HAS "Clean" OR book.rating_value : > 4')
+        self.assertEqual(plan.filter, {"$or": [clean, rating]})
+        plan = compile_query('NOT book.book_title : HAS "Clean"')
+        self.assertEqual(plan.filter, {"$nor": [clean]})
+        plan = compile_query('book.author_url : HAS "Clean"')  # not in the text index
+        self.assertEqual(plan.filter, {"author_url": clean["book_title"]})
+        plan = compile_query('author.author_name : HAS "Robert"')
+        self.assertEqual(plan.filter["$and"][0], {"$text": {"$search": "Robert"}})
+        for query in ['book.rating_value : HAS "4"', 'book.book_title : HAS "Clean*"',
+                      'book.book_title : HAS ", "']:
+            self.assertRaises(Exception, compile_query, query)
+
+    def test_wildcard_value_conversion(self):
+        """
+        Test wildcard values are converted to filters run by the database:
+        ranges for prefixes, anchored regex otherwise, string form of numbers.
+        """
+        test1 = ["book", "book_title", "", '"Clean*"']
+        expected1 = {"book_title": {"$gte": "Clean", "$lt": "Cleao"}}
+        self.assertEqual(convert_to_mongo_query_key(test1), expected1)
+
+        test2 = ["book", "book_title", "", '"C++*Guide (2nd)"']
+        expected2 = {"book_title": {"$regex": r"^C\+\+.*Guide\ \(2nd\)$"}}
+        self.assertEqual(convert_to_mongo_query_key(test2), expected2)
+
+        test3 = ["author", "rating_value", "", '"4.0*"']
+        as_string = {"$toString": "$rating_value"}
+        whole_double = {"$and": [{"$eq": [{"$type": "$rating_value"}, "double"]},
+                                 {"$eq": ["$rating_value", {"$trunc": "$rating_value"}]}]}
+        expected3 = {"$expr": {"$regexMatch": {  # 4.0 is "4.0" like str(4.0), not "4"
+            "input": {"$cond": [whole_double, {"$concat": [as_string, ".0"]}, as_string]},
+            "regex": r"^4\.0.*$"}}}
+        self.assertEqual(convert_to_mongo_query_key(test3), expected3)
+
+        test4 = ["book", "book_title", "", '"A\ud7ff*"']
+        expected4 = {"book_title": {"$gte": "A\ud7ff", "$lt": "A\ue000"}}
+        self.assertEqual(convert_to_mongo_query_key(test4), expected4)
+
+        test5 = ["book", "book_title", "", '"A\U0010ffff*"']
+        expected5 = {"book_title": {"$regex": "^A\U0010ffff.*$"}}
+        self.assertEqual(convert_to_mongo_query_key(test5), expected5)
+
+    def test_keyset_filter(self):
+        """
+        Test the filter of the documents after the last one of a page,
+        null values coming first in ascending order and last in descending order,
+        values of other types following mongo's type order.
+        """
+        self.assertEqual(keyset_filter("_id", 1, "5", "5"), {"_id": {"$gt": "5"}})
+        expected1 = {"$or": [{"rating_value": {"$gt": 4.2}},
+                             {"rating_value": 4.2, "_id": {"$gt": "7"}},
+                             {"rating_value": {"$type": "string"}},
+                             {"rating_value": {"$type": "object"}},
+                             {"rating_value": {"$type": "bool"}}]}
+        self.assertEqual(keyset_filter("rating_value", 1, 4.2, "7"), expected1)
+        expected2 = {"$or": [{"rating_value": {"$lt": 4.2}},
+                             {"rating_value": 4.2, "_id": {"$lt": "7"}},
+                             {"rating_value": None}]}
+        self.assertEqual(keyset_filter("rating_value", -1, 4.2, "7"), expected2)
+        # numbers stored as strings sort after every number, before objects
+        expected4 = {"$or": [{"rating_value": {"$lt": "4.2"}},
+                             {"rating_value": "4.2", "_id": {"$lt": "7"}},
+                             {"rating_value": {"$type": "number"}},
+                             {"rating_value": None}]}
+        self.assertEqual(keyset_filter("rating_value", -1, "4.2", "7"), expected4)
+        expected3 = {"$or": [{"rating_value": {"$ne": None}},
+                             {"rating_value": None, "_id": {"$gt": "7"}}]}
+        self.assertEqual(keyset_filter("rating_value", 1, None, "7"), expected3)
+        self.assertEqual(keyset_filter("rating_value", -1, None, "7"),
+                         {"rating_value": None, "_id": {"$lt": "7"}})
+
+    def test_prepare_and_finish_page(self):
+        """
+        Test a page query sorts, projects and limits the plan,
+        and that its cursor continues after the last document of the page.
+        """
+        plan = compile_query("book.rating_value : > 4")
+        page = prepare_page(plan, sort="-rating_count", fields="book_title", limit=2)
+        self.assertEqual(page.filter, plan.filter)
+        self.assertEqual(page.projection, {"book_title": 1, "rating_count": 1})
+        self.assertEqual(page.sort, [("rating_count", -1), ("_id", -1)])
+        documents = [{"_id": "3", "book_title": "C", "rating_count": 30},
+                     {"_id": "2", "book_title": "B", "rating_count": 20},
+                     {"_id": "1", "book_title": "A", "rating_count": 10}]
+        documents, cursor = finish_page(page, documents)
+        self.assertEqual(documents, [{"_id": "3", "book_title": "C"},
+                                     {"_id": "2", "book_title": "B"}])
+        self.assertIsNotNone(cursor)
+
+        page = prepare_page(plan, sort="-rating_count", limit=2, cursor=cursor)
+        self.assertEqual(page.filter, {"$and": [plan.filter,
+                                                keyset_filter("rating_count", -1, 20, "2")]})
+        documents, cursor = finish_page(page, [{"_id": "1", "rating_count": 10}])
+        self.assertEqual(documents, [{"_id": "1", "rating_count": 10}])
+        self.assertIsNone(cursor)
+
+        # cursors are bound to their query and sort
+        other_sort = encode_cursor({"v": 20, "id": "2", "k": page.fingerprint})
+        self.assertRaises(AssertionError, prepare_page, plan, sort="rating_count",
+                          limit=2, cursor=other_sort)
+        self.assertRaises(AssertionError, prepare_page, plan, cursor="not a cursor")
+        self.assertRaises(AssertionError, prepare_page, plan, sort="similar_book_urls")
+        self.assertRaises(AssertionError, prepare_page, plan, fields="BOOK_url")
+        self.assertRaises(AssertionError, prepare_page, plan, limit=0)
+        # without paging parameters results keep their natural order
+        self.assertIsNone(prepare_page(plan).sort)
+
     def test_repl_single_query_unit(self):
         """
         Test repl by interpreter can retrieve correct result from MongoDB.
@@ -289,5 +438,21 @@ class TestInterpreter(unittest.TestCase):
         self.assertEqual(test2_id, sorted(expected2_id))
 
 
+    def test_repl_paginated_search(self):
+        """
+        Test that following the cursors of repl_query_page
+        returns every match of repl_query once, in sort order.
+        """
+        query = "book.rating_value : > 4"
+        expected = sorted(repl_query(query), key=lambda dic: (-dic["rating_value"], dic["_id"]))
+        results, cursor = repl_query_page(query, sort="-rating_value", fields="book_title", limit=3)
+        while cursor is not None:
+            page, cursor = repl_query_page(query, sort="-rating_value", fields="book_title",
+                                           limit=3, cursor=cursor)
+            results.extend(page)
+        self.assertEqual([dic["_id"] for dic in results], [dic["_id"] for dic in expected])
+        self.assertTrue(all(dic.keys() == {"_id", "book_title"} for dic in results))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -9,8 +9,11 @@ import re
 import argparse
 from gooey import Gooey
 from bfs_scrape import scrape_start
+from checkpoint_log import ProgressLocked
+from crawl_engine import CRAWL_WORKERS, PARSE_PROCESSES
 from update import insert_into_db
-from mongo_manipulator import dump_db
+from mongo_manipulator import dump_db, EXPORT_FORMATS, COMPRESSIONS
+from incremental_export import export_db_changes
 from build_graph import build_graph
 
 PROGRESS_DIR = "../progress/"
@@ -45,6 +48,14 @@ def construct_parser():
                                      ' storage >= max_author,'
                                      ' default=50.',
                                 type=int, default=50)
+    parser_scraper.add_argument('--workers',
+                                help=f'Number of pages fetched concurrently,'
+                                     f' default={CRAWL_WORKERS}.',
+                                type=int, default=CRAWL_WORKERS)
+    parser_scraper.add_argument('--parse_processes',
+                                help='Number of processes parsing the fetched pages,'
+                                     ' default=one per core.',
+                                type=int, default=PARSE_PROCESSES)
     # subparser  - updater
     parser_updater = subparsers.add_parser("update", help="Store new data into database.")
     parser_updater.set_defaults(which='update')
@@ -52,12 +63,27 @@ def construct_parser():
     parser_updater.add_argument("--type", choices=["book", "author"],
                                 help="Flag indicating input json file"
                                      " stores book or author information")
+    parser_updater.add_argument("--stream", action="store_true",
+                                help="Parse and write the json (or NDJSON) file"
+                                     " incrementally, for very large files")
 
     # subparser - exporter
     parser_exporter = subparsers.add_parser("export", help="Export existing database to json file.")
     parser_exporter.set_defaults(which='export')
     parser_exporter.add_argument("--db", choices=["book", "author", "all"], required=True,
                                  help="The database user wants to export")
+    parser_exporter.add_argument("--format", choices=EXPORT_FORMATS, default="json",
+                                 help="json array, or one json document per line (ndjson)")
+    parser_exporter.add_argument("--compress", choices=COMPRESSIONS,
+                                 help="Compress the exported file")
+    parser_exporter.add_argument("--fields",
+                                 help="Comma separated attributes to export, default all")
+    parser_exporter.add_argument("--incremental", action="store_true",
+                                 help="Only export the changes since the last export"
+                                      " to a delta file (full json export the first time)")
+    parser_exporter.add_argument("--merge", action="store_true",
+                                 help="With --incremental, merge the deltas"
+                                      " into the json snapshots")
     # subparser - graph_drawer
     parser_drawer = subparsers.add_parser("draw", help="Build author-book network using db data.")
     parser_drawer.set_defaults(which='draw')
@@ -88,6 +114,9 @@ def validate_scrape_args(parser):
         assert args.max_book <= 2000, "max_book should be less than 2000."
         assert args.max_author > 0, "max_author must be a positive integer."
         assert args.max_author <= 2000, "max_author should be less than 2000."
+        assert args.workers > 0, "workers must be a positive integer."
+        assert args.parse_processes is None or args.parse_processes > 0,\
+            "parse_processes must be a positive integer."
 
 
 if __name__ == "__main__":
@@ -99,15 +128,23 @@ if __name__ == "__main__":
         max_book = args.max_book
         max_author = args.max_author
         new_scrape = args.new
-        scrape_start(new_scrape, start_url, max_book,
-                     max_author, PROGRESS_DIR)
+        try:
+            scrape_start(new_scrape, start_url, max_book,
+                         max_author, PROGRESS_DIR, args.workers, args.parse_processes)
+        except ProgressLocked as err:
+            print(f"{err} Wait for it to finish, or cancel it.")
+            exit(1)
     elif args.which == "update":  # run command "update"
         type_json = args.type
         src_json = args.srcJSON
-        insert_into_db(src_json, type_json)
+        insert_into_db(src_json, type_json, args.stream)
     elif args.which == "export":  # run command "export"
         db_choice = args.db
-        dump_db(db_choice)
+        if args.incremental:
+            export_db_changes(db_choice, args.merge)
+        else:
+            fields = args.fields.split(",") if args.fields else None
+            dump_db(db_choice, args.format, args.compress, fields)
     elif args.which == "draw":  # run command "draw"
         build_graph()
     else:  # invalid input
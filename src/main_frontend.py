@@ -13,7 +13,7 @@ import requests
 import json
 import update as updater
 from update import BOOK_ATTRS, AUTHOR_ATTRS
-from interpreter import parse_query_string
+from interpreter import compile_query
 
 HOST = "http://127.0.0.1:5000/"  # The address of the server
 
@@ -117,7 +117,7 @@ if __name__ == "__main__":
         q = args.query_unit_1 + " " + logic_op + " " + query_unit_2
 
         # Sanity check the query string - exit if passed query is not interpretable.
-        parse_query_string(q)
+        compile_query(q)
         response = requests.get(HOST + f"api/search", params={"q": q})
         if response.status_code == 200:
             print(response.json())
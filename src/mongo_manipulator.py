@@ -1,57 +1,192 @@
 """
 Build connection with remote mongoDB,
 and perform data manipulator (dump db as json).
+Dumps stream the cursor batch by batch, so memory does not grow with the db.
 """
 import os
+import io
+import gzip
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pymongo
 from dotenv import load_dotenv
+try:
+    import zstandard  # optional, for zstd compressed dumps
+except ImportError:
+    zstandard = None
 
 JSON_PATH = "../JSON/"
+EXPORT_BATCH_SIZE = 1000  # documents fetched per round trip when dumping
+EXPORT_FORMATS = ["json", "ndjson"]  # a json array, or one document per line
+COMPRESSIONS = ["gzip", "zstd"]
+_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+load_dotenv()
+# Connection pool settings, overridable from .env
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+
+_client_lock = threading.Lock()
+_clients = {}  # (pid, mongo key) -> client
+
+
+def _reset_client_registry():
+    """
+    Drop clients inherited from a parent process.
+    A MongoClient must never be shared across fork, so the child starts empty.
+    """
+    global _client_lock
+    _client_lock = threading.Lock()
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):  # not available on Windows
+    os.register_at_fork(after_in_child=_reset_client_registry)
+
+
+def get_mongo_client(key=None):
+    """
+    Get the process-wide pooled MongoClient, creating it lazily on first use.
+    The client is never rebuilt: pymongo monitors the cluster and reconnects
+    by itself, and collections handed out keep working across outages.
+    The first connection is pinged outside the lock, so a slow cluster never
+    blocks the threads that already have the client.
+    :param key: the mongo connection string, defaults to MONGO_KEY in .env
+    :return: a shared pymongo.MongoClient
+    """
+    key = key if key is not None else os.getenv("MONGO_KEY")
+    registry_key = (os.getpid(), key)
+    client = _clients.get(registry_key)
+    if client is not None:
+        return client
+    client = pymongo.MongoClient(key, maxPoolSize=MAX_POOL_SIZE,
+                                 minPoolSize=MIN_POOL_SIZE)
+    try:
+        client.admin.command("ping")  # fail early if the cluster is unreachable
+    except pymongo.errors.PyMongoError:
+        client.close()
+        raise
+    with _client_lock:
+        shared = _clients.setdefault(registry_key, client)
+    if shared is not client:  # another thread connected first, nobody uses ours
+        client.close()
+    return shared
+
+
+def close_mongo_clients():
+    """Close every pooled client owned by this process."""
+    with _client_lock:
+        for (pid, _), client in list(_clients.items()):
+            if pid == os.getpid():
+                client.close()
+        _clients.clear()
 
 
 def connect_to_mongo():
     """
-    Open connection to mongoDB
+    Get the book and author collections from the shared pooled client.
     :return: book_db, author_db book collection and author collection in remote mongo atlas
     """
-    load_dotenv()
-    key = os.getenv("MONGO_KEY")
-    client = pymongo.MongoClient(key)
-    client.list_database_names()
+    client = get_mongo_client()
     goodread_db = client["GoodRead"]
     book_db, author_db = goodread_db["books"], goodread_db["authors"]
     # book_db, author_db = goodread_db["books_test"], goodread_db["authors_test"]
     return book_db, author_db
 
 
-def dump_db(db_choice):
+def dump_db(db_choice, fmt="json", compression=None, fields=None):
     """
     Dump indicated database from mongoDB to local json.
+    Both databases are dumped in parallel for "all" (or any other choice).
     :param db_choice: "book", "author", or "all"
+    :param fmt: "json" for a json array, "ndjson" for one document per line
+    :param compression: None, "gzip" or "zstd"
+    :param fields: list of attributes to export, all of them if None
     """
     book_db, author_db = connect_to_mongo()
-    book_db_name = "book_db.json"
-    author_db_name = "author_db.json"
+    projection = {field: 1 for field in fields} if fields else None
+    jobs = [(book_db, f"book_db.{fmt}"), (author_db, f"author_db.{fmt}")]
     if db_choice == "book":
-        dump(book_db, book_db_name)
+        jobs = jobs[:1]
     elif db_choice == "author":
-        dump(author_db, author_db_name)
-    else:
-        dump(book_db, book_db_name)
-        dump(author_db, author_db_name)
+        jobs = jobs[1:]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = [executor.submit(dump, db_to_dump, file_name, fmt, compression, projection)
+                   for db_to_dump, file_name in jobs]
+        for future in futures:
+            future.result()  # raise errors of the dumps
 
 
-def dump(db_to_dump, file_name):
+def open_export_file(path, compression=None):
+    """
+    :param path: path of the output file
+    :param compression: None, "gzip" or "zstd"
+    :return: a text file writing (and compressing) to path
+    """
+    assert compression in _SUFFIXES, f"Unknown compression {compression}."
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8")
+    if compression == "zstd":
+        assert zstandard is not None, "zstd compression requires the zstandard package."
+        raw_file = open(path, "wb")
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(raw_file),
+                                encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+def write_documents(file, documents, fmt="json"):
+    """
+    Write documents one at a time.
+    :param file: a text file opened for writing
+    :param documents: iterable of dicts, e.g. a cursor
+    :param fmt: "json" for a json array, "ndjson" for one document per line
+    :return: number of written documents
+    """
+    count = 0
+    if fmt == "json":
+        file.write("[")
+    for document in documents:
+        if fmt == "json":
+            file.write(", " if count else "")  # same layout as json.dump of a list
+            json.dump(document, file)
+        else:
+            json.dump(document, file)
+            file.write("\n")
+        count += 1
+    if fmt == "json":
+        file.write("]")
+    return count
+
+
+def dump(db_to_dump, file_name, fmt="json", compression=None, projection=None,
+         batch_size=EXPORT_BATCH_SIZE):
     """
     Helper function for dumping file and logging.
+    Documents are streamed from the cursor to a temporary file,
+    which replaces file_name once complete.
     :param db_to_dump: target db to dump
-    :param file_name: output file name
+    :param file_name: output file name, suffixed with .gz / .zst if compressed
+    :param fmt: "json" for a json array, "ndjson" for one document per line
+    :param compression: None, "gzip" or "zstd"
+    :param projection: mongo projection of the exported attributes, None for all
+    :param batch_size: documents fetched per round trip
+    :return: path of the output file
     """
-    path = JSON_PATH + file_name
-    with open(path, "w+") as file:
-        json.dump(list(db_to_dump.find({})), file)
-        print(f"Successfully dumped {file_name} to {path}")
+    assert fmt in EXPORT_FORMATS, f"Unknown export format {fmt}."
+    path = JSON_PATH + file_name + _SUFFIXES[compression]
+    tmp_path = path + ".tmp"
+    try:
+        with open_export_file(tmp_path, compression) as file:
+            count = write_documents(file, db_to_dump.find({}, projection).batch_size(batch_size),
+                                    fmt)
+        os.replace(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)  # never leave a partial dump behind
+        raise
+    print(f"Successfully dumped {count} documents of {file_name} to {path}")
+    return path
 
 
 def convert_string_attr_to_numeric():
@@ -0,0 +1,174 @@
+"""
+Test dumps stream the collection in the requested format.
+"""
+import contextlib
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import pymongo
+import mongo_manipulator
+from mongo_manipulator import dump, dump_db, get_mongo_client, close_mongo_clients
+
+DOCUMENTS = [{"_id": str(i), "book_title": f"Book {i}", "rating_value": i / 2}
+             for i in range(5)]
+
+
+class FakeCursor:
+    """Minimal stand-in of a pymongo Cursor."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.size = None
+
+    def batch_size(self, size):
+        self.size = size
+        return self
+
+    def __iter__(self):
+        return iter(self.documents)
+
+
+class FakeCollection:
+    """Serve DOCUMENTS, applying inclusive projections."""
+
+    def __init__(self):
+        self.cursor = None
+
+    def find(self, query, projection=None):
+        documents = DOCUMENTS
+        if projection:
+            documents = [{k: v for k, v in doc.items() if k == "_id" or k in projection}
+                         for doc in documents]
+        self.cursor = FakeCursor(documents)
+        return self.cursor
+
+
+class TestDump(unittest.TestCase):
+    """
+    Test the streaming export of a collection.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.json_path = mongo_manipulator.JSON_PATH
+        mongo_manipulator.JSON_PATH = self.tmp_dir.name + "/"
+
+    def tearDown(self):
+        mongo_manipulator.JSON_PATH = self.json_path
+        self.tmp_dir.cleanup()
+
+    def test_json_array(self):
+        """
+        The json format should be byte for byte what json.dump of the list gives.
+        """
+        collection = FakeCollection()
+        path = dump(collection, "book_db.json", batch_size=2)
+        with open(path, "r") as file:
+            self.assertEqual(file.read(), json.dumps(DOCUMENTS))
+        self.assertEqual(collection.cursor.size, 2)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["book_db.json"])
+
+    def test_compressed_ndjson_projection(self):
+        """
+        ndjson should hold one projected document per line, gzip compressed.
+        """
+        path = dump(FakeCollection(), "book_db.ndjson", "ndjson", "gzip",
+                    {"book_title": 1})
+        self.assertTrue(path.endswith("book_db.ndjson.gz"))
+        with gzip.open(path, "rt") as file:
+            lines = file.read().splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{"_id": doc["_id"], "book_title": doc["book_title"]}
+                          for doc in DOCUMENTS])
+
+    def test_empty_collection(self):
+        """
+        An empty collection should give an empty json array.
+        """
+        collection = FakeCollection()
+        collection.find = lambda query, projection=None: FakeCursor([])
+        with open(dump(collection, "author_db.json"), "r") as file:
+            self.assertEqual(json.load(file), [])
+
+    def test_dump_db_choices(self):
+        """
+        book and author should dump one collection, any other choice both of them.
+        """
+        for db_choice, expected in [("book", ["book_db.json"]), ("author", ["author_db.json"]),
+                                    ("all", ["author_db.json", "book_db.json"]),
+                                    ("both", ["author_db.json", "book_db.json"])]:
+            for name in os.listdir(self.tmp_dir.name):
+                os.remove(os.path.join(self.tmp_dir.name, name))
+            with mock.patch.object(mongo_manipulator, "connect_to_mongo",
+                                   lambda: (FakeCollection(), FakeCollection())), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                dump_db(db_choice)
+            self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), expected)
+
+
+class FakeClient:
+    """Stand-in of pymongo.MongoClient, pinging slowly or failing."""
+
+    def __init__(self, key, fail=False, **pool_options):
+        self.fail = fail
+        self.closed = False
+        self.admin = self
+
+    def command(self, name):
+        time.sleep(0.05)
+        if self.fail:
+            raise pymongo.errors.ServerSelectionTimeoutError("unreachable")
+
+    def close(self):
+        self.closed = True
+
+
+class TestMongoClient(unittest.TestCase):
+    """
+    Test the pooled client is created once per process and never closed under its users.
+    """
+
+    def tearDown(self):
+        close_mongo_clients()
+
+    def test_one_client_per_process(self):
+        """
+        Threads connecting at once should all get the same open client.
+        """
+        created, clients = [], []
+
+        def new_client(key, **pool_options):
+            created.append(FakeClient(key))
+            return created[-1]
+        with mock.patch.object(pymongo, "MongoClient", new_client):
+            threads = [threading.Thread(target=lambda: clients.append(get_mongo_client("k")))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertIs(get_mongo_client("k"), clients[0])
+        self.assertEqual(len({id(client) for client in clients}), 1)
+        self.assertFalse(clients[0].closed)
+        self.assertTrue(all(client.closed for client in created if client is not clients[0]))
+
+    def test_unreachable_cluster(self):
+        """
+        A failed first ping should raise, and close and forget the client.
+        """
+        unreachable = FakeClient("k", fail=True)
+        with mock.patch.object(pymongo, "MongoClient", lambda key, **options: unreachable):
+            self.assertRaises(pymongo.errors.PyMongoError, get_mongo_client, "k")
+        self.assertTrue(unreachable.closed)
+        with mock.patch.object(pymongo, "MongoClient", FakeClient):
+            self.assertFalse(get_mongo_client("k").fail)
+
+
+if __name__ == "__main__":
+    unittest.main()
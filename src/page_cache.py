@@ -0,0 +1,103 @@
+"""
+On-disk cache of downloaded pages, sitting under the scrapers.
+Pages are stored gzip-compressed in a file named after the sha256 of their url,
+together with their ETag / Last-Modified validators.
+Fresh pages are served without any request, stale ones are revalidated
+with a conditional request (a cheap 304 if they did not change),
+and in offline mode pages are only ever served from the cache,
+which allows replaying stored pages through the parsers without network.
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+
+CACHE_DIR = "../page_cache/"
+TTL = 7 * 24 * 3600  # seconds a page is served without revalidation
+
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a page was never stored."""
+
+
+class PageCache:
+    """
+    Url-keyed, compressed page store with TTLs.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=TTL, offline=False):
+        """
+        :param cache_dir: directory of the cached pages
+        :param ttl: seconds a page is served without revalidation
+        :param offline: only serve from the cache, never hit the network
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.offline = offline
+
+    def _path(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".json.gz")
+
+    def load(self, url):
+        """
+        :param url: url of the page
+        :return: the cache entry (url, body, etag, last_modified, fetched_at) or None
+        """
+        try:
+            with gzip.open(self._path(url), "rt", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None  # not cached, or corrupted
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """
+        Store a freshly downloaded page.
+        :return: the stored entry
+        """
+        entry = {"url": url, "body": body, "etag": etag,
+                 "last_modified": last_modified, "fetched_at": time.time()}
+        self._write(url, entry)
+        return entry
+
+    def touch(self, entry):
+        """Mark entry as fresh again, after the server answered 304."""
+        entry["fetched_at"] = time.time()
+        self._write(entry["url"], entry)
+
+    def _write(self, url, entry):
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{id(entry)}.tmp"  # unique per writer
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+            json.dump(entry, file)
+        os.replace(tmp_path, path)
+
+    def is_fresh(self, entry):
+        """Whether entry can be served without revalidation."""
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def iter_entries(self):
+        """Iterate every stored entry, e.g. to replay pages through the parsers."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for sub_dir in sorted(os.listdir(self.cache_dir)):
+            sub_path = os.path.join(self.cache_dir, sub_dir)
+            if not os.path.isdir(sub_path):
+                continue
+            for name in sorted(os.listdir(sub_path)):
+                if not name.endswith(".json.gz"):
+                    continue
+                with gzip.open(os.path.join(sub_path, name), "rt", encoding="utf-8") as file:
+                    yield json.load(file)
+
+
+def conditional_headers(entry):
+    """Validators of a stale entry, as request headers."""
+    headers = {}
+    if entry is not None and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
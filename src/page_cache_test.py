@@ -0,0 +1,117 @@
+"""
+Test pages are served from, revalidated against and stored into the page cache.
+"""
+import tempfile
+import unittest
+import requests
+from page_cache import PageCache, CacheMiss
+from page_fetcher import PageFetcher
+from rate_limiter import HostRateLimiter
+
+BOOK_URL = "https://www.goodreads.com/book/show/3735293-clean-code"
+
+
+class FakeResponse:
+    """Minimal stand-in of requests.Response."""
+
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+
+class FakeSession:
+    """Answer requests with canned responses and remember the sent headers."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.sent_headers = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.sent_headers.append(headers)
+        return self.responses.pop(0)
+
+
+class TestPageCache(unittest.TestCase):
+    """
+    Test behavior of the page cache under the fetcher.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_fetcher(self, responses, ttl=3600, offline=False):
+        """Fetcher with a fake session, a fast rate limiter and a temporary cache."""
+        cache = PageCache(self.tmp_dir.name, ttl=ttl, offline=offline)
+        return PageFetcher(HostRateLimiter(rate=100.0), FakeSession(responses),
+                           page_cache=cache)
+
+    def test_fresh_page_served_from_cache(self):
+        """
+        A page fetched within the TTL should not be downloaded again.
+        """
+        fetcher = self.make_fetcher([FakeResponse(200, "<html>1</html>")])
+        self.assertEqual(fetcher.fetch(BOOK_URL), "<html>1</html>")
+        self.assertEqual(fetcher.fetch(BOOK_URL), "<html>1</html>")
+        self.assertEqual(len(fetcher.session.sent_headers), 1)
+
+    def test_stale_page_revalidated(self):
+        """
+        A stale page should be revalidated with its ETag, and reused on 304.
+        """
+        fetcher = self.make_fetcher([FakeResponse(200, "<html>1</html>", {"ETag": '"v1"'}),
+                                     FakeResponse(304)], ttl=0)
+        fetcher.fetch(BOOK_URL)
+        self.assertEqual(fetcher.fetch(BOOK_URL), "<html>1</html>")
+        self.assertEqual(fetcher.session.sent_headers[1], {"If-None-Match": '"v1"'})
+
+    def test_error_pages_not_cached(self):
+        """
+        Only successful pages should be stored.
+        """
+        fetcher = self.make_fetcher([FakeResponse(404, "missing"),
+                                     FakeResponse(200, "<html>1</html>")])
+        self.assertEqual(fetcher.fetch(BOOK_URL), "missing")
+        self.assertEqual(fetcher.fetch(BOOK_URL), "<html>1</html>")
+
+    def test_throttling_retries_exhausted(self):
+        """
+        A page still throttled after the retries should raise, not be returned as the page.
+        """
+        throttled = [FakeResponse(429, "slow down", {"Retry-After": "0"}) for _ in range(2)]
+        fetcher = self.make_fetcher(throttled)
+        fetcher.max_retries = 1
+        self.assertRaises(requests.HTTPError, fetcher.fetch, BOOK_URL)
+        self.assertEqual(list(fetcher.page_cache.iter_entries()), [])
+
+    def test_only_successes_raise_rate(self):
+        """
+        Error pages should not count as successes for the rate limiter.
+        """
+        fetcher = self.make_fetcher([FakeResponse(500, "error"), FakeResponse(404, "missing"),
+                                     FakeResponse(200, "<html>1</html>")])
+        fetcher.rate_limiter = HostRateLimiter(rate=100.0, max_rate=200.0)
+        rate = fetcher.rate_limiter.current_rate(BOOK_URL)
+        fetcher.fetch(BOOK_URL)
+        fetcher.fetch(BOOK_URL)
+        self.assertEqual(fetcher.rate_limiter.current_rate(BOOK_URL), rate)
+        fetcher.fetch(BOOK_URL)
+        self.assertGreater(fetcher.rate_limiter.current_rate(BOOK_URL), rate)
+
+    def test_offline_replay(self):
+        """
+        In offline mode, stored pages are served even if stale, and misses raise.
+        """
+        self.make_fetcher([FakeResponse(200, "<html>1</html>")]).fetch(BOOK_URL)
+        offline_fetcher = self.make_fetcher([], ttl=0, offline=True)
+        self.assertEqual(offline_fetcher.fetch(BOOK_URL), "<html>1</html>")
+        self.assertRaises(CacheMiss, offline_fetcher.fetch, BOOK_URL + "_other")
+        entries = list(offline_fetcher.page_cache.iter_entries())
+        self.assertEqual([entry["url"] for entry in entries], [BOOK_URL])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Downloading layer shared by BookScraper and AuthorScraper.
+Pages are served from the PageCache when possible. Otherwise every request
+goes through a HostRateLimiter and a keep-alive session,
+and throttled requests (429 / 503) are retried once the host allows it.
+"""
+import os
+import threading
+import requests
+from dotenv import load_dotenv
+from http_session import get_shared_session, TIMEOUT
+from rate_limiter import DEFAULT_RATE_LIMITER, THROTTLE_STATUS, parse_retry_after
+from page_cache import PageCache, CacheMiss, conditional_headers, CACHE_DIR
+
+load_dotenv()
+MAX_RETRIES = 3  # retries of a throttled request before giving up
+
+
+class PageFetcher:
+    """
+    Fetch pages politely. One instance is meant to be shared by all scrapers,
+    so that they spend one common budget per host.
+    """
+
+    def __init__(self, rate_limiter=None, session=None, timeout=TIMEOUT,
+                 max_retries=MAX_RETRIES, page_cache=None):
+        """
+        :param rate_limiter: HostRateLimiter to use, defaults to the process-wide one
+        :param session: requests.Session to use, defaults to the process-wide one
+        :param timeout: (connect, read) timeout of every request
+        :param max_retries: retries of a throttled request
+        :param page_cache: PageCache serving and storing pages, None to always download
+        """
+        self.rate_limiter = rate_limiter if rate_limiter is not None else DEFAULT_RATE_LIMITER
+        self.session = session if session is not None else get_shared_session()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.page_cache = page_cache
+
+    def fetch(self, url):
+        """
+        Get the raw html of a page, from the cache or by downloading it.
+        Notice this function DO NOT HANDLE connection error,
+        nor requests.HTTPError once throttling retries are exhausted!
+        :param url: url of the page to download
+        :return: the html source as a string
+        """
+        entry = None
+        if self.page_cache is not None:
+            entry = self.page_cache.load(url)
+            if entry is not None and (self.page_cache.offline
+                                      or self.page_cache.is_fresh(entry)):
+                return entry["body"]
+            if self.page_cache.offline:
+                raise CacheMiss(url)
+
+        response = self._download(url, conditional_headers(entry))
+        if self.page_cache is not None:
+            if response.status_code == 304 and entry is not None:
+                self.page_cache.touch(entry)
+                return entry["body"]
+            if response.status_code == 200:
+                self.page_cache.store(url, response.text, response.headers.get("ETag"),
+                                      response.headers.get("Last-Modified"))
+        return response.text
+
+    def _download(self, url, headers):
+        """
+        Send the request once the rate limiter allows it, retrying throttled ones.
+        Only 2xx and 304 responses raise the rate of the host,
+        error pages are returned without changing it.
+        :return: the response
+        :raise requests.HTTPError: if the request is still throttled after max_retries
+        """
+        for _ in range(self.max_retries + 1):
+            self.rate_limiter.acquire(url)
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code not in THROTTLE_STATUS:
+                if 200 <= response.status_code < 300 or response.status_code == 304:
+                    self.rate_limiter.on_success(url)
+                return response
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            self.rate_limiter.on_throttled(url, retry_after)
+            print(f"{url} throttled ({response.status_code}), backing off ...")
+        raise requests.HTTPError(f"{url} still throttled after {self.max_retries} retries",
+                                 response=response)
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+
+def get_default_fetcher():
+    """
+    The PageFetcher shared by scrapers created without their own one.
+    It always downloads, unless PAGE_CACHE (.env) is "on": pages are then cached
+    under PAGE_CACHE_DIR (default ../page_cache/) and served for up to a week.
+    PAGE_CACHE=offline replays cached pages only.
+    Created once even when crawler threads ask for it at the same time,
+    so that every scraper shares its rate limiter and session.
+    """
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            mode = os.getenv("PAGE_CACHE", "off")
+            page_cache = None
+            if mode != "off":
+                page_cache = PageCache(os.getenv("PAGE_CACHE_DIR", CACHE_DIR),
+                                       offline=mode == "offline")
+            _default_fetcher = PageFetcher(page_cache=page_cache)
+        return _default_fetcher
@@ -0,0 +1,78 @@
+"""
+Test the fetcher and session shared by the scrapers are created once per process,
+and the default fetcher only caches pages when asked to.
+"""
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+import http_session
+import page_fetcher
+
+
+def call_from_threads(function, threads=8):
+    """:return: what function returned in each of threads started together"""
+    results, start = [], threading.Barrier(threads)
+
+    def call():
+        start.wait()
+        results.append(function())
+    workers = [threading.Thread(target=call) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def slowly(build):
+    """:return: build, taking long enough for racing threads to overlap"""
+    def slow_build(*args, **kwargs):
+        time.sleep(0.05)
+        return build(*args, **kwargs)
+    return slow_build
+
+
+class TestSharedInstances(unittest.TestCase):
+    """
+    Unit test class wrapper for the shared fetcher and session.
+    """
+
+    def test_one_shared_session(self):
+        """
+        Test threads asking for the session at once get the same one.
+        """
+        with mock.patch.object(http_session, "_shared_session", None), \
+                mock.patch.object(http_session, "build_session",
+                                  slowly(http_session.build_session)):
+            sessions = call_from_threads(http_session.get_shared_session)
+        self.assertEqual(len({id(session) for session in sessions}), 1)
+
+    def test_one_default_fetcher(self):
+        """
+        Test threads asking for the default fetcher at once get the same one,
+        hence one rate limiter and one session.
+        """
+        with mock.patch.object(page_fetcher, "_default_fetcher", None), \
+                mock.patch.object(page_fetcher, "PageFetcher", slowly(page_fetcher.PageFetcher)), \
+                mock.patch.dict("os.environ", {"PAGE_CACHE": "off"}):
+            fetchers = call_from_threads(page_fetcher.get_default_fetcher)
+        self.assertEqual(len({id(fetcher) for fetcher in fetchers}), 1)
+
+    def test_page_cache_is_opt_in(self):
+        """
+        Test the default fetcher downloads every time unless PAGE_CACHE is on.
+        """
+        for mode, cached in [(None, False), ("off", False), ("on", True)]:
+            environ = {} if mode is None else {"PAGE_CACHE": mode}
+            with mock.patch.object(page_fetcher, "_default_fetcher", None), \
+                    mock.patch.dict("os.environ", environ):
+                if mode is None:
+                    os.environ.pop("PAGE_CACHE", None)
+                fetcher = page_fetcher.get_default_fetcher()
+            self.assertEqual(fetcher.page_cache is not None, cached)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+Benchmark the "soup" and "xpath" extraction engines of the scrapers
+on the pages saved in the page cache, and check they return identical dicts.
+Usage: python parse_benchmark.py [cache_dir] [repeat]
+cache_dir can also be a directory of saved pages listed in an index.json,
+such as ../HTML/ which the tests use. Those are small hand-trimmed pages,
+measure the speedup on the page cache of a real crawl (the default,
+filled by crawls run with PAGE_CACHE=on in .env).
+Exits with 1 if the results differ or if there is no page to parse.
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from page_cache import PageCache, CACHE_DIR
+from page_fetcher import PageFetcher
+from book_scraper import BookScraper
+from author_scraper import AuthorScraper
+
+
+def time_engine(parse, pages, repeat):
+    """
+    Parse every page `repeat` times, silencing the parsers' logging.
+    :return: seconds spent, results of the last round
+    """
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results = [parse(*page) for page in pages]
+        elapsed = time.perf_counter() - start
+    return elapsed, results
+
+
+def load_pages(cache_dir):
+    """
+    :param cache_dir: a page cache, or a directory of html files listed in index.json
+    :return: dict of url -> html of every page
+    """
+    index_path = os.path.join(cache_dir, "index.json")
+    if not os.path.exists(index_path):
+        return {entry["url"]: entry["body"]
+                for entry in PageCache(cache_dir, offline=True).iter_entries()}
+    with open(index_path, "r") as file:
+        index = json.load(file)
+    pages = {}
+    for url, name in index.items():
+        with open(os.path.join(cache_dir, name), "r", encoding="utf-8") as file:
+            pages[url] = file.read()
+    return pages
+
+
+def split_pages(fetcher, urls):
+    """
+    :param fetcher: the offline PageFetcher of the scrapers
+    :param urls: dict of url -> html
+    :return: book pages as (url, html), author pages as (url, html, sub_pages)
+    """
+    book_pages, author_pages = [], []
+    for url, body in urls.items():
+        if BookScraper(fetcher).is_legal_book_url(url):
+            book_pages.append((url, body))
+        elif AuthorScraper(fetcher).is_legal_author_url(url):
+            sub_page_urls = AuthorScraper(fetcher).construct_sub_page_urls(url)
+            sub_pages = {name: urls.get(sub_url) for name, sub_url in sub_page_urls.items()}
+            author_pages.append((url, body, sub_pages))
+    return book_pages, author_pages
+
+
+def offline_fetcher(cache_dir):
+    """:return: a PageFetcher that never hits the network"""
+    return PageFetcher(page_cache=PageCache(cache_dir, offline=True))
+
+
+def benchmark(cache_dir=CACHE_DIR, repeat=3):
+    """
+    Compare both engines on the cached book and author pages.
+    :return: True if there were pages and both engines returned identical dicts for each
+    """
+    fetcher = offline_fetcher(cache_dir)
+    book_pages, author_pages = split_pages(fetcher, load_pages(cache_dir))
+    if not book_pages and not author_pages:
+        print(f"No book or author page cached in {cache_dir}, scrape some first.")
+        return False
+
+    identical = True
+    for kind, pages, scraper_cls, parse_name in [
+            ("book", book_pages, BookScraper, "scrape_book_from_html"),
+            ("author", author_pages, AuthorScraper, "scrape_author_from_html")]:
+        if not pages:
+            continue
+        timings, outputs = {}, {}
+        for parser in ("soup", "xpath"):
+            parse = getattr(scraper_cls(fetcher, parser=parser), parse_name)
+            timings[parser], outputs[parser] = time_engine(parse, pages, repeat)
+        for page, soup_dict, xpath_dict in zip(pages, outputs["soup"], outputs["xpath"]):
+            if soup_dict != xpath_dict:
+                identical = False
+                print(f"MISMATCH on {page[0]}:\n  soup:  {soup_dict}\n  xpath: {xpath_dict}")
+        per_page = {parser: 1000 * t / (repeat * len(pages)) for parser, t in timings.items()}
+        print(f"{len(pages)} {kind} pages: soup {per_page['soup']:.2f} ms/page, "
+              f"xpath {per_page['xpath']:.2f} ms/page, "
+              f"speedup x{timings['soup'] / timings['xpath']:.1f}")
+    print("Results identical." if identical else "Results differ!")
+    return identical
+
+
+if __name__ == "__main__":
+    CACHE = sys.argv[1] if len(sys.argv) > 1 else CACHE_DIR
+    REPEAT = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    sys.exit(0 if benchmark(CACHE, REPEAT) else 1)
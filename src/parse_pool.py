@@ -0,0 +1,49 @@
+"""
+Process pool running the scrapers' parsers.
+Parsing html is CPU-bound and holds the GIL, so the crawl engine ships
+raw pages to these worker processes and only gets plain dicts back.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from book_scraper import BookScraper
+from author_scraper import AuthorScraper
+
+_scrapers = {}  # (kind, parser) -> scraper of the current worker process
+
+
+def _get_scraper(scraper_cls, parser):
+    key = (scraper_cls.__name__, parser)
+    if key not in _scrapers:
+        _scrapers[key] = scraper_cls(parser=parser)
+    return _scrapers[key]
+
+
+def parse_book_page(parser, book_url, html_src):
+    """
+    Run in a worker process: BookScraper.scrape_book_from_html.
+    :param parser: extraction engine of the scraper, "soup" or "xpath"
+    :return: the book dict, or None
+    """
+    return _get_scraper(BookScraper, parser).scrape_book_from_html(book_url, html_src)
+
+
+def parse_author_pages(parser, author_url, html_src, sub_pages):
+    """
+    Run in a worker process: AuthorScraper.scrape_author_from_html.
+    sub_pages must be given, so that workers never download anything.
+    :param parser: extraction engine of the scraper, "soup" or "xpath"
+    :return: the author dict, or None
+    """
+    return _get_scraper(AuthorScraper, parser).scrape_author_from_html(author_url, html_src,
+                                                                        sub_pages)
+
+
+def make_parse_pool(processes=None):
+    """
+    :param processes: number of worker processes, defaults to the number of cores
+    :return: a ProcessPoolExecutor for the parse functions above
+    """
+    # spawn, as on Windows: forking a process running threads is not safe
+    return ProcessPoolExecutor(max_workers=processes or os.cpu_count(),
+                               mp_context=multiprocessing.get_context("spawn"))
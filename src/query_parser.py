@@ -0,0 +1,164 @@
+"""
+Tokenizer and recursive-descent parser of the search query language.
+A query combines terms "(book|author).attr : value" with AND, OR and NOT,
+in this order of precedence (NOT binds tightest), and parentheses.
+Values are:
+    "x"             exact match, "*" being a wildcard
+    NOT "x"         anything but x
+    > n, < n, >= n, <= n
+    n..m            range, bounds included
+    IN ("x", n)     any of the listed values
+    HAS "x y"       contains the whole words x and y, in any case and order
+e.g. book.rating_value : 4..4.5 AND (book.author_name : IN ("A", "B") OR book.*_count : "12")
+The parser only checks the syntax, the AST is compiled to a mongo filter
+by interpreter.compile_query.
+"""
+import re
+from collections import namedtuple
+
+# AST nodes, hashable so that they can be used as cache keys
+# op is one of "", "NOT", ">", "<", ">=", "<=", "..", "IN", "HAS";
+# value is the raw token text, a (low, high) pair for "..", a tuple for "IN"
+Term = namedtuple("Term", ["db_type", "attr", "op", "value"])
+Logic = namedtuple("Logic", ["op", "children"])  # op is "AND" or "OR"
+Not = namedtuple("Not", ["child"])
+
+_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<string>"[^"]*")
+  | (?P<field>(?:book|author)\.[\w*]+)
+  | (?P<keyword>(?:AND|OR|NOT|IN|HAS)\b)
+  | (?P<number>\d+(?:\.(?!\.)\d*)?|\.\d+)
+  | (?P<symbol>\.\.|>=|<=|[><:(),])
+""", re.VERBOSE)
+_COMPARISONS = (">", "<", ">=", "<=")
+
+
+def tokenize(query):
+    """
+    :param query: the query string
+    :return: list of (kind, text) tokens, kind being string, field, keyword, number or symbol
+    """
+    tokens = []
+    pos = 0
+    while pos < len(query):
+        match = _TOKEN_RE.match(query, pos)
+        assert match is not None, f"Unexpected character {query[pos]!r} at position {pos}."
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group()))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """One pass over the tokens, one method per grammar rule."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, kind, text=None):
+        """Consume the next token if it is of kind (and text), else return None."""
+        token_kind, token_text = self.peek()
+        if token_kind != kind or (text is not None and token_text != text):
+            return None
+        self.pos += 1
+        return token_text
+
+    def expect(self, kind, text=None):
+        token_text = self.take(kind, text)
+        assert token_text is not None,\
+            f"Expecting {text or kind} but got {self.peek()[1] or 'end of query'}."
+        return token_text
+
+    def parse_or(self):
+        """or_expr := and_expr (OR and_expr)*"""
+        return self.parse_logic("OR", self.parse_and)
+
+    def parse_and(self):
+        """and_expr := not_expr (AND not_expr)*"""
+        return self.parse_logic("AND", self.parse_not)
+
+    def parse_logic(self, op, parse_operand):
+        children = []
+        while True:
+            child = parse_operand()
+            if isinstance(child, Logic) and child.op == op:
+                children.extend(child.children)  # (a AND b) AND c is a AND b AND c
+            else:
+                children.append(child)
+            if not self.take("keyword", op):
+                break
+        return children[0] if len(children) == 1 else Logic(op, tuple(children))
+
+    def parse_not(self):
+        """not_expr := NOT not_expr | ( or_expr ) | term"""
+        if self.take("keyword", "NOT"):
+            return Not(self.parse_not())
+        if self.take("symbol", "("):
+            node = self.parse_or()
+            self.expect("symbol", ")")
+            return node
+        return self.parse_term()
+
+    def parse_term(self):
+        """term := field : value"""
+        field = self.expect("field")
+        db_type, attr = field.split(".", 1)
+        self.expect("symbol", ":")
+        if self.take("keyword", "NOT"):
+            return Term(db_type, attr, "NOT", self.expect("string"))
+        if self.take("keyword", "HAS"):
+            return Term(db_type, attr, "HAS", self.expect("string"))
+        if self.take("keyword", "IN"):
+            return Term(db_type, attr, "IN", self.parse_list())
+        for comparison in _COMPARISONS:
+            if self.take("symbol", comparison):
+                return Term(db_type, attr, comparison, self.expect("number"))
+        low = self.take("number")
+        if low is not None:
+            self.expect("symbol", "..")
+            return Term(db_type, attr, "..", (low, self.expect("number")))
+        return Term(db_type, attr, "", self.expect("string"))
+
+    def parse_list(self):
+        """list := ( literal (, literal)* )"""
+        self.expect("symbol", "(")
+        values = [self.parse_literal()]
+        while self.take("symbol", ","):
+            values.append(self.parse_literal())
+        self.expect("symbol", ")")
+        return tuple(values)
+
+    def parse_literal(self):
+        value = self.take("string") or self.take("number")
+        assert value is not None, f"Expecting a value but got {self.peek()[1] or 'end of query'}."
+        return value
+
+
+def parse(query):
+    """
+    Parse a query string into its AST.
+    This function will raise exceptions if input not parse-able.
+    :param query: the query string
+    :return: the root Term, Logic or Not node
+    """
+    parser = _Parser(tokenize(query))
+    assert parser.peek()[0] is not None, "Query is empty."
+    node = parser.parse_or()
+    assert parser.peek()[0] is None, f"Unexpected {parser.peek()[1]} in query."
+    return node
+
+
+def iter_terms(node):
+    """Every Term of the AST, left to right."""
+    if isinstance(node, Term):
+        yield node
+    elif isinstance(node, Not):
+        yield from iter_terms(node.child)
+    else:
+        for child in node.children:
+            yield from iter_terms(child)
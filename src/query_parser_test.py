@@ -0,0 +1,76 @@
+"""
+Test the tokenizer and parser of the search query language.
+"""
+import unittest
+from query_parser import parse, tokenize, iter_terms, Term, Logic, Not
+
+RATING = Term("book", "rating_value", ">", "4")
+TITLE = Term("book", "book_title", "", '"Clean Code"')
+COUNT = Term("book", "review_count", "<", "10")
+
+
+class TestQueryParser(unittest.TestCase):
+    """
+    Test the parser builds the right AST, and rejects malformed queries.
+    """
+
+    def test_tokenize(self):
+        """
+        Ranges, comparison operators and quoted values should be split correctly.
+        """
+        self.assertEqual(tokenize('book.rating_value:1..4.5 AND "a AND b"'),
+                         [("field", "book.rating_value"), ("symbol", ":"), ("number", "1"),
+                          ("symbol", ".."), ("number", "4.5"), ("keyword", "AND"),
+                          ("string", '"a AND b"')])
+        self.assertRaises(Exception, tokenize, "book.rating_value : > four")
+
+    def test_precedence(self):
+        """
+        NOT should bind tighter than AND, and AND tighter than OR.
+        """
+        query = 'book.rating_value : > 4 OR book.book_title : "Clean Code"' \
+                ' AND NOT book.review_count : < 10'
+        self.assertEqual(parse(query), Logic("OR", (RATING, Logic("AND", (TITLE, Not(COUNT))))))
+
+    def test_parentheses(self):
+        """
+        Parentheses should override precedence, and same operators be flattened.
+        """
+        query = '(book.rating_value : > 4 OR book.book_title : "Clean Code")' \
+                ' AND (book.review_count : < 10 AND book.rating_value : > 4)'
+        self.assertEqual(parse(query), Logic("AND", (Logic("OR", (RATING, TITLE)),
+                                                     COUNT, RATING)))
+
+    def test_values(self):
+        """
+        Test ranges, >= / <=, IN lists and HAS.
+        """
+        self.assertEqual(parse("author.rating_count : 10..20"),
+                         Term("author", "rating_count", "..", ("10", "20")))
+        self.assertEqual(parse("author.rating_count : >= 10"),
+                         Term("author", "rating_count", ">=", "10"))
+        self.assertEqual(parse('book.author_name : IN ("A", "B", 3)'),
+                         Term("book", "author_name", "IN", ('"A"', '"B"', "3")))
+        self.assertEqual(parse('book.book_title : HAS "clean code"'),
+                         Term("book", "book_title", "HAS", '"clean code"'))
+
+    def test_malformed(self):
+        """
+        Unbalanced parentheses, missing values and dangling operators should raise.
+        """
+        for query in ["", "(book.rating_value : > 4", "book.rating_value : > 4)",
+                      "book.rating_value : > 4 AND", "book.rating_value :",
+                      "book.rating_value : 4..", 'book.author_name : IN ()',
+                      'book.book_title : "a" "b"', 'book.book_title : > "4"']:
+            self.assertRaises(Exception, parse, query)
+
+    def test_iter_terms(self):
+        """
+        Every term should be found, left to right.
+        """
+        query = 'NOT (book.rating_value : > 4 OR book.book_title : "Clean Code")'
+        self.assertEqual(list(iter_terms(parse(query))), [RATING, TITLE])
+
+
+if __name__ == "__main__":
+    unittest.main()
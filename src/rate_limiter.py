@@ -0,0 +1,128 @@
+"""
+Per-host token-bucket rate limiter for scraping.
+Each host gets its own requests-per-second budget, which grows additively
+while the site answers normally and is cut multiplicatively (AIMD)
+as soon as it answers 429 / 503. Retry-After headers are respected.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+INITIAL_RATE = 0.5  # requests per second when a host is seen for the first time
+MIN_RATE = 0.05
+MAX_RATE = 5.0
+BURST = 2  # max number of requests that can be sent back to back
+ADDITIVE_INCREASE = 0.05  # rps gained after every successful request
+MULTIPLICATIVE_DECREASE = 0.5  # rate multiplier after a throttled request
+THROTTLE_STATUS = (429, 503)
+
+
+def parse_retry_after(value):
+    """
+    Parse the Retry-After header, which is either seconds or an HTTP date.
+    :param value: raw header value, may be None
+    :return: seconds to wait, or None if absent / not parse-able
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class _HostBucket:
+    """Token bucket state of a single host."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # no request before this time (Retry-After)
+        self.last_decrease = float("-inf")
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class HostRateLimiter:
+    """
+    Thread-safe AIMD rate limiter, shared by every scraper of the process.
+    Call acquire before each request and report the outcome afterwards
+    with on_success or on_throttled.
+    """
+
+    def __init__(self, rate=INITIAL_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE,
+                 burst=BURST, increase=ADDITIVE_INCREASE,
+                 decrease=MULTIPLICATIVE_DECREASE):
+        self.initial_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _bucket(self, url):
+        host = urlparse(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = _HostBucket(self.initial_rate, self.burst)
+        return self._hosts[host]
+
+    def current_rate(self, url):
+        """Requests per second currently allowed for the host of url."""
+        with self._lock:
+            return self._bucket(url).rate
+
+    def acquire(self, url):
+        """Block until a request to the host of url fits in its budget."""
+        while True:
+            with self._lock:
+                bucket = self._bucket(url)
+                now = time.monotonic()
+                bucket.refill(now)
+                wait = bucket.blocked_until - now
+                if wait <= 0:
+                    if bucket.tokens >= 1:
+                        bucket.tokens -= 1
+                        return
+                    wait = (1 - bucket.tokens) / bucket.rate
+            time.sleep(wait)
+
+    def on_success(self, url):
+        """Additive increase after a normal response."""
+        with self._lock:
+            bucket = self._bucket(url)
+            bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    def on_throttled(self, url, retry_after=None):
+        """
+        Multiplicative decrease after a 429 / 503 response.
+        Responses of requests that were already in flight when the first one
+        came back only extend the pause, they do not cut the rate again.
+        :param url: url of the throttled request
+        :param retry_after: seconds the host asked us to wait, if any
+        """
+        with self._lock:
+            bucket = self._bucket(url)
+            now = time.monotonic()
+            if now - bucket.last_decrease >= 1 / bucket.rate:
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+                bucket.last_decrease = now
+            pause = retry_after if retry_after is not None else 1 / bucket.rate
+            bucket.blocked_until = max(bucket.blocked_until, now + pause)
+            bucket.tokens = 0.0
+
+
+DEFAULT_RATE_LIMITER = HostRateLimiter()  # shared by all scrapers by default
@@ -0,0 +1,71 @@
+"""
+Test the AIMD behavior of the per-host rate limiter.
+"""
+import time
+import unittest
+from email.utils import formatdate
+from rate_limiter import HostRateLimiter, parse_retry_after
+
+BOOK_URL = "https://www.goodreads.com/book/show/3735293-clean-code"
+OTHER_HOST_URL = "https://www.example.com/"
+
+
+class TestRateLimiter(unittest.TestCase):
+    """
+    Test the rate limiter adapts its budget to responses of each host.
+    """
+
+    def test_additive_increase(self):
+        """
+        Every successful request should raise the rate a bit, up to max_rate.
+        """
+        limiter = HostRateLimiter(rate=1.0, max_rate=1.2, increase=0.1)
+        limiter.on_success(BOOK_URL)
+        self.assertAlmostEqual(limiter.current_rate(BOOK_URL), 1.1)
+        limiter.on_success(BOOK_URL)
+        limiter.on_success(BOOK_URL)
+        self.assertAlmostEqual(limiter.current_rate(BOOK_URL), 1.2)
+
+    def test_multiplicative_decrease(self):
+        """
+        A throttled request halves the rate once,
+        and responses of requests already in flight do not cut it again.
+        """
+        limiter = HostRateLimiter(rate=4.0, min_rate=1.5, decrease=0.5)
+        limiter.on_throttled(BOOK_URL, retry_after=0)
+        self.assertAlmostEqual(limiter.current_rate(BOOK_URL), 2.0)
+        limiter.on_throttled(BOOK_URL, retry_after=0)  # same burst of 429s
+        self.assertAlmostEqual(limiter.current_rate(BOOK_URL), 2.0)
+
+    def test_hosts_are_independent(self):
+        """
+        Throttling of one host should not slow down another one.
+        """
+        limiter = HostRateLimiter(rate=2.0)
+        limiter.on_throttled(BOOK_URL, retry_after=0)
+        self.assertAlmostEqual(limiter.current_rate(OTHER_HOST_URL), 2.0)
+
+    def test_acquire_respects_retry_after(self):
+        """
+        acquire should block until the Retry-After pause is over.
+        """
+        limiter = HostRateLimiter(rate=100.0)
+        limiter.acquire(BOOK_URL)
+        limiter.on_throttled(BOOK_URL, retry_after=0.2)
+        start = time.monotonic()
+        limiter.acquire(BOOK_URL)
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    def test_parse_retry_after(self):
+        """
+        Retry-After can be given in seconds or as an HTTP date.
+        """
+        self.assertEqual(parse_retry_after("120"), 120.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        wait = parse_retry_after(formatdate(time.time() + 60, usegmt=True))
+        self.assertTrue(55 <= wait <= 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
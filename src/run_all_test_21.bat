@@ -13,5 +13,110 @@ echo  ----  Running Interpreter Test Cases  ----
 echo.
 python interpreter_test.py
 echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Query Parser Test Cases  ----
+echo.
+python query_parser_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Cache Test Cases  ----
+echo.
+python cache_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Index Manager Test Cases  ----
+echo.
+python index_manager_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Scrape Job Test Cases  ----
+echo.
+python scrape_jobs_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Async Server Test Cases  ----
+echo.
+python async_server_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Crawl Engine Test Cases  ----
+echo.
+python crawl_engine_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Frontier Test Cases  ----
+echo.
+python frontier_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Checkpoint Log Test Cases  ----
+echo.
+python checkpoint_log_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Rate Limiter Test Cases  ----
+echo.
+python rate_limiter_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Page Cache Test Cases  ----
+echo.
+python page_cache_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Extraction Engine Test Cases  ----
+echo.
+python xpath_parser_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Bulk Writer Test Cases  ----
+echo.
+python bulk_writer_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Incremental Export Test Cases  ----
+echo.
+python incremental_export_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Mongo Manipulator Test Cases  ----
+echo.
+python mongo_manipulator_test.py
+echo %sep%
+echo. & echo. & echo. 
+echo %sep%
+echo.
+echo  ----  Running Page Fetcher Test Cases  ----
+echo.
+python page_fetcher_test.py
+echo %sep%
 echo All test finished!
 pause 
\ No newline at end of file
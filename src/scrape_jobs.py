@@ -0,0 +1,152 @@
+"""
+Background scrape jobs of the server.
+POST /api/scrape submits a job and returns its id at once, a bounded pool
+runs the crawls, and the job reports the progress of its CrawlEngine until
+it is done. Crawls run one at a time by default: they share the progress
+directory and the rate limiter of the scrapers, so more would not go faster.
+The manager holds the lock of the progress directory while it has jobs,
+so a crawl of another process (another worker, main.py) is never run over:
+submit raises ProgressLocked instead.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = 1  # crawls running at the same time
+MAX_FINISHED_JOBS = 100  # finished jobs remembered for GET /api/scrape/<id>
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = \
+    "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class ScrapeJob:
+    """One submitted crawl, updated by the worker running it."""
+
+    def __init__(self, params):
+        """
+        :param params: keyword arguments of the scrape function
+        """
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = QUEUED
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.engine = None  # the CrawlEngine, once the crawl started
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def to_dict(self):
+        """:return: json-able state and progress of the job"""
+        state = {"id": self.id, "status": self.status, "params": self.params,
+                 "error": self.error, "created": self.created,
+                 "started": self.started, "finished": self.finished}
+        if self.engine is not None:
+            state.update(self.engine.progress())
+        return state
+
+
+class JobManager:
+    """
+    Thread-safe registry of the scrape jobs and pool running them.
+    """
+
+    def __init__(self, scrape, workers=JOB_WORKERS, max_finished=MAX_FINISHED_JOBS,
+                 lock_progress=None):
+        """
+        :param scrape: the scrape function, called with the params of a job
+                       and the cancel_event, on_start keywords (see bfs_scrape.scrape_start),
+                       and the progress_lock keyword if lock_progress is given
+        :param workers: number of crawls running at the same time
+        :param max_finished: number of finished jobs remembered
+        :param lock_progress: called without arguments to take the lock of the progress
+                              directory (e.g. a ProgressLock), held while jobs are unfinished
+        """
+        self.scrape = scrape
+        self.max_finished = max_finished
+        self.lock_progress = lock_progress
+        self._held = None  # the taken lock, while jobs are unfinished
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix="scrape-job")
+        self._lock = threading.Lock()
+        self._jobs = {}  # id -> ScrapeJob, in submission order
+
+    def submit(self, params):
+        """
+        Queue a crawl.
+        :param params: keyword arguments of the scrape function
+        :return: the ScrapeJob
+        :raise ProgressLocked: if the progress directory is locked by another process
+        """
+        job = ScrapeJob(params)
+        with self._lock:
+            if self.lock_progress is not None and self._held is None:
+                self._held = self.lock_progress()
+            self._forget_finished()
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """:return: the ScrapeJob of job_id, None if unknown"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancel a job: a queued job never starts, a running crawl stops
+        fetching and ends after storing the pages in flight.
+        :return: the ScrapeJob, None if unknown
+        """
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED:
+            return job
+        job.cancel_event.set()
+        if job.future.cancel():  # still queued
+            self._finish(job, CANCELLED)
+        return job
+
+    def shutdown(self):
+        """Cancel every job and wait for the running ones."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            self.cancel(job.id)
+        self._executor.shutdown(wait=True)
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - self.max_finished + 1)]:
+            del self._jobs[job_id]
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        with self._lock:
+            if self._held is not None and \
+                    all(other.status in FINISHED for other in self._jobs.values()):
+                self._held.release()
+                self._held = None
+
+    def _attach(self, job, engine):
+        job.engine = engine
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        lock = {} if self._held is None else {"progress_lock": self._held}
+        try:
+            self.scrape(cancel_event=job.cancel_event,
+                        on_start=lambda engine: self._attach(job, engine), **lock, **job.params)
+        except SystemExit:  # e.g. no saved progress to continue from
+            self._finish(job, FAILED, "Scraping could not start, see the server log.")
+        except Exception as err:
+            self._finish(job, FAILED, f"{type(err).__name__}: {err}")
+        else:
+            self._finish(job, CANCELLED if job.cancel_event.is_set() else SUCCEEDED)
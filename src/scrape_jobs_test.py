@@ -0,0 +1,133 @@
+"""
+Test scrape jobs run in the background, report progress and can be cancelled.
+"""
+import os
+import tempfile
+import threading
+import unittest
+from checkpoint_log import ProgressLock, ProgressLocked
+from scrape_jobs import JobManager, QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED
+
+
+class FakeEngine:
+    """Stand-in of CrawlEngine, only reporting progress."""
+
+    def progress(self):
+        return {"books": 3, "authors": 1, "queue": 7, "pages": 4, "pages_per_second": 2.0}
+
+
+class FakeScrape:
+    """Scrape function blocking until released or cancelled."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+
+    def __call__(self, cancel_event, on_start, **params):
+        self.calls.append(params)
+        on_start(FakeEngine())
+        self.started.set()
+        while not self.release.is_set() and not cancel_event.is_set():
+            self.release.wait(0.01)
+        if self.error is not None:
+            raise self.error
+
+
+class TestJobManager(unittest.TestCase):
+    """
+    Unit test class wrapper for scrape job tests.
+    """
+
+    def test_job_runs_in_background(self):
+        """
+        Test submit returns at once and the job reports the engine's progress.
+        """
+        scrape = FakeScrape()
+        manager = JobManager(scrape)
+        job = manager.submit({"max_book": 5})
+        self.assertTrue(scrape.started.wait(5))
+        self.assertEqual(job.status, RUNNING)
+        self.assertEqual(manager.get(job.id).to_dict()["books"], 3)
+        scrape.release.set()
+        job.future.result(5)
+        self.assertEqual(job.status, SUCCEEDED)
+        self.assertEqual(scrape.calls, [{"max_book": 5}])
+        self.assertIsNone(manager.get("unknown"))
+        manager.shutdown()
+
+    def test_cancel_jobs(self):
+        """
+        Test cancelling a running job stops it, and a queued job never starts.
+        """
+        scrape = FakeScrape()
+        manager = JobManager(scrape)
+        running, queued = manager.submit({}), manager.submit({})
+        self.assertTrue(scrape.started.wait(5))
+        self.assertEqual(queued.status, QUEUED)
+        manager.cancel(queued.id)
+        manager.cancel(running.id)
+        running.future.result(5)
+        self.assertEqual(running.status, CANCELLED)
+        self.assertEqual(queued.status, CANCELLED)
+        self.assertEqual(len(scrape.calls), 1)
+        manager.shutdown()
+
+    def test_failed_jobs(self):
+        """
+        Test errors and sys.exit of the scrape function fail the job without killing the pool.
+        """
+        for error in (SystemExit(1), ValueError("bad url")):
+            scrape = FakeScrape(error)
+            scrape.release.set()
+            manager = JobManager(scrape)
+            job = manager.submit({})
+            job.future.result(5)
+            self.assertEqual(job.status, FAILED)
+            self.assertIsNotNone(job.error)
+            manager.shutdown()
+
+    def test_finished_jobs_are_forgotten(self):
+        """
+        Test only the last max_finished finished jobs are remembered.
+        """
+        scrape = FakeScrape()
+        scrape.release.set()
+        manager = JobManager(scrape, max_finished=2)
+        jobs = [manager.submit({}) for _ in range(3)]
+        for job in jobs:
+            job.future.result(5)
+        manager.submit({}).future.result(5)
+        self.assertIsNone(manager.get(jobs[0].id))
+        self.assertIsNone(manager.get(jobs[1].id))
+        self.assertIsNotNone(manager.get(jobs[2].id))
+        manager.shutdown()
+
+    def test_progress_lock(self):
+        """
+        Test the progress directory is locked while jobs are unfinished,
+        another manager is refused meanwhile, and the lock is handed to the scrape.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            scrape = FakeScrape()
+            manager = JobManager(scrape, lock_progress=lambda: ProgressLock(tmp_dir + os.sep))
+            other_manager = JobManager(FakeScrape(),
+                                       lock_progress=lambda: ProgressLock(tmp_dir + os.sep))
+            running, queued = manager.submit({}), manager.submit({})
+            self.assertTrue(scrape.started.wait(5))
+            self.assertIsInstance(scrape.calls[0]["progress_lock"], ProgressLock)
+            self.assertRaises(ProgressLocked, other_manager.submit, {})
+            manager.cancel(queued.id)
+            self.assertRaises(ProgressLocked, other_manager.submit, {})
+            scrape.release.set()
+            running.future.result(5)
+            job = other_manager.submit({})  # every job of manager is finished
+            other_manager.cancel(job.id)
+            job.future.result(5)
+            manager.shutdown()
+            other_manager.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
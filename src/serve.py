@@ -0,0 +1,116 @@
+"""
+Production serving of the server.py routes.
+`python server.py` runs Flask's development server: one process, and the
+debugger when FLASK_DEBUG=1. `python serve.py` hosts the same app under
+gunicorn instead: a worker process with threads, shut down gracefully on SIGTERM.
+gunicorn does not run on Windows, waitress (threads in one process) is used
+there, or wherever gunicorn is not installed.
+The state of the app lives in its process: the scrape jobs of /api/scrape
+and the lookup and search caches of cache.py. Hence one worker, never
+recycled, by default. With SERVER_WORKERS > 1, GET /api/scrape/<id> only
+finds the jobs of the worker it reaches, a second crawl is refused with 409
+while another worker crawls, and a write is unseen by the caches of the
+other workers for up to LOOKUP_CACHE_TTL / SEARCH_CACHE_TTL seconds.
+Every setting can be overridden from .env, see README.md.
+"""
+import os
+from dotenv import load_dotenv
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # e.g. on Windows
+    BaseApplication = None
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+load_dotenv()
+HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("SERVER_PORT", "5000"))
+WORKERS = int(os.getenv("SERVER_WORKERS", "1"))  # jobs and caches are per worker, see above
+THREADS = int(os.getenv("SERVER_THREADS", "8"))  # per worker, requests wait on mongo
+MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "0"))  # recycle workers after, 0 never
+MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", "100"))  # not all at once
+TIMEOUT = int(os.getenv("SERVER_TIMEOUT", "60"))  # seconds before a stuck worker is killed
+GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))  # to finish on shutdown
+
+
+def shutdown_worker():
+    """Release what the waitress process holds: cancel its scrape jobs, close its mongo clients."""
+    import server
+    from mongo_manipulator import close_mongo_clients
+    server.scrape_jobs.shutdown()
+    close_mongo_clients()
+
+
+def exit_worker(arbiter, worker):
+    """
+    gunicorn worker_exit hook: close the mongo clients of the worker.
+    Its scrape jobs are not cancelled, a worker replaced on timeout must not
+    stop a crawl no client asked to stop. A crawl still running when the
+    server stops ends with its worker, at the latest after GRACEFUL_TIMEOUT,
+    and the next scrape continues it from the checkpoint log.
+    """
+    from mongo_manipulator import close_mongo_clients
+    close_mongo_clients()
+
+
+def gunicorn_options(host=HOST, port=PORT, workers=WORKERS, threads=THREADS):
+    """:return: gunicorn settings of the server"""
+    return {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "gthread",
+        "threads": threads,
+        "max_requests": MAX_REQUESTS,
+        "max_requests_jitter": MAX_REQUESTS_JITTER,
+        "timeout": TIMEOUT,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "worker_exit": exit_worker,
+    }
+
+
+if BaseApplication is not None:
+    class GunicornServer(BaseApplication):
+        """Run a WSGI app under gunicorn with options given in code instead of the CLI."""
+
+        def __init__(self, app, options):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+
+def serve(host=HOST, port=PORT, workers=WORKERS, threads=THREADS):
+    """
+    Serve server.app until interrupted.
+    :param host: interface to listen on, "0.0.0.0" for every interface
+    :param port: port to listen on
+    :param workers: number of worker processes (gunicorn only)
+    :param threads: number of threads per worker
+    """
+    from index_manager import ensure_indexes
+    ensure_indexes()  # once, before workers are forked
+    from server import app
+    if BaseApplication is not None:
+        GunicornServer(app, gunicorn_options(host, port, workers, threads)).run()
+    elif waitress is not None:
+        print(f"gunicorn not available, serving with waitress ({threads} threads).")
+        try:
+            waitress.serve(app, host=host, port=port, threads=threads)
+        finally:
+            shutdown_worker()
+    else:
+        print("Neither gunicorn nor waitress is installed,"
+              " run `pip install gunicorn` (or waitress on Windows).")
+        exit(1)
+
+
+if __name__ == "__main__":
+    serve()
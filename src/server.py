@@ -2,18 +2,28 @@
 Backend server that accepts requests from client,
 and directly interact with remote Database.
 """
+import os
+import itertools
 import flask
-from flask import request, jsonify, abort
+from flask import request, jsonify, abort, stream_with_context
 from mongo_manipulator import connect_to_mongo
 import interpreter
+import cache
+from index_manager import ensure_indexes
+from bulk_writer import describe_upsert
 import update as updater
 import bfs_scrape as scraper
 from main_backend import PROGRESS_DIR
+from scrape_jobs import JobManager
+from checkpoint_log import ProgressLock, ProgressLocked
 from flask_cors import CORS
 
 app = flask.Flask(__name__)
-app.config["DEBUG"] = True
-cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
+app.config["DEBUG"] = os.getenv("FLASK_DEBUG", "0") == "1"  # never in production
+cors = CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor"])
+NDJSON = "application/x-ndjson"
+scrape_jobs = JobManager(scraper.scrape_start,  # crawls run in the background
+                         lock_progress=lambda: ProgressLock(PROGRESS_DIR))
 
 
 def check_json_in_body(request):
@@ -34,6 +44,67 @@ def check_json_in_body(request):
                    " non-empty JSON file in the request body!")
 
 
+def wants_ndjson():
+    """Whether the client prefers one json document per line to a json list."""
+    return request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON
+
+
+def respond_documents(documents, empty_message):
+    """
+    Send documents as a json list, or as one json document per line
+    if the client prefers it (Accept: application/x-ndjson).
+    ndjson is streamed: documents are encoded one at a time as the mongo
+    cursor yields them, instead of holding the whole result in memory.
+    raise status code 400 if there is no document.
+    :param documents: iterable of documents, e.g. a mongo cursor
+    :param empty_message: message of the 400 error
+    :return: the response
+    """
+    documents = iter(documents)
+    first = next(documents, None)  # errors and empty results must be known before streaming
+    if first is None:
+        abort(400, empty_message)
+    if not wants_ndjson():
+        return jsonify([first] + list(documents))
+
+    def generate():
+        for document in itertools.chain([first], documents):
+            yield flask.json.dumps(document) + "\n"
+    return app.response_class(stream_with_context(generate()), mimetype=NDJSON)
+
+
+def find_by_id(collection, query_id):
+    """
+    Read-through lookup of the lookup cache.
+    :return: list of the documents of collection whose _id is query_id
+    """
+    result = cache.lookups.get(collection.name, query_id)
+    if result is None:
+        version = cache.lookups.version(collection.name)  # before reading, see LookupCache
+        result = list(collection.find({"_id": query_id}))
+        if result:  # ids are looked up after being found, misses are not kept
+            cache.lookups.put(collection.name, query_id, result, version)
+    return result
+
+
+def upload_dict_list(dict_list, collection):
+    """
+    Insert or update the uploaded objects,
+    raise status code 400 listing the objects that could not be written.
+    :param dict_list: the uploaded dict, or list of dicts
+    :param collection: the target collection
+    :return: the response text
+    """
+    if isinstance(dict_list, dict):
+        dict_list = [dict_list]
+    if any(not isinstance(dic, dict) or "_id" not in dic for dic in dict_list):
+        abort(400, "Every uploaded object should have an _id.")
+    summary = updater.write_given_dict_list_to_db(dict_list, collection)
+    if summary["errors"]:
+        abort(400, describe_upsert(summary))
+    return describe_upsert(summary)
+
+
 @app.route("/api/book", methods=["GET", "POST", "PUT", "DELETE"])
 def api_book():
     """
@@ -44,12 +115,10 @@ def api_book():
     if request.method == "GET":
         try:
             query_id = request.args["_id"]
-            result = list(book_db.find({"_id": query_id}))
         except:
             abort(400, "ID not provided.")
-        if not result:  # no matching
-            abort(400, "No matching results in book database.")
-        return jsonify(result)  # invalid id will return []
+        return respond_documents(find_by_id(book_db, query_id),
+                                 "No matching results in book database.")
 
 
     elif request.method == "POST":
@@ -58,8 +127,7 @@ def api_book():
         if len(dict_list) > 1:
             abort(400, "Please send POST request"
                        " to /api/books to upload many books.")
-        updater.write_given_dict_list_to_db(dict_list, book_db)
-        return """Status Code [200] : Upload succeeded."""
+        return upload_dict_list(dict_list, book_db)
 
     elif request.method == "PUT":
         check_json_in_body(request)
@@ -78,6 +146,7 @@ def api_book():
         if update_val == {}:
             abort(400, "Empty update value.")
         book_db.update_one(update_key, {"$set": update_val})
+        cache.invalidate(book_db.name, [update_key["_id"]])
         return """Status code [200] : Update succeeded."""
 
     elif request.method == "DELETE":
@@ -88,6 +157,7 @@ def api_book():
         if not list(book_db.find({"_id": query_id})):
             abort(400, "Target ID not in book_DB.")
         book_db.delete_one({"_id": query_id})
+        cache.invalidate(book_db.name, [query_id])
         return """Status code [200] : Delete succeeded."""
 
 
@@ -105,12 +175,10 @@ def api_author():
     if request.method == "GET":
         try:
             query_id = request.args["_id"]
-            result = list(author_db.find({"_id": query_id}))
         except:
             abort(400, "ID not provided.")
-        if not result:  # no matching
-            abort(400, "No matching results in author database.")
-        return jsonify(result)
+        return respond_documents(find_by_id(author_db, query_id),
+                                 "No matching results in author database.")
 
     elif request.method == "POST":
         check_json_in_body(request)  # check json is properly passed
@@ -118,8 +186,7 @@ def api_author():
         if len(dict_list) > 1:
             abort(400, "Please send POST request"
                        " to /api/authors to upload many authors.")
-        updater.write_given_dict_list_to_db(dict_list, author_db)
-        return """Status Code [200] : Upload succeeded."""
+        return upload_dict_list(dict_list, author_db)
 
     elif request.method == "PUT":
         check_json_in_body(request)
@@ -138,6 +205,7 @@ def api_author():
         if update_val == {}:
             abort(400, "Empty update value.")
         author_db.update_one(update_key, {"$set": update_val})
+        cache.invalidate(author_db.name, [update_key["_id"]])
         return """Status code [200] : Update succeeded."""
 
     elif request.method == "DELETE":
@@ -148,6 +216,7 @@ def api_author():
         if not list(author_db.find({"_id": query_id})):
             abort(400, "Target ID not in author_DB.")
         author_db.delete_one({"_id": query_id})
+        cache.invalidate(author_db.name, [query_id])
         return """Status code [200] : Delete succeeded."""
 
     else:
@@ -165,8 +234,7 @@ def api_books():
     if len(dict_list) == 1:
         abort(400, "Please send POST request"
                    " to /api/book to upload a single book.")
-    updater.write_given_dict_list_to_db(dict_list, book_db)
-    return """Status Code [200] : Upload succeeded."""
+    return upload_dict_list(dict_list, book_db)
 
 
 @app.route('/api/authors', methods=["POST"])
@@ -180,29 +248,68 @@ def api_authors():
     if len(dict_list) == 1:
         abort(400, "Please send POST request"
                    " to /api/author to upload a single author.")
-    updater.write_given_dict_list_to_db(dict_list, author_db)
-    return """Status Code [200] : Upload succeeded."""
+    return upload_dict_list(dict_list, author_db)
 
 
 @app.route('/api/search', methods=["GET"])
 def api_search():
     """
-    Users can send GET requests to https://host/api/book?{q}
+    Users can send GET requests to https://host/api/search?{q, limit, sort, fields, cursor}
     This function handles the backend behavior to response to requests.
+    limit: max number of results, all of them if absent
+    sort: attribute to sort by, "-attr" for descending order, _id if absent and paging
+    fields: comma separated attributes to return, all of them if absent
+    cursor: the X-Next-Cursor header of the previous page, absent on the last page
     """
     try:
         query_str = request.args["q"]
     except:
         abort(400, 'Query string "q" is not'
                    ' included in request parameters')
+    limit = request.args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            abort(400, "limit should be an integer.")
     try:
-        matches = interpreter.repl_query(query_str)
+        plan = interpreter.compile_query(query_str)
     except:
         abort(400, "Input query string is not interpretable.")
-
-    if not matches:
-        abort(400, 'No matching results. Try new query!')
-    return jsonify(matches)
+    try:
+        page_query = interpreter.prepare_page(
+            plan, sort=request.args.get("sort"), fields=request.args.get("fields"),
+            limit=limit, cursor=request.args.get("cursor"))
+    except AssertionError as err:
+        abort(400, str(err))
+
+    collection_name = interpreter.collection_of(plan.db_type).name
+    key = cache.search_key(page_query)
+    cached = cache.searches.get(collection_name, key)
+    if cached is not None:
+        results, next_cursor = cached
+    elif limit is None and wants_ndjson():  # unbounded, stream it without keeping it
+        results, next_cursor = interpreter.iter_documents(
+            page_query, interpreter.open_page(plan.db_type, page_query)), None
+    else:
+        version = cache.searches.version(collection_name)
+        results, next_cursor = interpreter.finish_page(
+            page_query, list(interpreter.open_page(plan.db_type, page_query)))
+        if len(results) <= cache.SEARCH_CACHE_MAX_RESULTS:
+            cache.searches.put(collection_name, key, (results, next_cursor), version)
+    response = respond_documents(results, 'No matching results. Try new query!')
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+@app.route('/api/cache', methods=["GET"])
+def api_cache():
+    """
+    Users can send GET requests to https://host/api/cache
+    to get the size and hit rate of the caches of the server.
+    """
+    return jsonify(cache.stats())
 
 
 @app.route('/api/scrape', methods=["POST"])
@@ -210,7 +317,9 @@ def api_scrape():
     """
     Users can send POST requests to https://host/api/scrape?{max_author, max_book, start_url, new}
     This function handles the backend behavior to response to these requests.
-    :return:
+    The crawl runs in the background, follow it with GET /api/scrape/<id>.
+    :return: status code 202 with the id of the scrape job,
+             409 if another process crawls from the progress directory
     """
     check_json_in_body(request)
     try:
@@ -220,16 +329,42 @@ def api_scrape():
     except:
         abort(400, "max_book, max_author, start_url"
                    " should all be provided in the request body (JSON).")
-    scraper.scrape_start(is_new=False, max_author=max_author, max_book=max_book,
-                         start_url=start_url, progress_dir=PROGRESS_DIR)
-    return "Status Code [200]: Scrape succeeded."
+    try:
+        job = scrape_jobs.submit({"is_new": False, "max_author": max_author,
+                                  "max_book": max_book, "start_url": start_url,
+                                  "progress_dir": PROGRESS_DIR})
+    except ProgressLocked:
+        abort(409, "Another crawl is running (other server process or main.py),"
+                   " try again once it is done.")
+    response = jsonify({"id": job.id, "status": job.status})
+    response.status_code = 202
+    response.headers["Location"] = f"/api/scrape/{job.id}"
+    return response
+
+
+@app.route('/api/scrape/<job_id>', methods=["GET", "DELETE"])
+def api_scrape_job(job_id):
+    """
+    Users can send GET requests to https://host/api/scrape/<id> to follow a scrape job
+    (status, books and authors scraped, queue depth, pages per second),
+    and DELETE requests to cancel it.
+    """
+    if request.method == "GET":
+        job = scrape_jobs.get(job_id)
+    else:
+        job = scrape_jobs.cancel(job_id)
+    if job is None:
+        abort(404, "Scrape job not found.")
+    return jsonify(job.to_dict())
 
 
 def run_server():
     """
-    Run the backend server
+    Run the backend server on Flask's development server,
+    see serve.py to serve it in production.
     :return:
     """
+    ensure_indexes()
     # app.run(host="0.0.0.0")  # run on remote server
     app.run()
 
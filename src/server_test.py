@@ -1,10 +1,16 @@
 """
 Test the functionality of server.
 """
+import json
+import threading
 import unittest
+from unittest import mock
 import requests
+import server
 from mongo_manipulator import connect_to_mongo
 from update import load_json_file
+from checkpoint_log import ProgressLocked
+from scrape_jobs import JobManager, RUNNING, CANCELLED
 
 HOST = "http://127.0.0.1:5000/"
 
@@ -45,6 +51,24 @@ class TestServer(unittest.TestCase):
                                            {"rating_value": {"$lt": 3.5}}]}))
         self.assertEqual(response2.json(), expected2)
 
+    def test_client_search_ndjson(self):
+        """
+        Test server streams one json document per line when asked for ndjson.
+        :return:
+        """
+        book_db, _ = connect_to_mongo()
+        headers = {"Accept": "application/x-ndjson"}
+        response1 = requests.get(HOST + "api/book", params={"_id": "58128"}, headers=headers)
+        self.assertEqual(response1.headers["Content-Type"], "application/x-ndjson")
+        expected1 = list(book_db.find({"_id": "58128"}))
+        self.assertEqual([json.loads(line) for line in response1.iter_lines()], expected1)
+
+        query2 = "book.rating_count : > 500 AND book.rating_count : < 1000"
+        response2 = requests.get(HOST + "api/search", params={"q": query2}, headers=headers)
+        expected2 = list(book_db.find({"$and": [{"rating_count": {"$gt": 500}},
+                                           {"rating_count": {"$lt": 1000}}]}))
+        self.assertEqual([json.loads(line) for line in response2.iter_lines()], expected2)
+
     def test_server_upload_and_delete(self):
         """
         Test that server can handle upload and delete requests correctly.
@@ -83,6 +107,22 @@ class TestServer(unittest.TestCase):
         response2 = requests.get(HOST + "api/search", params={"q": "book._id > 123"})
         self.assertEqual(response2.status_code, 400)
 
+    def test_get_after_update(self):
+        """
+        Test a GET right after a PUT returns the updated document, not a cached one.
+        """
+        book_db, _ = connect_to_mongo()
+        book_url = book_db.find_one({"_id": "58128"})["book_url"]
+        try:
+            requests.get(HOST + "api/book", params={"_id": "58128"})  # now cached
+            response1 = requests.put(HOST + "api/book",
+                                     json={"_id": "58128", "book_url": "updated url"})
+            self.assertEqual(response1.status_code, 200)
+            response2 = requests.get(HOST + "api/book", params={"_id": "58128"})
+            self.assertEqual(response2.json()[0]["book_url"], "updated url")
+        finally:
+            requests.put(HOST + "api/book", json={"_id": "58128", "book_url": book_url})
+
     def test_invalid_update_value(self):
         """
         Test server can handle various bad update (PUT request) correctly.
@@ -157,5 +197,95 @@ class TestServer(unittest.TestCase):
         self.assertEqual(response2.status_code, 400)
 
 
+class FakeEngine:
+    """Stand-in of CrawlEngine, only reporting progress."""
+
+    def progress(self):
+        return {"books": 3, "authors": 1, "queue": 7, "pages": 4, "pages_per_second": 2.0}
+
+
+class FakeScrape:
+    """Scrape function crawling nothing until cancelled."""
+
+    def __init__(self):
+        self.started = threading.Event()
+
+    def __call__(self, cancel_event, on_start, **params):
+        on_start(FakeEngine())
+        self.started.set()
+        cancel_event.wait(10)
+
+
+class TestScrapeJobs(unittest.TestCase):
+    """
+    Test the scrape job routes with Flask's test client, no crawl is run.
+    """
+
+    def setUp(self):
+        self.scrape = FakeScrape()
+        self.scrape_jobs = JobManager(self.scrape)
+        patch = mock.patch.object(server, "scrape_jobs", self.scrape_jobs)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.client = server.app.test_client()
+
+    def tearDown(self):
+        self.scrape_jobs.shutdown()
+
+    def test_scrape_is_accepted(self):
+        """
+        Test a scrape request is answered with 202 and the Location of its job.
+        """
+        body = {"max_book": 1, "max_author": 1,
+                "start_url": "https://www.goodreads.com/book/show/3735293-clean-code"}
+        response = self.client.post("/api/scrape", json=body)
+        self.assertEqual(response.status_code, 202)
+        job = response.get_json()
+        self.assertEqual(set(job), {"id", "status"})
+        self.assertEqual(response.headers["Location"], f"/api/scrape/{job['id']}")
+
+    def test_follow_and_cancel_job(self):
+        """
+        Test GET returns the state and progress of a job, and DELETE cancels it.
+        """
+        job = self.scrape_jobs.submit({"max_book": 1})
+        self.assertTrue(self.scrape.started.wait(5))
+        response1 = self.client.get(f"/api/scrape/{job.id}")
+        self.assertEqual(response1.status_code, 200)
+        state = response1.get_json()
+        self.assertEqual(set(state), {"id", "status", "params", "error", "created", "started",
+                                      "finished", "books", "authors", "queue", "pages",
+                                      "pages_per_second"})
+        self.assertEqual((state["id"], state["status"], state["books"]), (job.id, RUNNING, 3))
+
+        response2 = self.client.delete(f"/api/scrape/{job.id}")
+        self.assertEqual(response2.status_code, 200)
+        job.future.result(5)
+        self.assertEqual(self.client.get(f"/api/scrape/{job.id}").get_json()["status"],
+                         CANCELLED)
+
+    def test_scrape_elsewhere(self):
+        """
+        Test a scrape is answered with 409 while another process crawls.
+        """
+        def locked_elsewhere():
+            raise ProgressLocked("../progress/ is used by another crawl.")
+        self.scrape_jobs.lock_progress = locked_elsewhere
+        body = {"max_book": 1, "max_author": 1,
+                "start_url": "https://www.goodreads.com/book/show/3735293-clean-code"}
+        response = self.client.post("/api/scrape", json=body)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("Another crawl is running", response.get_data(as_text=True))
+
+    def test_unknown_job(self):
+        """
+        Test an unknown job id is answered with 404.
+        """
+        for response in (self.client.get("/api/scrape/unknown"),
+                         self.client.delete("/api/scrape/unknown")):
+            self.assertEqual(response.status_code, 404)
+            self.assertIn("Scrape job not found.", response.get_data(as_text=True))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,13 @@
 """
 Handles the main-subcommand update.
 Takes in json file and insert/update in database.
+Large files can be streamed: records are then parsed, checked and written
+batch by batch, so memory does not grow with the size of the file.
 """
 import json
 import sys
 from mongo_manipulator import connect_to_mongo
+from bulk_writer import bulk_upsert, UPSERT_BATCH_SIZE
 
 BOOK_ATTRS = ["_id", "book_url", "book_title", "cover_url", "rating_value",
               "book_id", "rating_count", "review_count", "author_name",
@@ -13,6 +16,8 @@ AUTHOR_ATTRS = ["_id", "author_name", "author_id", "author_url",
                 "rating_count", "review_count", "rating_value", "image_url",
                 "related_authors", "author_books"]
 JSON_PATH = "../JSON/"
+CHUNK_SIZE = 1 << 16  # characters read at a time when streaming
+_DECODER = json.JSONDecoder()
 
 
 def find_missing_attrs(dictionaries, attrs):
@@ -68,22 +73,120 @@ def write_given_dict_list_to_db(dictionary_list, db):
     Helper function for insert list of dicts to target db.
     Notice any dicts that list passed to this function
     should complete the sanity check.
+    Existing objects are updated, new ones inserted, with batched bulk writes.
     :param dictionary_list: the list of dicts to be inserted
     :param db: the target db to insert
+    :return: summary {"inserted": int, "updated": int, "errors": [{"_id", "errmsg"}]}
     """
-    for dic in dictionary_list:
-        item_id = dic["_id"]
-        query_dic = {"_id": item_id}
-        if list(db.find(query_dic)):  # non empty
-            new_values = {"$set": dic}
-            db.update_one(query_dic, new_values)
-            print(f"Value of id: {item_id} Successfully updated.")
+    return bulk_upsert(db, dictionary_list)  # invalidates the caches of the server
+
+
+def iter_json_records(file, chunk_size=CHUNK_SIZE):
+    """
+    Incrementally parse the records of a json file, without loading it whole.
+    The file holds either a top level array of objects,
+    a single object, or objects separated by new lines (NDJSON).
+    :param file: a text file opened for reading
+    :param chunk_size: characters read at a time
+    :return: generator of the parsed dicts
+    :raise ValueError: if the file is not legal
+    """
+    buffer, pos, eof = "", 0, False
+    in_array = None  # unknown until the first character
+    expect_comma = False  # an array element was just parsed
+
+    def fill(size):
+        nonlocal buffer, pos, eof
+        chunk = file.read(size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    while True:
+        # skip white spaces, and the comma following an array element
+        while pos < len(buffer):
+            if buffer[pos].isspace():
+                pos += 1
+            elif expect_comma and buffer[pos] == ",":
+                expect_comma = False
+                pos += 1
+            else:
+                break
+        if pos == len(buffer):
+            if eof:
+                if in_array:
+                    raise ValueError("Unterminated json array.")
+                return
+            fill(chunk_size)
+            continue
+        if in_array is None:
+            in_array = buffer[pos] == "["
+            pos += in_array
+            continue
+        if in_array and buffer[pos] == "]":
+            return
+        if in_array and expect_comma:
+            raise ValueError(f"Expecting ',' delimiter: {buffer[pos:pos + 20]!r}")
+        try:
+            record, end = _DECODER.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill(max(chunk_size, len(buffer)))  # record incomplete, read at least as much again
             continue
-        db.insert_one(dic)  # insert new
-        print(f"Object with id: {item_id} Successfully inserted into database.")
+        if not isinstance(record, dict):
+            raise ValueError(f"Expecting an object, got {record!r}")
+        pos, expect_comma = end, in_array
+        yield record
+
+
+def stream_into_db(src_json, db_type, root=JSON_PATH, batch_size=UPSERT_BATCH_SIZE):
+    """
+    Streaming version of insert_into_db, for files too large to load at once.
+    Records are checked as they are read, the ones missing attributes are skipped
+    and reported, the others are written batch_size at a time.
+    :param src_json: the NAME json or NDJSON file, stored in the ../JSON directory.
+    :param db_type: either book or author
+    :param root: root directory of JSON file.
+    :param batch_size: records per bulk write
+    :return: summary {"inserted", "updated", "errors", "skipped"}
+    """
+    book_db, author_db = connect_to_mongo()
+    attrs_to_check = BOOK_ATTRS if db_type == "book" else AUTHOR_ATTRS
+    db_to_update = book_db if db_type == "book" else author_db
+
+    summary = {"inserted": 0, "updated": 0, "errors": [], "skipped": 0}
+    batch = []
+
+    def write_batch():
+        batch_summary = write_given_dict_list_to_db(batch, db_to_update)
+        for key in ("inserted", "updated", "errors"):
+            summary[key] += batch_summary[key]
+        batch.clear()
+
+    try:
+        with open(root + src_json, "r") as file:
+            for index, record in enumerate(iter_json_records(file)):
+                missing_attrs = find_missing_attrs([record], attrs_to_check)
+                if missing_attrs:
+                    print(f"Object #{index} with id: {record.get('_id')} skipped,"
+                          f" attributes: {missing_attrs} are missing.")
+                    summary["skipped"] += 1
+                    continue
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    write_batch()
+    except (OSError, ValueError):
+        print("Input json file is not legal!")
+        sys.exit(1)
+    if batch:
+        write_batch()
+    print(f"{summary['inserted']} objects inserted, {summary['updated']} updated,"
+          f" {len(summary['errors'])} failed, {summary['skipped']} skipped.")
+    return summary
 
 
-def insert_into_db(src_json, db_type):
+def insert_into_db(src_json, db_type, stream=False):
     """
     Safely insert the entities from json file into remote mongoDB.
     Json files are required to:
@@ -94,7 +197,11 @@ def insert_into_db(src_json, db_type):
     to be inserted into the database.
     :param src_json: the NAME json file, stored in the ../JSON directory. Do not add path!
     :param db_type: either book or author
+    :param stream: parse and write the file incrementally, see stream_into_db
     """
+    if stream:
+        stream_into_db(src_json, db_type)
+        return
     book_db, author_db = connect_to_mongo()
     attrs_to_check = BOOK_ATTRS if db_type == "book" else AUTHOR_ATTRS
     db_to_update = book_db if db_type == "book" else author_db
@@ -105,6 +212,8 @@ def insert_into_db(src_json, db_type):
     check_missing_attributes(dictionary_list, attrs_to_check)
 
     # Write into target db
-    write_given_dict_list_to_db(dictionary_list, db_to_update)
+    summary = write_given_dict_list_to_db(dictionary_list, db_to_update)
+    print(f"{summary['inserted']} objects inserted, {summary['updated']} updated,"
+          f" {len(summary['errors'])} failed.")
 
 
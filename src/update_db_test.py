@@ -1,9 +1,10 @@
 """
 Test whether update module can update info in db properly.
 """
+import io
 import json
 import unittest
-from update import insert_into_db
+from update import insert_into_db, iter_json_records
 from mongo_manipulator import connect_to_mongo
 
 JSON_PATH = "../JSON/"
@@ -143,5 +144,38 @@ class TestJsonUpdater(unittest.TestCase):
             self.assertTrue(book_db.find_one(query_key)["book_url"], true_url)
 
 
+class TestJsonStreaming(unittest.TestCase):
+    """
+    Test the incremental parsing of large json files.
+    """
+
+    def test_stream_matches_json_load(self):
+        """
+        Streaming a json array in tiny chunks should give the same records as json.load.
+        """
+        with open(JSON_PATH + "book_db.json", "r") as file:
+            expected = json.load(file)
+        with open(JSON_PATH + "book_db.json", "r") as file:
+            self.assertEqual(list(iter_json_records(file, chunk_size=7)), expected)
+
+    def test_single_object_and_ndjson(self):
+        """
+        A single object and new line separated objects should both be accepted.
+        """
+        self.assertEqual(list(iter_json_records(io.StringIO('{"_id": "1"}'))), [{"_id": "1"}])
+        ndjson = '{"_id": "1", "s": "a, ]"}\n{"_id": "2"}\n'
+        self.assertEqual(list(iter_json_records(io.StringIO(ndjson), chunk_size=3)),
+                         [{"_id": "1", "s": "a, ]"}, {"_id": "2"}])
+
+    def test_malformed_stream(self):
+        """
+        Truncated files, missing delimiters and non-object records should raise.
+        """
+        for src in ['[{"_id": "1"}, {"_id"', '[{"_id": "1"} {"_id": "2"}]', '[1, 2]',
+                    '[{"_id": "1"}']:
+            with self.assertRaises(ValueError):
+                list(iter_json_records(io.StringIO(src), chunk_size=4))
+
+
 if __name__ == "__main__":
     unittest.main()
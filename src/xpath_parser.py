@@ -0,0 +1,258 @@
+"""
+Fast-path extraction engine for BookScraper / AuthorScraper.
+Instead of building a full BeautifulSoup tree and running CSS selectors,
+the page is parsed once by lxml and only queried with precompiled XPaths.
+Every function here mirrors its BeautifulSoup counterpart in the scrapers,
+including what is printed and which attributes stay None on failure,
+so both engines return identical dicts (see parse_benchmark.py).
+"""
+import re
+from lxml import etree
+
+BASE_URL = "https://www.goodreads.com"
+_HTML_PARSER = etree.HTMLParser(encoding="utf-8")
+
+
+def _has_class(cls):
+    """XPath predicate equivalent to the CSS selector .cls"""
+    return f'contains(concat(" ", normalize-space(@class), " "), " {cls} ")'
+
+
+_STRING = etree.XPath("string()")
+# book page
+_BOOK_TITLE = etree.XPath('//*[@id="bookTitle"]')
+_RATING_VALUE = etree.XPath('//span[@itemprop="ratingValue"]')
+_COVER_IMAGE = etree.XPath('//*[@id="coverImage"]')
+_BOOK_ID = etree.XPath('//*[@id="book_id"]')
+_REVIEW_CONTROLS = etree.XPath(f'//*[@id="reviewControls"]/div[{_has_class("reviewControls--left")}'
+                               f' and {_has_class("greyText")}]')
+_AUTHOR_PROFILE = etree.XPath(f'//div[{_has_class("bookAuthorProfile__name")}]')
+_SIMILAR_BOOKS = etree.XPath(f'//div[{_has_class("bookCarousel")}]/div[{_has_class("carouselRow")}]'
+                             f'/ul/li')
+_ISBN_TEXTS = etree.XPath('//text()[. = "ISBN"]')
+_FIRST_LINK = etree.XPath('(.//a)[1]')
+# author page
+_AUTHOR_NAME = etree.XPath(f'//h1[{_has_class("authorName")}]/span')
+_AGGREGATE = f'//div[{_has_class("hreview-aggregate")}]'
+_AUTHOR_RATING = etree.XPath(f'{_AGGREGATE}/span[{_has_class("rating")}]'
+                             f'/span[{_has_class("average")}]')
+_AUTHOR_VOTES = etree.XPath(f'{_AGGREGATE}/span[{_has_class("votes")}]')
+_AUTHOR_REVIEWS = etree.XPath(f'{_AGGREGATE}/span[{_has_class("count")}]')
+_IMAGE_BY_ALT = etree.XPath('//img[@alt = $alt]')
+_LINKS_WITH_PREFIX = etree.XPath('//a[starts-with(@href, $prefix)]')
+
+
+def parse_html(html_src):
+    """
+    :param html_src: raw html, or None if the download failed
+    :return: root element of the page, None if there is nothing to parse
+    """
+    if not html_src:
+        return None
+    return etree.fromstring(html_src.encode("utf-8"), _HTML_PARSER)
+
+
+def _select(xpath, root, **variables):
+    return [] if root is None else xpath(root, **variables)
+
+
+def _text(elem):
+    """Equivalent of bs4 tag.text"""
+    return _STRING(elem)
+
+
+def _attr(elem, name):
+    """Equivalent of bs4 tag[name], raising KeyError if missing."""
+    return elem.attrib[name]
+
+
+def _contents(elem):
+    """
+    Direct children of elem in bs4 order: text nodes as str, tags as elements.
+    Comments are strings for bs4, so they are returned as their text.
+    """
+    if elem.text is not None:
+        yield elem.text
+    for child in elem:
+        yield (child.text or "") if child.tag is etree.Comment else child
+        if child.tail is not None:
+            yield child.tail
+
+
+def _next_siblings(elem):
+    """Equivalent of walking bs4 tag.nextSibling, text nodes included."""
+    if elem.tail is not None:
+        yield elem.tail
+    for sibling in elem.itersiblings():
+        yield "" if sibling.tag is etree.Comment else sibling
+        if sibling.tail is not None:
+            yield sibling.tail
+
+
+def _single_string(elem):
+    """Equivalent of bs4 tag.string: the only string inside elem, or None."""
+    contents = list(_contents(elem))
+    if len(contents) != 1:
+        return None
+    if isinstance(contents[0], str):
+        return contents[0]
+    return _single_string(contents[0])
+
+
+def _find_isbn_div(root):
+    """
+    Equivalent of bs4 find_all("div", string="ISBN")[0],
+    walking up from the "ISBN" text nodes instead of checking every div.
+    """
+    for text in _select(_ISBN_TEXTS, root):
+        elem = text.getparent() if text.is_text else text.getparent().getparent()
+        found = None
+        while elem is not None and _single_string(elem) == "ISBN":
+            if elem.tag == "div":
+                found = elem  # outer-most div comes first in document order
+            elem = elem.getparent()
+        if found is not None:
+            return found
+    raise IndexError("no ISBN div")
+
+
+def parse_book_info(scraper, book_url, html_src):
+    """
+    XPath version of BookScraper.parse_book_info.
+    :param scraper: the BookScraper, for its ISBN helpers
+    :param book_url: the source url html_src is downloaded from
+    :param html_src: raw html of the book page
+    :return: a dictionary of book attributes as required in the rubric
+    """
+    root = parse_html(html_src)
+    book_attrs = ["book_url", "book_title", "cover_url", "rating_value", "book_id",
+                  "rating_count", "review_count", "author_name", "author_url",
+                  "ISBN", "similar_book_urls"]
+    book_dict = {key: None for key in book_attrs}
+
+    try:
+        book_dict["book_url"] = book_url
+        book_dict["book_title"] = _text(_select(_BOOK_TITLE, root)[0]).strip()
+        rating_value = _text(_select(_RATING_VALUE, root)[0]).strip()
+        book_dict["rating_value"] = float(rating_value)
+        book_dict["cover_url"] = _attr(_select(_COVER_IMAGE, root)[0], "src")
+        book_dict["book_id"] = _attr(_select(_BOOK_ID, root)[0], "value")
+        for child in _contents(_select(_REVIEW_CONTROLS, root)[0]):
+            if not isinstance(child, str):
+                # like the soup engine: counts are read from text children only,
+                # and a tag holding a bare "ratings" or "reviews" string ends the page
+                if any(text in ("ratings", "reviews") for text in _contents(child)):
+                    raise ValueError("count label wrapped in a tag")
+                continue
+            if "ratings" in child:
+                rating_count = re.findall(r"([0-9,]*)", child.replace("\n", "").strip())[0]
+                book_dict["rating_count"] = int(rating_count.replace(",", ""))
+            if "reviews" in child:
+                review_count = re.findall(r"([0-9,]*)", child.replace("\n", "").strip())[0]
+                book_dict["review_count"] = int(review_count.replace(",", ""))
+
+        author_profile = _FIRST_LINK(_select(_AUTHOR_PROFILE, root)[0])[0]
+        book_dict["author_url"] = BASE_URL + _attr(author_profile, "href")
+        book_dict["author_name"] = _text(author_profile).strip()
+        book_dict["similar_book_urls"] = parse_similar_books(root)
+        isbn, _ = parse_isbn(scraper, root)
+        book_dict["ISBN"] = isbn
+    except:
+        for attr in book_attrs:
+            if book_dict[attr] is None:
+                # logging failed
+                print(f"{attr} extraction in BOOK {book_url} failed...")
+    return book_dict
+
+
+def parse_similar_books(root):
+    """XPath version of BookScraper.parse_similar_books."""
+    similar_book_urls = []
+    for li_elem in _select(_SIMILAR_BOOKS, root):
+        try:
+            similar_book_urls.append(_attr(_FIRST_LINK(li_elem)[0], "href"))
+        except:
+            continue
+    return similar_book_urls
+
+
+def parse_isbn(scraper, root):
+    """XPath version of BookScraper.parse_isbn."""
+    isbn, isbn13 = None, None
+    max_depth = 5  # ISBN number shouldn't be far from the following element!
+    try:
+        start = _find_isbn_div(root)
+        current_depth = 0
+        for elem_iter in _next_siblings(start):
+            if current_depth >= max_depth:
+                break
+            elem_text = elem_iter if isinstance(elem_iter, str) else _text(elem_iter)
+            isbn, isbn13 = scraper.extract_isbn_from_tag_text(elem_text.replace("\n", "").strip())
+            if isbn is not None or isbn13 is not None:
+                break
+            current_depth += 1
+            if current_depth == max_depth:
+                print("This ISBN of the book is not applicable.")
+    except:
+        # error in find the starting point ISBN tag
+        print("This ISBN of the book is not applicable.")
+
+    return isbn, isbn13
+
+
+def parse_author_info(scraper, author_url, html_src, sub_pages=None):
+    """
+    XPath version of AuthorScraper.parse_author_info.
+    :param scraper: the AuthorScraper, used for the sub-pages
+    :param author_url: the url of author to extract
+    :param html_src: raw html of the author page, None if download failed
+    :param sub_pages: prefetched sub-pages, see AuthorScraper.parse_author_info
+    :return: a dictionary of author attributes as required in the rubric
+    """
+    root = parse_html(html_src)
+    author_attrs = ["author_name", "author_id", "author_url", "rating_count", "review_count",
+                    "rating_value", "image_url", "related_authors", "author_books"]
+    author_dict = {attr: None for attr in author_attrs}
+    try:
+        author_dict["author_url"] = author_url  # url of author
+        author_dict["author_name"] = _text(_select(_AUTHOR_NAME, root)[0]).strip()
+        author_dict["author_id"] = re.findall(r"https://www.goodreads.com/author/show/(\d*).*",
+                                              author_url)[0]
+        author_dict["rating_value"] = float(_text(_select(_AUTHOR_RATING, root)[0]).strip())
+
+        rating_count = _text(_select(_AUTHOR_VOTES, root)[0]).strip()
+        author_dict["rating_count"] = int(rating_count.replace(",", ""))
+
+        review_count = _text(_select(_AUTHOR_REVIEWS, root)[0]).strip()
+        author_dict["review_count"] = int(review_count.replace(",", ""))
+
+        author_dict["author_books"] = scraper.extract_author_book_urls(author_url, sub_pages)
+        author_dict["related_authors"] = scraper.extract_similar_author_urls(author_url,
+                                                                             sub_pages)
+        images = _select(_IMAGE_BY_ALT, root, alt=author_dict["author_name"])
+        author_dict["image_url"] = _attr(images[0], "src")
+
+    except:
+        for attr in author_attrs:
+            if author_dict[attr] is None:
+                print(f'{attr} retrieval in AUTHOR {author_url} failed')
+
+    return author_dict
+
+
+def parse_external_urls(author_url, ex_html, href_prefix, prefix=BASE_URL):
+    """
+    XPath version of the parsing half of AuthorScraper.extract_from_external_url.
+    :param author_url: the url of the author
+    :param ex_html: raw html of the similar_author or book_list page
+    :param href_prefix: the links to collect start with this
+    :param prefix: the prefix for constructing url
+    :return: a list of similar_author or authored_book urls
+    """
+    scraped_urls = set()
+    for a_elem in _select(_LINKS_WITH_PREFIX, parse_html(ex_html), prefix=href_prefix):
+        href = _attr(a_elem, "href")
+        if href == author_url:
+            continue
+        scraped_urls.add(prefix + href)
+    return list(scraped_urls)
@@ -0,0 +1,87 @@
+"""
+Test the soup and xpath extraction engines return identical dicts on the saved pages.
+"""
+import contextlib
+import io
+import tempfile
+import unittest
+from book_scraper import BookScraper
+from author_scraper import AuthorScraper
+from parse_benchmark import benchmark, load_pages, split_pages, offline_fetcher
+
+HTML_PATH = "../HTML/"
+CLEAN_CODE_URL = "https://www.goodreads.com/book/show/3735293-clean-code"
+
+
+def parse_with_both_engines(scraper_cls, parse_name, pages):
+    """:return: a (soup dict, xpath dict) pair per page"""
+    fetcher = offline_fetcher(HTML_PATH)
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for page in pages:
+            results.append(tuple(getattr(scraper_cls(fetcher, parser=parser), parse_name)(*page)
+                                 for parser in ("soup", "xpath")))
+    return results
+
+
+class TestXpathParser(unittest.TestCase):
+    """
+    Unit test class wrapper for the extraction engine tests.
+    """
+
+    def setUp(self):
+        self.book_pages, self.author_pages = split_pages(offline_fetcher(HTML_PATH),
+                                                         load_pages(HTML_PATH))
+
+    def test_book_pages(self):
+        """
+        Test both engines extract the same book. The soup engine is the reference:
+        a count wrapped in a tag is not read by either.
+        """
+        self.assertEqual(len(self.book_pages), 2)
+        results = parse_with_both_engines(BookScraper, "scrape_book_from_html", self.book_pages)
+        for soup_dict, xpath_dict in results:
+            self.assertEqual(soup_dict, xpath_dict)
+        clean_code = dict(zip([page[0] for page in self.book_pages], results))[CLEAN_CODE_URL][1]
+        self.assertEqual((clean_code["rating_count"], clean_code["review_count"]), (None, 1201))
+        self.assertEqual(clean_code["ISBN"], "0132350882")
+        self.assertEqual(len(clean_code["similar_book_urls"]), 3)
+
+    def test_count_label_in_a_tag(self):
+        """
+        Test both engines give up on the same fields when a count label is a tag.
+        """
+        url, body = [page for page in self.book_pages if page[0] != CLEAN_CODE_URL][0]
+        body = body.replace("1,047 ratings", "1,047 <b>ratings</b>")
+        [(soup_dict, xpath_dict)] = parse_with_both_engines(BookScraper, "scrape_book_from_html",
+                                                            [(url, body)])
+        self.assertEqual(soup_dict, xpath_dict)
+        self.assertIsNone(xpath_dict["author_url"])
+
+    def test_author_pages(self):
+        """
+        Test both engines extract the same author, sub-pages included.
+        """
+        self.assertEqual(len(self.author_pages), 1)
+        [(soup_dict, xpath_dict)] = parse_with_both_engines(AuthorScraper,
+                                                            "scrape_author_from_html",
+                                                            self.author_pages)
+        self.assertEqual(sorted(soup_dict.pop("author_books")),
+                         sorted(xpath_dict.pop("author_books")))
+        self.assertEqual(sorted(soup_dict.pop("related_authors")),
+                         sorted(xpath_dict.pop("related_authors")))
+        self.assertEqual(soup_dict, xpath_dict)
+        self.assertEqual(xpath_dict["rating_count"], 39210)
+
+    def test_benchmark(self):
+        """
+        Test the benchmark passes on the saved pages, and fails without pages.
+        """
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(benchmark(HTML_PATH, repeat=1))
+            with tempfile.TemporaryDirectory() as empty_dir:
+                self.assertFalse(benchmark(empty_dir, repeat=1))
+
+
+if __name__ == "__main__":
+    unittest.main()